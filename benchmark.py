@@ -0,0 +1,276 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows: puncak RSS proses tidak dicatat
+    resource = None
+
+import numpy as np
+import pandas as pd
+
+from data_index import FilterIndex, ParticipantIndex, SearchIndex
+from data_partition import read_dapodik, read_schools, read_sudin_map, read_training
+from data_pipeline import DAPODIK_SCHEMA, SCHOOL_SCHEMA, apply_schema, clean_training_data, normalize_name
+from data_queries import RecapQueries, SnapshotQueries
+from data_rollup import ROLLUP_DIMENSIONS, ROLLUP_FREQUENCIES, TrainingRollup
+from data_store import InMemorySheetSource, SnapshotStore
+from participant_keys import ParticipantKeySet
+from record_linkage import LINK_THRESHOLD, NameLinker
+from report_export import RecommendationTable, write_csv, write_excel
+
+# ==================================================================
+# === BENCHMARK PIPELINE DASHBOARD DENGAN DATA SINTETIS ===
+# ==================================================================
+# Contoh: python benchmark.py --sizes 10000 100000 1000000 --output benchmark.json
+# Google Sheet diganti InMemorySheetSource (tanpa jaringan); setiap ukuran memakai snapshot baru di folder sementara.
+
+SHEET_NAMES = ['Tendik', 'Pendidik', 'Kejuruan']
+TARGET_KABUPATEN = ['KOTA ADM. JAKARTA UTARA', 'KAB. ADM. KEP. SERIBU']
+KABUPATEN = TARGET_KABUPATEN + ['KOTA ADM. JAKARTA PUSAT']
+JENJANG = ['SD', 'SMP', 'SMA', 'SMK', 'SLB', 'TK', 'DIKMAS']
+KECAMATAN = ['KOJA', 'CILINCING', 'TANJUNG PRIOK', 'PADEMANGAN', 'PENJARINGAN', 'KELAPA GADING',
+             'KEPULAUAN SERIBU UTARA', 'KEPULAUAN SERIBU SELATAN']
+FIRST_NAMES = ['BUDI', 'SITI', 'ANDI', 'DEWI', 'AGUS', 'RINA', 'EKO', 'SRI', 'JOKO', 'NUR', 'AHMAD', 'MUHAMMAD',
+               'PUTRI', 'RIZKY', 'DIAN', 'FITRI', 'HENDRA', 'YULI', 'WAHYU', 'LINDA']
+LAST_NAMES = ['SANTOSO', 'AMINAH', 'LESTARI', 'WIDODO', 'PRASETYO', 'WAHYUNI', 'HIDAYAT', 'SAPUTRA', 'KURNIAWAN',
+              'RAHAYU', 'SETIAWAN', 'PURNOMO', 'SIREGAR', 'SIHOTANG', 'NASUTION']
+TITLES = ['', '', '', ', S.Pd', ', S.Pd.', ', M.Pd', ', S.Kom', 'Dra. ']
+SEARCH_QUERIES = ['budi', 'SITI AMINAH', 'santso', 'sekolah 12']
+
+
+def generate_sheets(n_rows, seed=0):
+    # Data mirip aslinya: sekolah per jenjang/kecamatan, roster Dapodik per sekolah, dan peserta pelatihan
+    # yang sebagian besar diambil dari roster (dengan gelar/variasi penulisan), sisanya nama acak.
+    rng = np.random.default_rng(seed)
+    n_schools = max(200, n_rows // 200)
+    n_trainings = max(20, n_rows // 2000)
+
+    schools = [['NPSN', 'NAMA_SEKOLAH', 'TIPE', 'STATUS', 'KECAMATAN', 'KABUPATEN',
+                'KEPALA_SEKOLAH', 'TENAGA_KEPENDIDIKAN', 'GURU']]
+    npsn = [str(20100000 + i) if i % 25 else f"P99{i:05d}" for i in range(n_schools)]
+    tipe = rng.integers(0, len(JENJANG), n_schools)
+    for i in range(n_schools):
+        schools.append([
+            npsn[i], f"{JENJANG[tipe[i]]} SEKOLAH {i}", JENJANG[tipe[i]], 'NEGERI' if rng.random() < 0.4 else 'SWASTA',
+            KECAMATAN[i % len(KECAMATAN)], KABUPATEN[i % len(KABUPATEN)],
+            '1', str(rng.integers(1, 8)), str(rng.integers(8, 60)),
+        ])
+
+    # Roster Dapodik: +-25 orang per sekolah
+    roster_size = rng.integers(10, 40, n_schools)
+    roster_school = np.repeat(np.arange(n_schools), roster_size)
+    full_names = [f"{f} {l}" for f in FIRST_NAMES for l in LAST_NAMES]
+    full_names += [f"{f} {m} {l}" for f in FIRST_NAMES for m in LAST_NAMES[:8] for l in LAST_NAMES]
+    roster_names = [full_names[k] for k in rng.integers(0, len(full_names), len(roster_school))]
+    dapodik = [['NPSN', 'NAMA_LENGKAP']] + [[npsn[s], name] for s, name in zip(roster_school, roster_names)]
+
+    # Peserta pelatihan per sheet
+    dates = [f"{d:02d}/{m:02d}/{y}" for y in (2023, 2024, 2025) for m in range(1, 13) for d in range(1, 29)]
+    sheets = {'data_sekolah': schools, 'data_dapodik_name': dapodik}
+    header = ['NO', 'TANGGAL', 'NAMA_PELATIHAN', 'PELATIHAN', 'NAMA_PESERTA', 'ASAL_SEKOLAH', 'NPSN',
+              'JENJANG', 'KECAMATAN', 'STATUS_SEKOLAH']
+    per_sheet = n_rows // len(SHEET_NAMES)
+    trainings = {p: [f"Pelatihan {p} {k}" for k in range(n_trainings)] for p in SHEET_NAMES}
+    for p in SHEET_NAMES:
+        person = rng.integers(0, len(roster_school), per_sheet)
+        from_roster = rng.random(per_sheet) < 0.85
+        title = rng.integers(0, len(TITLES), per_sheet)
+        random_name = rng.integers(0, len(full_names), per_sheet)
+        training = rng.integers(0, n_trainings, per_sheet)
+        date = rng.integers(0, len(dates), per_sheet)
+        blank = rng.random(per_sheet) < 0.002
+        rows = [header]
+        for i in range(per_sheet):
+            s = roster_school[person[i]]
+            school = schools[s + 1]
+            name = roster_names[person[i]] if from_roster[i] else full_names[random_name[i]]
+            if TITLES[title[i]].startswith(','):
+                name = name.title() + TITLES[title[i]]
+            elif TITLES[title[i]]:
+                name = TITLES[title[i]] + name.title()
+            rows.append([
+                str(i + 1), dates[date[i]], trainings[p][training[i]], p, '' if blank[i] else name,
+                school[1], school[0], school[2], school[4], school[3],
+            ])
+        sheets[p] = rows
+    return sheets
+
+
+def process_peak_mb():
+    # Puncak RSS proses sejak mulai (kumulatif, tidak pernah turun): ru_maxrss dalam KB di Linux, byte di macOS
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(usage / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+# process_peak_mb = puncak RSS kumulatif setelah tahap selesai (tahap berikutnya hanya terlihat jika melewatinya).
+# Dengan trace_memory, stage_peak_mb = puncak alokasi Python/NumPy selama tahap itu saja (tracemalloc,
+# direset per tahap); memori native DuckDB/Arrow tidak terhitung dan waktu tahap ikut melambat.
+class StageTimer:
+    def __init__(self, trace_memory=False):
+        self.stages = {}
+        self.trace_memory = trace_memory
+
+    def run(self, name, func, rows=None):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result = func()
+        self.stages[name] = {
+            'seconds': round(time.perf_counter() - start, 4),
+            'rows': rows if rows is not None else (len(result) if hasattr(result, '__len__') else None),
+        }
+        peak = process_peak_mb()
+        if peak is not None:
+            self.stages[name]['process_peak_mb'] = peak
+        if self.trace_memory:
+            self.stages[name]['stage_peak_mb'] = round((tracemalloc.get_traced_memory()[1] - base) / 2 ** 20, 1)
+        return result
+
+
+def run_benchmark(n_rows, seed=0, n_schools_sampled=50, trace_memory=False):
+    timer = StageTimer(trace_memory)
+    sheets = timer.run('generate', lambda: generate_sheets(n_rows, seed), rows=n_rows)
+    source = InMemorySheetSource(sheets)
+    del sheets
+
+    with tempfile.TemporaryDirectory() as root:
+        store = SnapshotStore(source, root=os.path.join(root, 'snapshot'))
+        names = SHEET_NAMES + ['data_sekolah', 'data_dapodik_name']
+        timer.run('sync_snapshot', lambda: store.sync_many(names), rows=n_rows)
+
+        # --- Pembersihan & dedup (ParticipantKeySet + clean_training_data), hanya partisi Sudin TARGET_KABUPATEN ---
+        sudin_map = timer.run('sudin_map', lambda: read_sudin_map(store))
+
+        def clean():
+            keys = ParticipantKeySet(os.path.join(root, 'keys'))
+            return clean_training_data(*read_training(store, SHEET_NAMES, keys, sudin_map, TARGET_KABUPATEN))
+        df, _, _ = timer.run('clean_dedup', clean, rows=n_rows)
+
+        df_sekolah = read_schools(store, TARGET_KABUPATEN)
+        df_sekolah['TIPE'] = df_sekolah['TIPE'].replace('', pd.NA).replace('DIKMAS', 'PKBM')
+        df_sekolah = apply_schema(df_sekolah.dropna(subset=['TIPE']), SCHOOL_SCHEMA)
+        df_dapodik = apply_schema(read_dapodik(store, sudin_map, TARGET_KABUPATEN), DAPODIK_SCHEMA)
+        df_dapodik['NAMA_CLEAN'] = normalize_name(df_dapodik['NAMA_LENGKAP'])
+
+        # --- Tab 1: filter, pencarian, satu halaman tabel ---
+        filter_index = timer.run('tab1_filter_index', lambda: FilterIndex(
+            df, ['JENJANG', 'KECAMATAN', 'NAMA_PELATIHAN', 'PELATIHAN', 'STATUS_SEKOLAH']), rows=len(df))
+        search_indexes = timer.run('tab1_search_index', lambda: (
+            SearchIndex(df['NAMA_PESERTA']), SearchIndex(df['ASAL_SEKOLAH'])), rows=len(df))
+
+        def tab1():
+            rows = filter_index.select(
+                {'JENJANG': ['SD', 'SMP'], 'PELATIHAN': ['Pendidik']},
+                (pd.Timestamp('2024-01-01'), pd.Timestamp('2024-12-31'))
+            )
+            for query in SEARCH_QUERIES:
+                hits = np.concatenate([index.search(query) for index in search_indexes])
+                hits = hits[np.isin(hits, rows)]
+                df.iloc[hits[:20]]
+            return rows
+        timer.run('tab1_filter_search_page', tab1)
+
+        # --- Rekap Pencapaian (query SQL DuckDB di atas snapshot, sama seperti dashboard) ---
+        queries = timer.run('query_engine', lambda: SnapshotQueries(
+            store, SHEET_NAMES, ParticipantKeySet(os.path.join(root, 'keys')), scope=TARGET_KABUPATEN))
+        recap = timer.run('rekap_cube', lambda: RecapQueries(queries, TARGET_KABUPATEN), rows=len(df))
+
+        def rekap():
+            for pelatihan in SHEET_NAMES:
+                for statuses in ([], ['NEGERI']):
+                    recap.summary(pelatihan, statuses)
+                    for jenjang in recap.jenjang_for(pelatihan):
+                        recap.missing_schools(pelatihan, statuses, jenjang)
+            return recap.cube
+        timer.run('rekap_slices', rekap)
+
+        # --- Tren per tanggal (rollup harian/mingguan/bulanan, lalu irisan per grafik) ---
+        trends = timer.run('trend_rollup', lambda: TrainingRollup().update(
+            store, SHEET_NAMES, ParticipantKeySet(os.path.join(root, 'keys')), sudin_map, 0, TARGET_KABUPATEN), rows=len(df))
+
+        def trend_charts():
+            for frequency in ROLLUP_FREQUENCIES:
+                for dimension in ROLLUP_DIMENSIONS:
+                    for pelatihan in SHEET_NAMES:
+                        trends.series(frequency, dimension, pelatihan)
+            return trends.points
+        timer.run('trend_slices', trend_charts)
+
+        # --- Rekomendasi per sekolah ---
+        participant_index = timer.run('participant_index', lambda: ParticipantIndex(df), rows=len(df))
+        name_linker = timer.run('name_linkage', lambda: NameLinker(
+            participant_index, df_dapodik['NPSN_ID'], df_dapodik['NAMA_CLEAN']), rows=len(df_dapodik))
+        reco_table = timer.run('reco_table', lambda: RecommendationTable(
+            df_dapodik, df_sekolah, name_linker, participant_index), rows=len(df_dapodik))
+
+        def per_school():
+            school_ids = df_sekolah['NPSN_ID'].dropna().unique()[:n_schools_sampled]
+            for school_id in school_ids:
+                reco_table.school(school_id, LINK_THRESHOLD)
+            return school_ids
+        timer.run('reco_per_school', per_school)
+
+        # --- Export laporan ---
+        report = timer.run('export_build', lambda: reco_table.report(LINK_THRESHOLD))
+        export_dir = os.path.join(root, 'exports')
+        os.makedirs(export_dir)
+        timer.run('export_xlsx', lambda: write_excel(report, os.path.join(export_dir, 'r.xlsx'), 'Data') or report)
+        timer.run('export_csv', lambda: write_csv(report, os.path.join(export_dir, 'r.csv')) or report)
+
+    return {
+        'rows': n_rows, 'clean_rows': len(df), 'schools': len(df_sekolah), 'dapodik_rows': len(df_dapodik),
+        'total_seconds': round(sum(s['seconds'] for name, s in timer.stages.items() if name != 'generate'), 4),
+        'stages': timer.stages,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline dashboard dengan data sintetis")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="catat puncak alokasi per tahap (tracemalloc, memperlambat waktu tahap)")
+    args = parser.parse_args()
+    if args.trace_memory:
+        tracemalloc.start()
+
+    results = {
+        'revision': git_revision(),
+        'timestamp': pd.Timestamp.now(tz='Asia/Jakarta').isoformat(),
+        'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+        'seed': args.seed, 'trace_memory': args.trace_memory,
+        'runs': [],
+    }
+    for n_rows in args.sizes:
+        run = run_benchmark(n_rows, seed=args.seed, trace_memory=args.trace_memory)
+        results['runs'].append(run)
+        print(f"{n_rows:>9,} baris: {run['total_seconds']:.2f} s  "
+              + ", ".join(f"{name}={s['seconds']:.2f}" for name, s in run['stages'].items()), flush=True)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Hasil disimpan di {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,25 @@
 import streamlit as st
 import pandas as pd
-import gspread
-import json
-import io  # Diperlukan untuk download Excel
-from google.oauth2.service_account import Credentials
+import numpy as np
+import itertools
+import os
+import plotly.express as px
 from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode
+from diagnostics import cache_miss, export_jsonl, instrumented, recent_runs, stage, stage_table, timed
+from diagnostics import run as diagnostics_run
+from data_cache import DATA_CACHE, cached
+from data_store import WRITE_SCOPES, GspreadSource, SnapshotRefresher, SnapshotStore
+from data_upload import UploadJob, UploadRowFilter, file_digest, read_upload_chunks
+from data_index import FilterIndex, ParticipantIndex, SearchIndex
+from data_partition import SUDIN_SCOPE, read_dapodik, read_schools, read_sudin_map, read_training, scope_mask
+from data_queries import RecapQueries, SnapshotQueries
+from data_rollup import ROLLUP_FREQUENCIES, TrainingRollup
+from data_pipeline import (
+    DAPODIK_SCHEMA, SCHOOL_SCHEMA, apply_schema, clean_training_data, normalize_name, npsn_id
+)
+from participant_keys import ParticipantKeySet
+from record_linkage import LINK_MIN_SCORE, LINK_THRESHOLD, NameLinker
+from report_export import EXPORT_FORMATS, RecommendationTable, export_cache_stats, get_or_create_export
 
 # --- CSS for layout and header/logo tweaks, no tall vertical spacing ---
 st.set_page_config(layout="wide") # Set the page to wide mode by default
@@ -79,6 +94,31 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Label navigasi tab -> nama tab (fungsi render & tahap di log diagnostik)
+TAB_LABELS = {
+    "📊 Data Peserta Pelatihan": 'data_peserta',
+    "📈 Rekap Pencapaian": 'rekap',
+    "💡 Rekomendasi Peserta": 'rekomendasi',
+    "📤 Upload Data Terbaru": 'upload',
+}
+
+# Widget ber-key di dalam tab. Streamlit menghapus state widget yang tidak dirender pada sebuah rerun,
+# jadi nilainya disimpan ulang setiap rerun agar filter tidak hilang saat berpindah tab.
+TAB_WIDGET_KEYS = [
+    "jenjang_filter", "kecamatan_filter", "nama_pelatihan_filter", "pelatihan_filter", "status_sekolah_filter",
+    "date_range", "search_name_input", "search_school_input", "view_mode",
+    "rekap_pelatihan_filter", "summary_status_filter",
+    "trend_frequency", "trend_breakdown", "trend_metric",
+    "link_threshold", "export_format", "reco_status_filter", "reco_kec_filter", "reco_school_select",
+]
+
+# Grafik tren di tab Rekap: pilihan rincian -> kolom rollup, pilihan ukuran -> kolom nilai
+TREND_BREAKDOWNS = {
+    "Total": 'PELATIHAN', "Semua Kategori Pelatihan": 'PELATIHAN', "Jenjang": 'JENJANG',
+    "Kecamatan": 'KECAMATAN', "Status Sekolah": 'STATUS_SEKOLAH',
+}
+TREND_METRICS = {"Peserta": 'PESERTA', "Sekolah (unique)": 'SEKOLAH'}
+
 DISDIK_LOGO_URL = "https://raw.githubusercontent.com/andrewsihotang/datas/main/disdik_jakarta.png"
 P4_LOGO_URL = "https://raw.githubusercontent.com/andrewsihotang/datas/main/p4.png"
 
@@ -90,8 +130,15 @@ if "current_page" not in st.session_state:
 # State untuk download
 if "download_ready" not in st.session_state:
     st.session_state.download_ready = False
-if "download_data" not in st.session_state:
-    st.session_state.download_data = None
+if "download_path" not in st.session_state:
+    st.session_state.download_path = None
+# Default widget diisi di sini (bukan lewat value=) karena nilainya juga disimpan ulang lewat Session State
+if "link_threshold" not in st.session_state:
+    st.session_state.link_threshold = int(LINK_THRESHOLD)
+if "date_range" not in st.session_state:
+    st.session_state.date_range = []
+if "trend_frequency" not in st.session_state:
+    st.session_state.trend_frequency = "Bulanan"
 
 
 def show_landing_page():
@@ -123,13 +170,70 @@ def reset_filters(options_dict):
     for key, default in options_dict.items():
         st.session_state[key] = default
 
+# Callback tombol: state diubah sebelum fragment dirender ulang, jadi tidak perlu st.rerun() (1 klik = 1 rerun fragment)
+def change_page(step):
+    st.session_state.current_page += step
+
+def select_participant(details):
+    st.session_state.selected_participant_details = details
+
+def close_participant_details():
+    st.session_state.pop('selected_participant_details', None)
+
+def pagination_controls(total_pages):
+    # Dipanggil dari dalam fragment hasil Data Peserta: pindah halaman hanya merender ulang fragment itu
+    prev_col, page_info_col, next_col = st.columns([1, 8, 1])
+    with prev_col:
+        st.button("⬅️ Prev", use_container_width=True, disabled=(st.session_state.current_page <= 1), on_click=change_page, args=(-1,))
+    with page_info_col:
+        st.markdown(f"<div style='text-align: center; margin-top: 5px;'>Page {st.session_state.current_page} of {total_pages}</div>", unsafe_allow_html=True)
+    with next_col:
+        st.button("Next ➡️", use_container_width=True, disabled=(st.session_state.current_page >= total_pages), on_click=change_page, args=(1,))
+
+def show_diagnostics_panel():
+    st.markdown("---")
+    with st.expander("🛠️ Diagnostik (admin)"):
+        st.write("Cache data (memori) & cache file laporan (disk):")
+        st.dataframe(pd.DataFrame([
+            {'cache': 'data', **DATA_CACHE.stats()}, {'cache': 'laporan', **export_cache_stats()}
+        ]), use_container_width=True)
+        cache_entries = DATA_CACHE.entries()
+        if cache_entries:
+            st.dataframe(pd.DataFrame(cache_entries), use_container_width=True)
+        runs = recent_runs()
+        if not runs:
+            st.info("Belum ada rerun yang tercatat.")
+            return
+        st.write("Rerun terakhir (terbaru di atas):")
+        st.dataframe(pd.DataFrame([
+            {k: v for k, v in summary.items() if k != 'stages'} for summary in reversed(runs)
+        ]), use_container_width=True)
+        stages_df = pd.DataFrame(stage_table(runs))
+        st.write("Rata-rata per tahap:")
+        st.dataframe(
+            stages_df.groupby('stage').agg(
+                panggilan=('seconds', 'size'), rata_detik=('seconds', 'mean'), maks_detik=('seconds', 'max'),
+                cache_miss=('cache', lambda c: int((c == 'miss').sum())), maks_baris=('rows', 'max'),
+            ).sort_values('maks_detik', ascending=False),
+            use_container_width=True
+        )
+        st.write("Tahap pada rerun terakhir:")
+        st.dataframe(pd.DataFrame(runs[-1]['stages']), use_container_width=True)
+        st.download_button(
+            "📥 Unduh log diagnostik (JSON Lines)", data=export_jsonl(runs),
+            file_name=f"sipadu_diagnostics_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.jsonl",
+            mime="application/x-ndjson"
+        )
+
 def main_app():
     st.markdown("<br>", unsafe_allow_html=True)
     colbtn1, colbtn2, _ = st.columns([1, 1, 8])
     with colbtn1:
-        if st.button("Refresh Data"):
-            st.cache_data.clear()
-            st.rerun()
+        # Tidak menghapus cache: refresher di latar belakang mengunduh ulang & mencocokkan seluruh sheet
+        refresh_clicked = st.button(
+            "Refresh Data",
+            help="Mengunduh ulang seluruh Google Sheet di latar belakang, termasuk baris yang diubah atau dihapus langsung di Sheet."
+        )
     with colbtn2:
         if st.button("Reset Filter"):
             filter_defaults = {
@@ -142,87 +246,210 @@ def main_app():
             reset_filters(filter_defaults)
             st.rerun()
 
-    @st.cache_data
-    def load_data_from_gsheets(json_keyfile_str, spreadsheet_id, sheet_name):
-        scopes = ['https://www.googleapis.com/auth/spreadsheets.readonly']
-        creds_dict = json.loads(json_keyfile_str)
-        creds = Credentials.from_service_account_info(creds_dict, scopes=scopes)
-        client = gspread.authorize(creds)
-        sheet = client.open_by_key(spreadsheet_id).worksheet(sheet_name)
-        data = sheet.get_all_records()
-        df = pd.DataFrame(data)
-        return df
-
-    @st.cache_data
-    def load_school_data(json_keyfile_str, spreadsheet_id):
-        df_sekolah = load_data_from_gsheets(json_keyfile_str, spreadsheet_id, 'data_sekolah')
+    @st.cache_resource
+    def get_snapshot_store(json_keyfile_str, spreadsheet_id):
+        return SnapshotStore(GspreadSource(json_keyfile_str, spreadsheet_id))
+
+    @timed('get_refresher')
+    @st.cache_resource
+    def get_refresher(json_keyfile_str, spreadsheet_id, sheet_names):
+        cache_miss()
+        # Satu thread per proses: cek modifiedTime berkala, sinkronisasi inkremental hanya jika berubah.
+        # Halaman hanya membaca `refresher.versions`, tidak pernah menunggu download dari Sheets.
+        store = get_snapshot_store(json_keyfile_str, spreadsheet_id)
+        return SnapshotRefresher(store, sheet_names)
+
+    @timed('load_sudin_map', rows=len)
+    @cached('version')
+    def load_sudin_map(json_keyfile_str, spreadsheet_id, version):
+        cache_miss()
+        # Peta NPSN -> KABUPATEN (Sudin) seluruh provinsi untuk memangkas partisi di luar SUDIN_SCOPE saat load;
+        # `version` = versi data_sekolah
+        return read_sudin_map(get_snapshot_store(json_keyfile_str, spreadsheet_id), {'data_sekolah': version})
+
+    @st.cache_data(max_entries=8)
+    def load_sheet_header(json_keyfile_str, spreadsheet_id, sheet_name, version):
+        # Hanya baris header yang dibaca (untuk validasi kolom file unggahan)
+        return get_snapshot_store(json_keyfile_str, spreadsheet_id).source.read_header(sheet_name)
+
+    @st.cache_resource
+    def get_upload_source(json_keyfile_str, spreadsheet_id):
+        return GspreadSource(json_keyfile_str, spreadsheet_id, scopes=WRITE_SCOPES)
+
+    @timed('load_school_data', rows=len)
+    @cached('version')
+    def load_school_data(json_keyfile_str, spreadsheet_id, version):
+        cache_miss()
+        # Dibaca dari snapshot lokal yang sudah disinkronkan oleh refresher, hanya sekolah di SUDIN_SCOPE
+        # (frame dipakai bersama semua sesi tanpa salinan; versi baru menggantikan versi lama)
+        df_sekolah = read_schools(get_snapshot_store(json_keyfile_str, spreadsheet_id), versions={'data_sekolah': version})
         df_sekolah.columns = [col.strip().upper() for col in df_sekolah.columns]
-        df_sekolah['TIPE'].replace('', pd.NA, inplace=True)
-        df_sekolah.dropna(subset=['TIPE'], inplace=True)
-        if 'NPSN' in df_sekolah.columns:
-            df_sekolah['NPSN'] = df_sekolah['NPSN'].astype(str)
-        if 'KECAMATAN' in df_sekolah.columns:
-            df_sekolah['KECAMATAN'] = df_sekolah['KECAMATAN'].astype(str)
-        if 'KABUPATEN' in df_sekolah.columns:
-            df_sekolah['KABUPATEN'] = df_sekolah['KABUPATEN'].astype(str)
-        return df_sekolah
-
-    @st.cache_data
-    def load_dapodik_data(json_keyfile_str, spreadsheet_id):
-        df_dapodik = load_data_from_gsheets(json_keyfile_str, spreadsheet_id, 'data_dapodik_name')
+        df_sekolah['TIPE'] = df_sekolah['TIPE'].replace('', pd.NA).replace('DIKMAS', 'PKBM')
+        df_sekolah = df_sekolah.dropna(subset=['TIPE'])
+        return apply_schema(df_sekolah, SCHOOL_SCHEMA)
+
+    @timed('load_dapodik_data', rows=len)
+    @cached('version')
+    def load_dapodik_data(json_keyfile_str, spreadsheet_id, version):
+        cache_miss()
+        # version = (versi data_dapodik_name, versi data_sekolah): peta NPSN -> Sudin menentukan baris yang dimuat
+        dapodik_version, school_version = version
+        df_dapodik = read_dapodik(
+            get_snapshot_store(json_keyfile_str, spreadsheet_id), load_sudin_map(json_keyfile_str, spreadsheet_id, school_version),
+            versions={'data_dapodik_name': dapodik_version}
+        )
         df_dapodik.columns = [col.strip().upper() for col in df_dapodik.columns]
         NAMA_KOLOM_NAMA = 'NAMA_LENGKAP' 
         if 'NPSN' not in df_dapodik.columns or NAMA_KOLOM_NAMA not in df_dapodik.columns:
             st.error(f"Sheet 'data_dapodik_name' harus memiliki kolom 'NPSN' dan '{NAMA_KOLOM_NAMA}'")
             return pd.DataFrame()
-        df_dapodik['NPSN'] = df_dapodik['NPSN'].astype(str)
         df_dapodik[NAMA_KOLOM_NAMA] = df_dapodik[NAMA_KOLOM_NAMA].astype(str).str.strip()
         df_dapodik = df_dapodik.dropna(subset=['NPSN', NAMA_KOLOM_NAMA])
+        df_dapodik = apply_schema(df_dapodik, DAPODIK_SCHEMA)
+        # Kunci pencocokan (NPSN_ID + NAMA_CLEAN) dihitung sekali di sini, bukan di setiap pemakaian
+        df_dapodik['NAMA_CLEAN'] = normalize_name(df_dapodik[NAMA_KOLOM_NAMA])
         return df_dapodik
 
+    @st.cache_resource
+    def get_participant_keys():
+        # Himpunan kunci peserta persisten (di samping snapshot), dipakai bersama pembacaan & unggahan
+        return ParticipantKeySet()
+
+    @timed('load_clean_training_data', rows=lambda r: len(r[0]))
+    @cached('data_version')
+    def load_clean_training_data(json_keyfile_str, spreadsheet_id, data_version):
+        cache_miss()
+        # Dibangun sekali per versi data dan dipakai bersama oleh semua rerun/sesi (tanpa salinan).
+        # Blank cell & duplikat dibaca dari status baris di ParticipantKeySet (hanya baris baru yang dicek).
+        # data_version berisi versi sheet pelatihan + data_sekolah (peta NPSN -> Sudin); hanya partisi SUDIN_SCOPE dimuat.
+        # Yang dibaca adalah versi snapshot kunci cache ini (sama dengan load_query_engine), bukan versi terbaru di disk.
+        versions = dict(data_version)
+        school_version = versions.pop('data_sekolah')
+        df_raw, row_keys = read_training(
+            get_snapshot_store(json_keyfile_str, spreadsheet_id), list(versions), get_participant_keys(),
+            load_sudin_map(json_keyfile_str, spreadsheet_id, school_version), versions=versions
+        )
+        return clean_training_data(df_raw, row_keys)
+
+    @st.cache_resource
+    def get_training_rollup():
+        # Satu rollup tren per proses; setiap versi data baru memperbaruinya secara inkremental
+        return TrainingRollup()
+
+    @timed('load_training_trends', rows=lambda r: r.points)
+    @cached('data_version')
+    def load_training_trends(json_keyfile_str, spreadsheet_id, data_version):
+        cache_miss()
+        # Tabel tren per hari/minggu/bulan; setelah unggahan/refresh hanya baris baru yang dibaca & periode yang
+        # tersentuh yang dihitung ulang (lihat TrainingRollup)
+        versions = dict(data_version)
+        school_version = versions.pop('data_sekolah')
+        return get_training_rollup().update(
+            get_snapshot_store(json_keyfile_str, spreadsheet_id), list(versions), get_participant_keys(),
+            load_sudin_map(json_keyfile_str, spreadsheet_id, school_version), school_version, versions=versions
+        )
+
+    @timed('load_filter_index')
+    @cached('data_version')
+    def load_filter_index(json_keyfile_str, spreadsheet_id, data_version):
+        cache_miss()
+        df, _, _ = load_clean_training_data(json_keyfile_str, spreadsheet_id, data_version)
+        return FilterIndex(df, ['JENJANG', 'KECAMATAN', 'NAMA_PELATIHAN', 'PELATIHAN', 'STATUS_SEKOLAH'])
+
+    @timed('load_search_indexes')
+    @cached('data_version')
+    def load_search_indexes(json_keyfile_str, spreadsheet_id, data_version):
+        cache_miss()
+        df, _, _ = load_clean_training_data(json_keyfile_str, spreadsheet_id, data_version)
+        return SearchIndex(df['NAMA_PESERTA']), SearchIndex(df['ASAL_SEKOLAH'])
+
+    @timed('load_participant_index', rows=lambda r: len(r.keys))
+    @cached('data_version')
+    def load_participant_index(json_keyfile_str, spreadsheet_id, data_version):
+        cache_miss()
+        df, _, _ = load_clean_training_data(json_keyfile_str, spreadsheet_id, data_version)
+        return ParticipantIndex(df)
+
+    @timed('load_name_linker', rows=lambda r: len(r.scores))
+    @cached('data_version', 'dapodik_version')
+    def load_name_linker(json_keyfile_str, spreadsheet_id, data_version, dapodik_version):
+        cache_miss()
+        # Pencocokan nama Dapodik -> id peserta (integer, sama dengan ParticipantIndex), persis lalu fuzzy per NPSN.
+        # Dihitung sekali per versi data; frekuensi di tab Rekomendasi cukup membaca counts[id].
+        df_dapodik = load_dapodik_data(json_keyfile_str, spreadsheet_id, dapodik_version)
+        participant_index = load_participant_index(json_keyfile_str, spreadsheet_id, data_version)
+        if df_dapodik.empty:
+            return NameLinker(participant_index, [], [])
+        return NameLinker(participant_index, df_dapodik['NPSN_ID'], df_dapodik['NAMA_CLEAN'])
+
+    @timed('load_query_engine')
+    @cached('data_version', 'dapodik_version')
+    def load_query_engine(json_keyfile_str, spreadsheet_id, data_version, dapodik_version):
+        cache_miss()
+        # Mesin SQL (DuckDB) atas snapshot versi kunci cache ini (bukan versi terbaru di disk): agregasi rekap &
+        # rekomendasi berjalan di luar pandas, yang kembali hanya frame hasil yang kecil
+        versions = dict(data_version)
+        versions['data_dapodik_name'] = dapodik_version[0]
+        training_sheets = [name for name in versions if name not in ('data_sekolah', 'data_dapodik_name')]
+        return SnapshotQueries(
+            get_snapshot_store(json_keyfile_str, spreadsheet_id), training_sheets, get_participant_keys(), versions=versions
+        )
+
+    @timed('load_recap_cube', rows=lambda r: len(r.cube))
+    @cached('data_version', 'dapodik_version')
+    def load_recap_cube(json_keyfile_str, spreadsheet_id, data_version, dapodik_version, target_kabupaten):
+        cache_miss()
+        # Kubus rekap dari query 'recap_cube'; daftar sekolah yang belum ikut di-query per jenjang saat ditampilkan
+        return RecapQueries(load_query_engine(json_keyfile_str, spreadsheet_id, data_version, dapodik_version), target_kabupaten)
+
+    @timed('load_recommendation_table', rows=lambda r: len(r.details))
+    @cached('data_version', 'school_version', 'dapodik_version')
+    def load_recommendation_table(json_keyfile_str, spreadsheet_id, data_version, school_version, dapodik_version):
+        cache_miss()
+        # Semua orang Dapodik untuk SEMUA sekolah (dipartisi per NPSN) + detail sekolah, dibangun sekali per versi data.
+        # Tampilan per sekolah dan laporan lengkap hanya mengiris tabel ini.
+        return RecommendationTable(
+            load_dapodik_data(json_keyfile_str, spreadsheet_id, dapodik_version),
+            load_school_data(json_keyfile_str, spreadsheet_id, school_version),
+            load_name_linker(json_keyfile_str, spreadsheet_id, data_version, dapodik_version),
+            load_participant_index(json_keyfile_str, spreadsheet_id, data_version),
+        )
+
+    @timed('load_reco_school_list', rows=len)
+    @st.cache_data(max_entries=2)
+    def load_reco_school_list(json_keyfile_str, spreadsheet_id, data_version, dapodik_version):
+        cache_miss()
+        # Daftar sekolah yang punya peserta pelatihan (untuk filter & pilihan sekolah di tab Rekomendasi)
+        queries = load_query_engine(json_keyfile_str, spreadsheet_id, data_version, dapodik_version)
+        school_list_df = queries.run('reco_school_list')
+        school_list_df['NPSN_ID'] = school_list_df['NPSN_ID'].astype('Int64')
+        return school_list_df
+
     # --- Load Data ---
     json_keyfile_str = st.secrets["GSHEET_SERVICE_ACCOUNT"]
     spreadsheet_id = '1_YeSK2zgoExnC8n6tlmoJFQDVEWZbncdBLx8S5k-ljc'
     sheet_names = ['Tendik', 'Pendidik', 'Kejuruan']
-    dfs = [load_data_from_gsheets(json_keyfile_str, spreadsheet_id, name) for name in sheet_names]
-    df = pd.concat(dfs, ignore_index=True)
-    df_sekolah_sumber = load_school_data(json_keyfile_str, spreadsheet_id)
-    df_sekolah_sumber['TIPE'] = df_sekolah_sumber['TIPE'].replace('DIKMAS', 'PKBM')
-
-    # --- Data Cleaning ---
-    df.columns = [col.strip().upper() for col in df.columns]
-    if 'STASUS_SEKOLAH' in df.columns:
-        df.rename(columns={'STASUS_SEKOLAH': 'STATUS_SEKOLAH'}, inplace=True)
-    df = df.loc[:, ~df.columns.duplicated(keep='first')]
-    
-    # ==================================================================
-    # === START: Perbaikan (Mengatasi UserWarning) ===
-    # ==================================================================
-    df['TANGGAL'] = pd.to_datetime(df['TANGGAL'], errors='coerce', dayfirst=True)
-    # ==================================================================
-    # === END: Perbaikan ===
-    # ==================================================================
-    
-    if 'NPSN' in df.columns:
-        df['NPSN'] = df['NPSN'].astype(str)
-    if 'STATUS_SEKOLAH' not in df.columns:
-        df['STATUS_SEKOLAH'] = pd.NA
-    df['JENJANG'] = df['JENJANG'].replace('DIKMAS', 'PKBM')
-    if 'NAMA_PESERTA' in df.columns:
-        df['NAMA_PESERTA'] = df['NAMA_PESERTA'].astype(str).str.strip()
+    refresher = get_refresher(json_keyfile_str, spreadsheet_id, tuple(sheet_names + ['data_sekolah', 'data_dapodik_name']))
+    if refresh_clicked:
+        refresher.request_refresh(force=True, full=True)
+        st.toast(
+            "Mengunduh ulang seluruh Google Sheet di latar belakang (baris baru, diubah, atau dihapus). "
+            "Data terbaru tampil otomatis pada interaksi berikutnya."
+        )
+    sheet_versions = refresher.versions  # snapshot versi saat ini; diganti atomik oleh refresher
+    # Versi data pelatihan & Dapodik ikut memuat versi data_sekolah: peta NPSN -> Sudin menentukan partisi yang dimuat
+    data_version = tuple((name, sheet_versions[name]) for name in sheet_names) + (('data_sekolah', sheet_versions['data_sekolah']),)
+    dapodik_version = (sheet_versions['data_dapodik_name'], sheet_versions['data_sekolah'])
+    df_sekolah_sumber = load_school_data(json_keyfile_str, spreadsheet_id, sheet_versions['data_sekolah'])
 
-    
+    # --- Data Cleaning (cached per versi data) ---
+    df, df_anomali, df_ganda = load_clean_training_data(json_keyfile_str, spreadsheet_id, data_version)
 
 # ==================================================================
     # ==================================================================
     # === START: SISTEM DETEKSI ANOMALI & DATA GANDA (EVIDENCE 5.1) ===
     # ==================================================================
-    # 1. DETEKSI & HAPUS BLANK CELL DARI SISTEM
-    kondisi_nama_kosong = (df['NAMA_PESERTA'] == '') | (df['NAMA_PESERTA'].str.lower() == 'nan') | df['NAMA_PESERTA'].isna()
-    kondisi_npsn_kosong = (df['NPSN'] == '') | (df['NPSN'].str.lower() == 'nan') | df['NPSN'].isna()
-    
-    df_anomali = df[kondisi_nama_kosong | kondisi_npsn_kosong]
-    
+    # 1. DETEKSI BLANK CELL (sudah dibuang dari df di tahap pembersihan)
     # --- UI PERINGATAN DISembunyikan SEMENTARA UNTUK PRESENTASI ---
     # Ganti 'False' menjadi 'not df_anomali.empty' untuk memunculkan peringatan lagi nanti
     if False: 
@@ -230,15 +457,8 @@ def main_app():
         st.warning("Sistem mendeteksi adanya data peserta yang dibiarkan kosong. Harap Admin segera melengkapi data pada Google Sheet.")
         with st.expander("🔍 Klik di sini untuk melihat detail data yang kosong"):
             st.dataframe(df_anomali[['TANGGAL', 'NAMA_PELATIHAN', 'NAMA_PESERTA', 'ASAL_SEKOLAH', 'NPSN']], use_container_width=True)
-            
-    # PENTING: Buang data kosong dari memori (df) agar tidak masuk ke Tab Rekomendasi
-    df = df[~kondisi_nama_kosong & ~kondisi_npsn_kosong].copy()
-
-    # 2. DETEKSI & HAPUS DATA GANDA (REDUDANSI)
-    # df sekarang sudah bersih dari blank cell, kita lanjut periksa data ganda
-    mask_ganda = df.duplicated(subset=['NAMA_PESERTA', 'NPSN', 'NAMA_PELATIHAN'], keep=False)
-    df_ganda = df[mask_ganda]
 
+    # 2. DETEKSI DATA GANDA (REDUDANSI), df hanya menyimpan 1 data per peserta & pelatihan
     # --- UI PERINGATAN DISembunyikan SEMENTARA UNTUK PRESENTASI ---
     # Ganti 'False' menjadi 'not df_ganda.empty' untuk memunculkan peringatan lagi nanti
     if False: 
@@ -247,9 +467,6 @@ def main_app():
         with st.expander("👀 Klik di sini untuk melihat detail data peserta yang ganda"):
             st.caption("Daftar di bawah ini adalah entri ganda. Sistem secara otomatis HANYA akan memproses 1 data agar tidak terjadi pemanggilan ganda.")
             st.dataframe(df_ganda[['TANGGAL', 'NAMA_PELATIHAN', 'NAMA_PESERTA', 'ASAL_SEKOLAH', 'NPSN']].sort_values(by=['NAMA_PESERTA']), use_container_width=True)
-            
-    # PENTING: Buang duplikat dari memori (df), sisakan 1 saja (keep='first')
-    df = df.drop_duplicates(subset=['NAMA_PESERTA', 'NPSN', 'NAMA_PELATIHAN'], keep='first')
     # ==================================================================
     # === END: SISTEM DETEKSI ANOMALI & DATA GANDA ===
     # ==================================================================
@@ -257,125 +474,99 @@ def main_app():
 
     
     # --- PEMBUATAN TAB ---
-    tab_data_peserta, tab_rekap, tab_rekomendasi, tab_upload = st.tabs([
-        "📊 Data Peserta Pelatihan", 
-        "📈 Rekap Pencapaian", 
-        "💡 Rekomendasi Peserta", 
-        "📤 Upload Data Terbaru"
-    ])
-
-    # --- TAB 1: DATA PESERTA PELATIHAN ---
-    with tab_data_peserta:
-        pelatihan_choice_tab1 = st.session_state.get("pelatihan_filter", [None])[0] if len(st.session_state.get("pelatihan_filter", [])) == 1 else None
-        title_map = {'Tendik': 'Data Peserta Pelatihan Tenaga Kependidikan', 'Pendidik': 'Data Peserta Pelatihan Pendidik', 'Kejuruan': 'Data Peserta Pelatihan Kejuruan'}
-        main_title = title_map.get(pelatihan_choice_tab1, 'Data Peserta Pelatihan Tenaga Kependidikan')
-        st.title(main_title)
-
-        # --- Filters ---
-        with st.container():
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                jenjang_filter = st.multiselect('JENJANG', df['JENJANG'].dropna().unique(), key="jenjang_filter")
-                kecamatan_filter = st.multiselect('KECAMATAN', df['KECAMATAN'].dropna().unique(), key="kecamatan_filter")
-            with col2:
-                nama_pelatihan_filter = st.multiselect('NAMA PELATIHAN', df['NAMA_PELATIHAN'].dropna().unique(), key="nama_pelatihan_filter")
-                pelatihan_filter = st.multiselect('PELATIHAN', df['PELATIHAN'].dropna().unique(), key="pelatihan_filter")
-            with col3:
-                status_sekolah_filter = st.multiselect('STATUS SEKOLAH', df['STATUS_SEKOLAH'].dropna().unique(), key="status_sekolah_filter")
-                date_range = st.date_input('TANGGAL', value=[], key="date_range")
-                
-        conditions = []
-        if jenjang_filter: conditions.append(df['JENJANG'].isin(jenjang_filter))
-        if kecamatan_filter: conditions.append(df['KECAMATAN'].isin(kecamatan_filter))
-        if nama_pelatihan_filter: conditions.append(df['NAMA_PELATIHAN'].isin(nama_pelatihan_filter))
-        if pelatihan_filter: conditions.append(df['PELATIHAN'].isin(pelatihan_filter))
-        if status_sekolah_filter: conditions.append(df['STATUS_SEKOLAH'].isin(status_sekolah_filter))
-        if len(date_range) == 2:
-            start_date, end_date = pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1])
-            conditions.append((df['TANGGAL'] >= start_date) & (df['TANGGAL'] <= end_date))
-        filtered_df = df[pd.concat(conditions, axis=1).all(axis=1)] if conditions else df.copy()
-
-        # --- NEW: Search Functionality ---
-        st.markdown("---")
-        search_col1, search_col2 = st.columns(2)
-        with search_col1:
-            search_name = st.text_input("Cari Nama Peserta", key="search_name_input", placeholder="Ketik nama untuk mencari...")
-        with search_col2:
-            search_school = st.text_input("Cari Asal Sekolah", key="search_school_input", placeholder="Ketik nama sekolah untuk mencari...")
+    # Navigasi memilih SATU tab; hanya fungsi tab yang aktif dijalankan pada setiap rerun
+    # (st.tabs menjalankan keempat isi tab setiap kali ada interaksi).
+    active_tab = st.radio(
+        "Menu", list(TAB_LABELS), horizontal=True, key="active_tab", label_visibility="collapsed"
+    )
+    for key in TAB_WIDGET_KEYS:
+        if key in st.session_state:
+            st.session_state[key] = st.session_state[key]  # pertahankan filter tab yang tidak tampil
 
-        search_results_df = filtered_df.copy()
-        if search_name:
-            search_results_df = search_results_df[search_results_df['NAMA_PESERTA'].str.contains(search_name, case=False, na=False)]
-        if search_school:
-            search_results_df = search_results_df[search_results_df['ASAL_SEKOLAH'].str.contains(search_school, case=False, na=False)]
+    # --- FRAGMENT: HASIL DATA PESERTA ---
+    # Prev/Next, "Lihat Detail", "Tutup Detail" & pilihan baris AgGrid hanya menjalankan ulang fungsi ini;
+    # data dibaca dari df & posisi baris hasil filter/pencarian yang sudah dihitung pada rerun penuh terakhir.
+    @st.fragment
+    @instrumented('fragment_data_peserta')
+    def participant_results(search_rows, record_count):
+        def get_page(start_index, end_index):
+            positions = search_rows[start_index:end_index] if search_rows is not None else slice(start_index, end_index)
+            return df.iloc[positions]
 
         # --- DISPLAY SECTION (CARD VIEW / TABLE VIEW) ---
-        st.write(f'Showing {len(search_results_df)} records')
-        view_mode = st.radio("Display mode:", ['Card View', 'Table View'], horizontal=True, label_visibility="collapsed")
+        st.write(f'Showing {record_count} records')
+        view_mode = st.radio("Display mode:", ['Card View', 'Table View'], horizontal=True, label_visibility="collapsed", key="view_mode")
         
         if 'last_record_count' not in st.session_state:
-            st.session_state.last_record_count = len(search_results_df)
-        if st.session_state.last_record_count != len(search_results_df):
+            st.session_state.last_record_count = record_count
+        if st.session_state.last_record_count != record_count:
             st.session_state.current_page = 1
-            st.session_state.last_record_count = len(search_results_df)
+            st.session_state.last_record_count = record_count
+
+        page_size = 8 if view_mode == 'Card View' else 20
+        total_pages = (record_count // page_size) + (1 if record_count % page_size > 0 else 0)
+        total_pages = max(1, total_pages) 
+        st.session_state.current_page = min(st.session_state.current_page, total_pages)
+        start_index = (st.session_state.current_page - 1) * page_size
+        end_index = start_index + page_size
+        paginated_df = get_page(start_index, end_index)
 
         if view_mode == 'Card View':
-            page_size = 8
-            total_pages = (len(search_results_df) // page_size) + (1 if len(search_results_df) % page_size > 0 else 0)
-            total_pages = max(1, total_pages) 
-            st.session_state.current_page = min(st.session_state.current_page, total_pages)
-            start_index = (st.session_state.current_page - 1) * page_size
-            end_index = start_index + page_size
-            paginated_df = search_results_df.iloc[start_index:end_index]
             num_columns = 4
             cols = st.columns(num_columns)
-            for index, row in paginated_df.reset_index().iterrows():
-                col_index = index % num_columns
-                with cols[col_index]:
-                    with st.container(border=True):
-                        st.markdown(f"**{row.get('NAMA_PESERTA', 'N/A')}**")
-                        school_name = str(row.get('ASAL_SEKOLAH', 'N/A'))
-                        training_name = str(row.get('NAMA_PELATIHAN', 'N/A'))
-                        st.markdown(f"<small><b>Sekolah:</b> {school_name[:25] + '...' if len(school_name) > 25 else school_name}</small>", unsafe_allow_html=True)
-                        st.markdown(f"<small><b>Pelatihan:</b> {training_name[:25] + '...' if len(training_name) > 25 else training_name}</small>", unsafe_allow_html=True)
-                        tanggal_str = pd.to_datetime(row.get('TANGGAL')).strftime('%d %b %Y') if pd.notna(row.get('TANGGAL')) else 'N/A'
-                        st.markdown(f"<small><b>Tanggal:</b> {tanggal_str}</small>", unsafe_allow_html=True)
-                        st.write("")
-                        if st.button("Lihat Detail", key=f"detail_{row['index']}", use_container_width=True):
-                            st.session_state.selected_participant_details = row.to_dict()
-                            st.rerun()
+            with stage('render_cards', rows=len(paginated_df)):
+                for index, row in paginated_df.reset_index().iterrows():
+                    col_index = index % num_columns
+                    with cols[col_index]:
+                        with st.container(border=True):
+                            st.markdown(f"**{row.get('NAMA_PESERTA', 'N/A')}**")
+                            school_name = str(row.get('ASAL_SEKOLAH', 'N/A'))
+                            training_name = str(row.get('NAMA_PELATIHAN', 'N/A'))
+                            st.markdown(f"<small><b>Sekolah:</b> {school_name[:25] + '...' if len(school_name) > 25 else school_name}</small>", unsafe_allow_html=True)
+                            st.markdown(f"<small><b>Pelatihan:</b> {training_name[:25] + '...' if len(training_name) > 25 else training_name}</small>", unsafe_allow_html=True)
+                            tanggal_str = pd.to_datetime(row.get('TANGGAL')).strftime('%d %b %Y') if pd.notna(row.get('TANGGAL')) else 'N/A'
+                            st.markdown(f"<small><b>Tanggal:</b> {tanggal_str}</small>", unsafe_allow_html=True)
+                            st.write("")
+                            st.button(
+                                "Lihat Detail", key=f"detail_{row['index']}", use_container_width=True,
+                                on_click=select_participant, args=(row.to_dict(),)
+                            )
             st.markdown("---")
             if total_pages > 1:
-                prev_col, page_info_col, next_col = st.columns([1, 8, 1])
-                with prev_col:
-                    if st.button("⬅️ Prev", use_container_width=True, disabled=(st.session_state.current_page <= 1)):
-                        st.session_state.current_page -= 1
-                        st.rerun()
-                with page_info_col:
-                    st.markdown(f"<div style='text-align: center; margin-top: 5px;'>Page {st.session_state.current_page} of {total_pages}</div>", unsafe_allow_html=True)
-                with next_col:
-                    if st.button("Next ➡️", use_container_width=True, disabled=(st.session_state.current_page >= total_pages)):
-                        st.session_state.current_page += 1
-                        st.rerun()
+                pagination_controls(total_pages)
         elif view_mode == 'Table View':
-            display_df = search_results_df.copy()
+            # Hanya halaman aktif (20 baris) yang diformat & dikirim ke AgGrid
+            display_df = paginated_df
             if "NO" in display_df.columns: display_df = display_df.drop(columns=["NO"])
             display_df = display_df.reset_index(drop=True)
-            display_df.insert(0, "NO", range(1, len(display_df) + 1))
+            display_df.insert(0, "NO", range(start_index + 1, start_index + len(display_df) + 1))
             display_df['TANGGAL'] = display_df['TANGGAL'].dt.strftime('%Y-%m-%d')
             if 'CATEGORY' in display_df.columns: display_df = display_df.drop(columns=['CATEGORY'])
-            gb = GridOptionsBuilder.from_dataframe(display_df)
-            gb.configure_pagination(paginationAutoPageSize=False, paginationPageSize=20)
-            gb.configure_default_column(groupable=True, value=True, enableRowGroup=True, aggFunc="sum", editable=False)
-            gb.configure_selection(selection_mode="single", use_checkbox=False)
-            grid_options = gb.build()
-            grid_response = AgGrid(
-                display_df, gridOptions=grid_options, update_mode=GridUpdateMode.SELECTION_CHANGED,
-                height=500, fit_columns_on_grid_load=True, reload_data=True, use_legacy_py_rendering=True
-            )
+            if 'NPSN_ID' in display_df.columns: display_df = display_df.drop(columns=['NPSN_ID'])
+            # Sort/filter bawaan AgGrid hanya berlaku untuk 20 baris yang dikirim, jadi dimatikan;
+            # penyaringan & pencarian seluruh data lewat filter dan kotak pencarian di atas.
+            if record_count:
+                st.caption(
+                    f"Rows {start_index + 1}-{start_index + len(display_df)} of {record_count}. "
+                    "Use the filters and search above to filter or find records across all pages."
+                )
+            with stage('render_aggrid', rows=len(display_df)):
+                gb = GridOptionsBuilder.from_dataframe(display_df)
+                gb.configure_default_column(
+                    groupable=True, value=True, enableRowGroup=True, aggFunc="sum", editable=False,
+                    sortable=False, filter=False, suppressMenu=True
+                )
+                gb.configure_selection(selection_mode="single", use_checkbox=False)
+                grid_options = gb.build()
+                grid_response = AgGrid(
+                    display_df, gridOptions=grid_options, update_mode=GridUpdateMode.SELECTION_CHANGED,
+                    height=500, fit_columns_on_grid_load=True, reload_data=True, use_legacy_py_rendering=True
+                )
             selected = grid_response['selected_rows']
             if selected is not None and not selected.empty:
                 st.session_state.selected_participant_details = selected.iloc[0].to_dict()
+            if total_pages > 1:
+                pagination_controls(total_pages)
 
         if 'selected_participant_details' in st.session_state and st.session_state.selected_participant_details:
             with st.container(border=True):
@@ -385,20 +576,133 @@ def main_app():
                 selected_school = selected_row.get('ASAL_SEKOLAH', 'N/A') 
                 st.markdown("### Detail Peserta")
                 st.write(f"Semua pelatihan yang diikuti oleh: **{selected_name}** dari **{selected_school}**")
-                participant_trainings = df[
-                    (df['NAMA_PESERTA'].astype(str).str.strip() == selected_name) & 
-                    (df['NPSN'].astype(str) == selected_npsn) 
-                ][['NAMA_PELATIHAN', 'TANGGAL', 'ASAL_SEKOLAH', 'NPSN']].drop_duplicates().reset_index(drop=True)
+                participant_index = load_participant_index(json_keyfile_str, spreadsheet_id, data_version)
+                participant_rows = participant_index.rows(npsn_id(selected_npsn), selected_name)
+                participant_trainings = df.iloc[participant_rows][
+                    ['NAMA_PELATIHAN', 'TANGGAL', 'ASAL_SEKOLAH', 'NPSN']
+                ].drop_duplicates().reset_index(drop=True)
                 participant_trainings['TANGGAL'] = pd.to_datetime(participant_trainings['TANGGAL']).dt.strftime('%Y-%m-%d')
                 participant_trainings.index += 1
                 st.dataframe(participant_trainings, use_container_width=True)
                 st.write(f"Jumlah pelatihan: {len(participant_trainings)}")
-                if st.button("Tutup Detail"):
-                    del st.session_state.selected_participant_details
-                    st.rerun()
+                st.button("Tutup Detail", on_click=close_participant_details)
+
+    # --- FRAGMENT: TABEL REKOMENDASI PER SEKOLAH (filter riwayat pelatihan) ---
+    @st.fragment
+    @instrumented('fragment_rekomendasi')
+    def recommendation_table(reco_df, selected_school_name, NAMA_KOLOM_NAMA_DAPODIK):
+        # 7. UI Filter Frekuensi
+        st.write(f"### Analisis Target Peserta: **{selected_school_name}**")
+        filter_frekuensi = st.radio(
+            "Filter Riwayat Pelatihan Peserta:",
+            ["Tampilkan Semua", "Belum Pernah Sama Sekali (0x)", "Pernah 1x", "Sudah Lebih dari 1x"],
+            horizontal=True
+        )
+
+        # Terapkan Filter
+        if filter_frekuensi == "Belum Pernah Sama Sekali (0x)":
+            tampil_df = reco_df[reco_df['JUMLAH_PELATIHAN'] == 0]
+        elif filter_frekuensi == "Pernah 1x":
+            tampil_df = reco_df[reco_df['JUMLAH_PELATIHAN'] == 1]
+        elif filter_frekuensi == "Sudah Lebih dari 1x":
+            tampil_df = reco_df[reco_df['JUMLAH_PELATIHAN'] > 1]
+        else:
+            tampil_df = reco_df
+
+        # Format tabel untuk ditampilkan
+        tampil_df = tampil_df[[NAMA_KOLOM_NAMA_DAPODIK, 'JUMLAH_PELATIHAN', 'STATUS_UNDANGAN']].rename(
+            columns={NAMA_KOLOM_NAMA_DAPODIK: 'Nama Peserta (Dapodik)', 'JUMLAH_PELATIHAN': 'Frekuensi Ikut'}
+        ).sort_values(by=['Frekuensi Ikut', 'Nama Peserta (Dapodik)']).reset_index(drop=True)
+        tampil_df.index += 1
+
+        st.caption(f"Menampilkan {len(tampil_df)} dari total {len(reco_df)} data Dapodik sekolah ini.")
+        st.dataframe(tampil_df, use_container_width=True, height=350)
+
+    # --- FRAGMENT: GRAFIK TREN PELATIHAN (REKAP) ---
+    # Mengganti periode/rincian/ukuran hanya menjalankan ulang grafik ini (tabel tren sudah di-rollup per versi data)
+    @st.fragment
+    @instrumented('fragment_tren')
+    def training_trend(trends, pelatihan):
+        st.write(f"### 📈 Tren Pelatihan {pelatihan} berdasarkan Tanggal")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            frequency = st.radio("Periode", list(ROLLUP_FREQUENCIES), horizontal=True, key="trend_frequency")
+        with col2:
+            breakdown = st.selectbox("Rincian", list(TREND_BREAKDOWNS), key="trend_breakdown")
+        with col3:
+            metric = st.radio("Ukuran", list(TREND_METRICS), horizontal=True, key="trend_metric")
+
+        dimension = TREND_BREAKDOWNS[breakdown]
+        series = trends.series(frequency, dimension, None if breakdown == "Semua Kategori Pelatihan" else pelatihan)
+        if series.empty:
+            st.info("Belum ada data pelatihan dengan TANGGAL yang valid.")
+            return
+        fig = px.line(
+            series, x='PERIODE', y=TREND_METRICS[metric], color=None if breakdown == "Total" else dimension,
+            markers=True, labels={'PERIODE': frequency, TREND_METRICS[metric]: metric}
+        )
+        st.plotly_chart(fig, use_container_width=True)
+
+
+    # --- TAB 1: DATA PESERTA PELATIHAN ---
+    def render_data_peserta():
+        pelatihan_choice_tab1 = st.session_state.get("pelatihan_filter", [None])[0] if len(st.session_state.get("pelatihan_filter", [])) == 1 else None
+        title_map = {'Tendik': 'Data Peserta Pelatihan Tenaga Kependidikan', 'Pendidik': 'Data Peserta Pelatihan Pendidik', 'Kejuruan': 'Data Peserta Pelatihan Kejuruan'}
+        main_title = title_map.get(pelatihan_choice_tab1, 'Data Peserta Pelatihan Tenaga Kependidikan')
+        st.title(main_title)
+
+        # --- Filters (opsi & hasil filter diambil dari indeks yang dibangun sekali per versi data) ---
+        filter_index = load_filter_index(json_keyfile_str, spreadsheet_id, data_version)
+        with st.container():
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                jenjang_filter = st.multiselect('JENJANG', filter_index.options['JENJANG'], key="jenjang_filter")
+                kecamatan_filter = st.multiselect('KECAMATAN', filter_index.options['KECAMATAN'], key="kecamatan_filter")
+            with col2:
+                nama_pelatihan_filter = st.multiselect('NAMA PELATIHAN', filter_index.options['NAMA_PELATIHAN'], key="nama_pelatihan_filter")
+                pelatihan_filter = st.multiselect('PELATIHAN', filter_index.options['PELATIHAN'], key="pelatihan_filter")
+            with col3:
+                status_sekolah_filter = st.multiselect('STATUS SEKOLAH', filter_index.options['STATUS_SEKOLAH'], key="status_sekolah_filter")
+                date_range = st.date_input('TANGGAL', key="date_range")
+                
+        selected_filters = {
+            'JENJANG': jenjang_filter, 'KECAMATAN': kecamatan_filter, 'NAMA_PELATIHAN': nama_pelatihan_filter,
+            'PELATIHAN': pelatihan_filter, 'STATUS_SEKOLAH': status_sekolah_filter
+        }
+        selected_dates = None
+        if len(date_range) == 2:
+            selected_dates = (pd.to_datetime(date_range[0]), pd.to_datetime(date_range[1]))
+        with stage('filter_select') as filter_stage:
+            filtered_rows = filter_index.select(selected_filters, selected_dates)
+            filter_stage['rows'] = len(filtered_rows) if filtered_rows is not None else len(df)
+
+        # --- NEW: Search Functionality ---
+        st.markdown("---")
+        search_col1, search_col2 = st.columns(2)
+        with search_col1:
+            search_name = st.text_input("Cari Nama Peserta", key="search_name_input", placeholder="Ketik nama untuk mencari...")
+        with search_col2:
+            search_school = st.text_input("Cari Asal Sekolah", key="search_school_input", placeholder="Ketik nama sekolah untuk mencari...")
+
+        # Pencarian memakai indeks trigram (prefix, substring & salah ketik), hasil berperingkat
+        name_index, school_index = load_search_indexes(json_keyfile_str, spreadsheet_id, data_version)
+        with stage('search') as search_stage:
+            search_rows = filtered_rows
+            for query, index in [(search_name, name_index), (search_school, school_index)]:
+                if query:
+                    matched_rows = index.search(query)
+                    if search_rows is not None:
+                        matched_rows = matched_rows[np.isin(matched_rows, search_rows)]
+                    search_rows = matched_rows
+            # Hasil disimpan sebagai posisi baris saja; hanya baris di halaman aktif yang dibentuk menjadi DataFrame
+            record_count = len(search_rows) if search_rows is not None else len(df)
+            search_stage['rows'] = record_count
+
+        # Tampilan hasil (paginasi, Card/Table View, detail peserta) dijalankan ulang sendiri sebagai fragment
+        participant_results(search_rows, record_count)
 
     # --- TAB 2: REKAP PENCAPAIAN ---
-    with tab_rekap:
+    def render_rekap():
         st.subheader("Filter untuk Rekap Pencapaian")
 
         rekap_pelatihan_choice = st.selectbox(
@@ -410,85 +714,35 @@ def main_app():
         # ==================================================================
         # === START: Perbaikan (Filter Kabupaten Hardcode + Perbaikan Logika) ===
         # ==================================================================
-        target_kabupaten_rekap = ['KOTA ADM. JAKARTA UTARA', 'KAB. ADM. KEP. SERIBU']
+        # Sudin yang direkap = SUDIN_SCOPE deployment ini (kosong = semua kabupaten di data_sekolah)
+        target_kabupaten_rekap = SUDIN_SCOPE
 
-        # 1. Pre-filter data master sekolah (TARGET)
         if 'KABUPATEN' not in df_sekolah_sumber.columns:
             st.error("Kolom 'KABUPATEN' tidak ditemukan di 'data_sekolah'. Filter Jakut/Kep. Seribu tidak dapat diterapkan.")
-            df_sekolah_sumber_rekap = df_sekolah_sumber.copy()
-        else:
-            df_sekolah_sumber_rekap = df_sekolah_sumber[
-                df_sekolah_sumber['KABUPATEN'].isin(target_kabupaten_rekap)
-            ].copy()
 
-        # 2. Dapatkan SET NPSN dari data master yang sudah difilter
-        npsn_jakut_ks = set(df_sekolah_sumber_rekap['NPSN'].astype(str))
+        # Semua angka rekap sudah dihitung sekali per versi data (query SQL recap_cube); di sini hanya diiris
+        recap_cube = load_recap_cube(
+            json_keyfile_str, spreadsheet_id, data_version, dapodik_version, tuple(target_kabupaten_rekap)
+        )
 
-        # 3. Pre-filter data PELATIHAN (df) berdasarkan SET NPSN
-        df_pelatihan_rekap = df[df['NPSN'].astype(str).isin(npsn_jakut_ks)].copy()
-        
-        # 4. Hapus filter multiselect kabupaten, sisakan status
+        # Hapus filter multiselect kabupaten, sisakan status
         summary_status_filter = st.multiselect(
             'Filter Status Sekolah (Negeri/Swasta)',
-            options=df_sekolah_sumber_rekap['STATUS'].dropna().unique(), # Opsi dari data yg sudah difilter
+            options=recap_cube.status_options, # Opsi dari data yg sudah difilter
             key="summary_status_filter"
         )
         # ==================================================================
         # === END: Perbaikan ===
         # ==================================================================
 
-        # Gunakan `df_sekolah_sumber_rekap` sebagai basis
-        filtered_school_data = df_sekolah_sumber_rekap.copy()
-        if summary_status_filter:
-            filtered_school_data = filtered_school_data[filtered_school_data['STATUS'].isin(summary_status_filter)]
-        
-        # ==================================================================
-        # === START: Perbaikan (Mengembalikan fungsi yang hilang) ===
-        # ==================================================================
-        def get_dynamic_targets(filtered_df_sekolah, pelatihan_filter_choice):
-            df_sekolah = filtered_df_sekolah.copy() 
-            if pelatihan_filter_choice != 'Pendidik':
-                df_sekolah = df_sekolah[df_sekolah['TIPE'] != 'SLB'].copy()
-            df_sekolah['KEPALA_SEKOLAH'] = pd.to_numeric(df_sekolah['KEPALA_SEKOLAH'], errors='coerce').fillna(0).astype(int)
-            df_sekolah['TENAGA_KEPENDIDIKAN'] = pd.to_numeric(df_sekolah['TENAGA_KEPENDIDIKAN'], errors='coerce').fillna(0).astype(int)
-            df_sekolah['GURU'] = pd.to_numeric(df_sekolah['GURU'], errors='coerce').fillna(0).astype(int)
-            if pelatihan_filter_choice == 'Pendidik':
-                df_sekolah['TARGET_PESERTA'] = df_sekolah['GURU']
-            else: 
-                df_sekolah['TARGET_PESERTA'] = df_sekolah['KEPALA_SEKOLAH'] + df_sekolah['TENAGA_KEPENDIDIKAN']
-            jenjang_targets = df_sekolah.groupby('TIPE')['TARGET_PESERTA'].sum().to_dict()
-            sekolah_targets = df_sekolah.groupby('TIPE').size().to_dict()
-            return jenjang_targets, sekolah_targets
-        # ==================================================================
-        # === END: Perbaikan ===
-        # ==================================================================
-        
-        jenjang_targets, sekolah_targets = get_dynamic_targets(filtered_school_data, rekap_pelatihan_choice)
-        npsn_to_show = filtered_school_data['NPSN'].astype(str).unique() # NPSN dari data yg sudah difilter
-        
-        # Gunakan `df_pelatihan_rekap` sebagai basis
-        summary_df = df_pelatihan_rekap.copy() 
-        summary_df = summary_df[summary_df['PELATIHAN'] == rekap_pelatihan_choice]
-
-        # Filter `summary_df` HANYA berdasarkan status (karena kabupaten sudah)
-        if summary_status_filter:
-            summary_df = summary_df[summary_df['NPSN'].astype(str).isin(npsn_to_show)]
-
         prefix = rekap_pelatihan_choice
-        
-        # Basis untuk `all_jenjang` sekarang adalah `df_sekolah_sumber_rekap`
-        all_jenjang_from_source = sorted(df_sekolah_sumber_rekap['TIPE'].dropna().unique())
-        
-        if rekap_pelatihan_choice == 'Pendidik':
-            all_jenjang = all_jenjang_from_source
-        else:
-            all_jenjang = [j for j in all_jenjang_from_source if j != 'SLB']
+        all_jenjang = recap_cube.jenjang_for(rekap_pelatihan_choice)
+        recap = recap_cube.summary(rekap_pelatihan_choice, summary_status_filter)
 
         summary_rows = []
         for jenjang in all_jenjang:
-            target = jenjang_targets.get(jenjang, 0)
-            df_jenjang = summary_df[summary_df['JENJANG'] == jenjang]
-            unique_count = df_jenjang.drop_duplicates(subset=['NAMA_PESERTA', 'ASAL_SEKOLAH']).shape[0]
+            target = int(recap.at[jenjang, 'TARGET_PESERTA'])
+            unique_count = int(recap.at[jenjang, 'PESERTA_UNIK'])
             
             percent = min((unique_count / target * 100), 100) if target > 0 else 0
             
@@ -509,36 +763,12 @@ def main_app():
         
         sekolah_rows = []
         missing_schools_data = {} # Menyimpan data sekolah yang ada di target tapi belum ikut
-        
-        # Tentukan nama kolom sekolah dari data master
-        NAMA_KOLOM_SEKOLAH_MASTER = 'NAMA_SEKOLAH'
-        if NAMA_KOLOM_SEKOLAH_MASTER not in filtered_school_data.columns:
-            if 'ASAL_SEKOLAH' in filtered_school_data.columns:
-                NAMA_KOLOM_SEKOLAH_MASTER = 'ASAL_SEKOLAH'
-            else:
-                NAMA_KOLOM_SEKOLAH_MASTER = 'NPSN' # Fallback jika tidak ada nama
 
         for jenjang in all_jenjang:
-            # 1. Dapatkan set NPSN dari data target (data_sekolah yang sudah difilter)
-            target_npsn_set = set(filtered_school_data[
-                (filtered_school_data['TIPE'] == jenjang) &
-                (filtered_school_data['NPSN'].notna()) &
-                (filtered_school_data['NPSN'] != '')
-            ]['NPSN'].astype(str))
-            
-            # 2. Dapatkan set NPSN dari data pelatihan (summary_df)
-            df_sekolah_jenjang = summary_df[
-                (summary_df['JENJANG'] == jenjang) &
-                (summary_df['NPSN'].notna()) &
-                (summary_df['NPSN'] != '')
-            ]
-            trained_npsn_set = set(df_sekolah_jenjang['NPSN'].astype(str))
-
-            # 3. Hitung jumlah
-            target_count = len(target_npsn_set)
-            trained_count = len(trained_npsn_set)
+            target_count = int(recap.at[jenjang, 'TARGET_SEKOLAH'])
+            trained_count = int(recap.at[jenjang, 'SEKOLAH_TERLATIH'])
             
-            # 4. Hitung persentase (tetap dibatasi 100% untuk tampilan)
+            # Hitung persentase (tetap dibatasi 100% untuk tampilan)
             percent = min((trained_count / target_count * 100), 100) if target_count > 0 else 0
             kurang = max(0, target_count - trained_count)
             
@@ -548,25 +778,9 @@ def main_app():
                 'Persentase': f"{percent:.2f} %", 'Kurang': f"{kurang:,} Sekolah"
             })
             
-            # 5. Cari perbedaan (HANYA YANG ANDA MINTA)
-            missing_npsn = target_npsn_set - trained_npsn_set
-            
-            # 6. Simpan detail sekolah yang hilang (yang Anda minta)
-            if missing_npsn:
-                # ==================================================================
-                # === START: Perubahan (Ganti kolom KABUPATEN -> STATUS) ===
-                # ==================================================================
-                cols_to_show = ['NPSN', NAMA_KOLOM_SEKOLAH_MASTER, 'KECAMATAN', 'STATUS']
-                # ==================================================================
-                # === END: Perubahan ===
-                # ==================================================================
-                
-                # Pastikan semua kolom ada di filtered_school_data
-                cols_exist = [col for col in cols_to_show if col in filtered_school_data.columns]
-                missing_df = filtered_school_data[
-                    filtered_school_data['NPSN'].isin(missing_npsn)
-                ][cols_exist].drop_duplicates(subset=['NPSN']).reset_index(drop=True)
-                missing_df.index += 1
+            # Sekolah target yang belum ikut (query SQL recap_missing_schools, anti-join per jenjang)
+            missing_df = recap_cube.missing_schools(rekap_pelatihan_choice, summary_status_filter, jenjang)
+            if not missing_df.empty:
                 missing_schools_data[jenjang] = missing_df
             
         df_summary_sekolah = pd.DataFrame(sekolah_rows).set_index('Jenjang').reindex(all_jenjang).reset_index()
@@ -599,111 +813,60 @@ def main_app():
         # ==================================================================
         # === END: Perubahan Tampilan Expander ===
         # ==================================================================
+
+        st.markdown("---")
+        training_trend(load_training_trends(json_keyfile_str, spreadsheet_id, data_version), rekap_pelatihan_choice)
         
     # --- TAB 3: REKOMENDASI PESERTA ---
-    with tab_rekomendasi:
+    def render_rekomendasi():
         st.subheader("💡 Rekomendasi Peserta")
         
         # ==================================================================
         # === BAGIAN BARU: Unduh Laporan Lengkap dengan Frekuensi ===
         # ==================================================================
+        link_threshold = st.slider(
+            "Ambang kecocokan nama Dapodik vs peserta (fuzzy)", min_value=LINK_MIN_SCORE, max_value=100,
+            key="link_threshold",
+            help="Nama yang tidak sama persis (gelar, salah ketik, urutan kata) tetap dihitung sebagai orang yang sama jika skornya di atas ambang ini."
+        )
+
         st.markdown("---")
         st.subheader("Unduh Laporan Komprehensif")
         st.write("Unduh file Excel berisi seluruh data peserta Dapodik dilengkapi dengan jumlah kehadiran pelatihannya (0x, 1x, >1x). Panitia dapat dengan mudah melakukan filter data pada file Excel yang diunduh.")
         
+        export_format = st.radio(
+            "Format file", options=list(EXPORT_FORMATS.keys()), horizontal=True, key="export_format"
+        )
+        export_ext = EXPORT_FORMATS[export_format][0]
+
         if st.button("Download Rekomendasi Peserta"):
             with st.spinner("Menggabungkan Dapodik dan menghitung frekuensi kehadiran..."):
                 try:
-                    # 1. Load data Dapodik (Master)
-                    df_dapodik_all = load_dapodik_data(json_keyfile_str, spreadsheet_id)
+                    # 1. Jumlah data Dapodik (Master) dari query; frame Dapodik hanya dimuat jika file laporan belum ada
+                    dapodik_rows = int(load_query_engine(
+                        json_keyfile_str, spreadsheet_id, data_version, dapodik_version
+                    ).run('dapodik_rows')['ROWS'].iat[0])
                     
-                    if not df_dapodik_all.empty:
-                        NAMA_KOLOM_NAMA_DAPODIK = 'NAMA_LENGKAP'
-                        
-                        # A. Siapkan Master List (Dapodik)
-                        master_list_df = df_dapodik_all[['NPSN', NAMA_KOLOM_NAMA_DAPODIK]].copy()
-                        master_list_df['NPSN'] = master_list_df['NPSN'].astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
-                        master_list_df['NAMA_CLEAN'] = master_list_df[NAMA_KOLOM_NAMA_DAPODIK].astype(str).str.strip().str.upper()
-                        master_list_df['NAMA_CLEAN'] = master_list_df['NAMA_CLEAN'].str.replace(r'[.,]', '', regex=True)
-                        
-                        # B. Siapkan Trained List & Hitung Frekuensi (Data Pelatihan)
-                        trained_list_df = df[['NPSN', 'NAMA_PESERTA']].copy()
-                        trained_list_df['NPSN'] = trained_list_df['NPSN'].astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
-                        trained_list_df['NAMA_CLEAN'] = trained_list_df['NAMA_PESERTA'].astype(str).str.strip().str.upper()
-                        trained_list_df['NAMA_CLEAN'] = trained_list_df['NAMA_CLEAN'].str.replace(r'[.,]', '', regex=True)
-                        
-                        # Menghitung frekuensi secara global berdasarkan NPSN dan NAMA
-                        frekuensi_df = trained_list_df.groupby(['NPSN', 'NAMA_CLEAN']).size().reset_index(name='JUMLAH_PELATIHAN')
-                        
-                        # C. Gabungkan Dapodik dengan Frekuensi (Left Join)
-                        final_data_df = master_list_df.merge(frekuensi_df, on=['NPSN', 'NAMA_CLEAN'], how='left')
-                        # Isi yang tidak pernah ikut (NaN) dengan 0
-                        final_data_df['JUMLAH_PELATIHAN'] = final_data_df['JUMLAH_PELATIHAN'].fillna(0).astype(int)
-                        
-                        # Buat label status teks agar mudah difilter di Excel
-                        def teks_prioritas(jml):
-                            if jml == 0: return "Belum Pernah (0x)"
-                            elif jml == 1: return "Pernah 1x"
-                            else: return f"Sudah Sering ({jml}x)"
-                        final_data_df['STATUS_UNDANGAN'] = final_data_df['JUMLAH_PELATIHAN'].apply(teks_prioritas)
-
-                        # D. Tambahkan Detail Sekolah
-                        NAMA_KOLOM_SEKOLAH_MASTER_RECO = 'NAMA_SEKOLAH' 
-                        if NAMA_KOLOM_SEKOLAH_MASTER_RECO not in df_sekolah_sumber.columns:
-                            if 'ASAL_SEKOLAH' in df_sekolah_sumber.columns:
-                                NAMA_KOLOM_SEKOLAH_MASTER_RECO = 'ASAL_SEKOLAH'
-                            else:
-                                NAMA_KOLOM_SEKOLAH_MASTER_RECO = 'NAMA_SEKOLAH' 
-                                df_sekolah_sumber[NAMA_KOLOM_SEKOLAH_MASTER_RECO] = pd.NA
-
-                        desired_cols = ['NPSN', NAMA_KOLOM_SEKOLAH_MASTER_RECO, 'TIPE', 'STATUS', 'KECAMATAN', 'KABUPATEN']
-                        existing_cols = [c for c in desired_cols if c in df_sekolah_sumber.columns]
-                        
-                        school_map_df = df_sekolah_sumber[existing_cols].copy()
-                        school_map_df['NPSN'] = school_map_df['NPSN'].astype(str).str.replace(r'\.0$', '', regex=True).str.strip()
-                        school_map_df = school_map_df.dropna(subset=['NPSN'])
-                        school_map_df = school_map_df.drop_duplicates(subset=['NPSN'], keep='first')
-                        
-                        final_df = final_data_df.merge(school_map_df, on='NPSN', how='left')
-
-                        # E. Format & Rename Kolom sesuai Urutan yang Diminta
-                        rename_dict = {
-                            NAMA_KOLOM_SEKOLAH_MASTER_RECO: 'Sekolah',
-                            'TIPE': 'Jenjang',
-                            'STATUS': 'Status Sekolah',
-                            'KECAMATAN': 'Kecamatan',
-                            'KABUPATEN': 'Sudin',
-                            NAMA_KOLOM_NAMA_DAPODIK: 'Nama Peserta',
-                            'JUMLAH_PELATIHAN': 'Frekuensi Ikut',
-                            'STATUS_UNDANGAN': 'Kategori'
-                        }
-                        final_df.rename(columns=rename_dict, inplace=True)
-
-                        # Menyusun urutan kolom final
-                        required_output_cols = [
-                            'Sekolah', 'NPSN', 'Jenjang', 'Status Sekolah', 
-                            'Kecamatan', 'Sudin', 'Nama Peserta', 
-                            'Frekuensi Ikut', 'Kategori'
-                        ]
-                        
-                        for col in required_output_cols:
-                            if col not in final_df.columns:
-                                final_df[col] = pd.NA
-                        
-                        final_df = final_df[required_output_cols]
-                        
-                        # Sortir data: Yang belum pernah (0) akan berada paling atas di Excel
-                        final_df = final_df.sort_values(by=['Frekuensi Ikut', 'Sekolah', 'Nama Peserta'])
-                        
-                        # F. Buat file Excel di Memori
-                        output = io.BytesIO()
-                        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                            final_df.to_excel(writer, index=False, sheet_name='Data Rekomendasi Undangan')
-                        data_to_download = output.getvalue()
-                        
-                        st.session_state['download_data'] = data_to_download
+                    if dapodik_rows:
+                        # File dibuat sekali per versi data (ditulis per potongan ke disk) dan dipakai bersama
+                        # oleh semua sesi; session state hanya menyimpan path-nya, bukan isi file.
+                        export_key = (
+                            data_version, sheet_versions['data_sekolah'], dapodik_version, link_threshold
+                        )
+
+                        def build_report():
+                            # Laporan lengkap = seluruh tabel rekomendasi (sama dengan yang diiris per sekolah)
+                            return load_recommendation_table(
+                                json_keyfile_str, spreadsheet_id, data_version,
+                                sheet_versions['data_sekolah'], dapodik_version
+                            ).report(link_threshold)
+
+                        st.session_state['download_path'] = get_or_create_export(
+                            'Master_Rekomendasi_Peserta', export_key, export_ext, build_report,
+                            sheet_name='Data Rekomendasi Undangan'
+                        )
                         st.session_state['download_ready'] = True
-                        st.success(f"✅ Laporan siap! Berhasil memproses {len(final_df)} data Dapodik lengkap dengan frekuensi pelatihannya. Klik tombol 'Unduh' di bawah.")
+                        st.success(f"✅ Laporan siap! Berhasil memproses {dapodik_rows} data Dapodik lengkap dengan frekuensi pelatihannya. Klik tombol 'Unduh' di bawah.")
 
                     else:
                         st.error("Data Dapodik (data_dapodik_name) tidak dapat dimuat.")
@@ -711,14 +874,17 @@ def main_app():
                     st.error(f"Gagal memproses laporan: {e}")
 
         # Tombol download akan muncul di sini setelah data siap
-        if st.session_state.get('download_ready', False):
-            st.download_button(
-                label="📥 Unduh File Excel Sekarang",
-                data=st.session_state['download_data'],
-                file_name=f"Master_Rekomendasi_Peserta_{pd.Timestamp.now().strftime('%Y%m%d')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                on_click=lambda: st.session_state.update(download_ready=False) # Reset state
-            )
+        download_path = st.session_state.get('download_path')
+        if st.session_state.get('download_ready', False) and download_path and os.path.exists(download_path):
+            download_ext = os.path.splitext(download_path)[1]
+            with open(download_path, 'rb') as download_file:
+                st.download_button(
+                    label="📥 Unduh File Sekarang",
+                    data=download_file,
+                    file_name=f"Master_Rekomendasi_Peserta_{pd.Timestamp.now().strftime('%Y%m%d')}{download_ext}",
+                    mime=dict(EXPORT_FORMATS.values()).get(download_ext.lstrip('.'), "application/octet-stream"),
+                    on_click=lambda: st.session_state.update(download_ready=False) # Reset state
+                )
         
         st.markdown("---")
         # ==================================================================
@@ -729,29 +895,20 @@ def main_app():
         st.write("Pilih sekolah untuk melihat daftar nama di Dapodik yang belum terdata mengikuti pelatihan.")
 
         try:
-            school_list_df = df[['NPSN', 'ASAL_SEKOLAH']].dropna(subset=['NPSN'])
-            school_list_df = school_list_df.drop_duplicates(subset=['NPSN'], keep='first')
-            school_list_df = school_list_df.merge(df_sekolah_sumber[['NPSN', 'STATUS', 'KECAMATAN', 'KABUPATEN']], on='NPSN', how='left')
-            school_list_df = school_list_df.dropna(subset=['STATUS', 'KECAMATAN', 'KABUPATEN']) 
-
-            if 'KECAMATAN' in school_list_df.columns:
-                school_list_df['KECAMATAN'] = school_list_df['KECAMATAN'].astype(str).str.replace("KEC. ", "").str.strip()
+            school_list_df = load_reco_school_list(json_keyfile_str, spreadsheet_id, data_version, dapodik_version)
         except Exception as e:
             st.error(f"Gagal memproses daftar sekolah untuk filter: {e}")
-            school_list_df = pd.DataFrame(columns=['ASAL_SEKOLAH', 'NPSN', 'STATUS', 'KECAMATAN', 'KABUPATEN'])
+            school_list_df = pd.DataFrame(columns=['ASAL_SEKOLAH', 'NPSN', 'NPSN_ID', 'STATUS', 'KECAMATAN', 'KABUPATEN'])
 
         reco_col1, reco_col2 = st.columns(2)
         with reco_col1:
             status_reco_filter = st.multiselect(
                 "Filter Status Sekolah",
-                options=school_list_df['STATUS'].unique(),
+                options=school_list_df['STATUS'].unique().tolist(),
                 key="reco_status_filter"
             )
         with reco_col2:
-            target_kabupaten = ['KOTA ADM. JAKARTA UTARA', 'KAB. ADM. KEP. SERIBU']
-            kecamatan_options = school_list_df[
-                school_list_df['KABUPATEN'].isin(target_kabupaten)
-            ]['KECAMATAN'].unique()
+            kecamatan_options = school_list_df[scope_mask(school_list_df['KABUPATEN'])]['KECAMATAN'].unique()
 
             kec_reco_filter = st.multiselect(
                 "Filter Kecamatan",
@@ -781,37 +938,25 @@ def main_app():
 
         if selected_school_name != "-- Pilih Sekolah --":
             try:
-                selected_npsn = str(display_schools_df[
+                selected_npsn = display_schools_df[
                     display_schools_df['ASAL_SEKOLAH'] == selected_school_name
-                ].iloc[0]['NPSN'])
+                ].iloc[0]['NPSN_ID']
                 
-                df_dapodik = load_dapodik_data(json_keyfile_str, spreadsheet_id)
+                df_dapodik = load_dapodik_data(json_keyfile_str, spreadsheet_id, dapodik_version)
                 NAMA_KOLOM_NAMA_DAPODIK = 'NAMA_LENGKAP'
                 
                 if not df_dapodik.empty:
-                    # 1. Ambil data guru dari Dapodik khusus untuk sekolah ini
-                    dapodik_sekolah = df_dapodik[df_dapodik['NPSN'] == selected_npsn].copy()
+                    # 1-5. Irisan tabel rekomendasi untuk sekolah ini (lookup NPSN_ID, tanpa memfilter seluruh Dapodik):
+                    # orang Dapodik sekolah ini + frekuensi pelatihan dari pencocokan nama (persis / fuzzy)
+                    reco_table = load_recommendation_table(
+                        json_keyfile_str, spreadsheet_id, data_version,
+                        sheet_versions['data_sekolah'], dapodik_version
+                    )
+                    reco_df = reco_table.school(selected_npsn, link_threshold)
                     
-                    if dapodik_sekolah.empty:
+                    if reco_df.empty:
                         st.warning("Tidak ada data nama ditemukan di sheet 'data_dapodik_name' untuk sekolah ini.")
                     else:
-                        # 2. Normalisasi nama di Dapodik untuk pencocokan yang akurat
-                        dapodik_sekolah['NAMA_CLEAN'] = dapodik_sekolah[NAMA_KOLOM_NAMA_DAPODIK].astype(str).str.strip().str.upper()
-                        dapodik_sekolah['NAMA_CLEAN'] = dapodik_sekolah['NAMA_CLEAN'].str.replace(r'[.,]', '', regex=True)
-                        
-                        # 3. Ambil data pelatihan khusus untuk sekolah ini
-                        pelatihan_sekolah = df[df['NPSN'] == selected_npsn].copy()
-                        
-                        # 4. Normalisasi nama dan hitung frekuensi per orang di data pelatihan
-                        pelatihan_sekolah['NAMA_CLEAN'] = pelatihan_sekolah['NAMA_PESERTA'].astype(str).str.strip().str.upper()
-                        pelatihan_sekolah['NAMA_CLEAN'] = pelatihan_sekolah['NAMA_CLEAN'].str.replace(r'[.,]', '', regex=True)
-                        frekuensi_df = pelatihan_sekolah['NAMA_CLEAN'].value_counts().reset_index()
-                        frekuensi_df.columns = ['NAMA_CLEAN', 'JUMLAH_PELATIHAN']
-                        
-                        # 5. Gabungkan Dapodik dengan Frekuensi Pelatihan
-                        reco_df = dapodik_sekolah.merge(frekuensi_df, on='NAMA_CLEAN', how='left')
-                        reco_df['JUMLAH_PELATIHAN'] = reco_df['JUMLAH_PELATIHAN'].fillna(0).astype(int)
-                        
                         # 6. Buat Indikator Prioritas agar ramah pengguna (UX)
                         def tentukan_prioritas(jml):
                             if jml == 0: return "🚨 Belum Pernah (Prioritas)"
@@ -820,32 +965,8 @@ def main_app():
                             
                         reco_df['STATUS_UNDANGAN'] = reco_df['JUMLAH_PELATIHAN'].apply(tentukan_prioritas)
                         
-                        # 7. UI Filter Frekuensi
-                        st.write(f"### Analisis Target Peserta: **{selected_school_name}**")
-                        filter_frekuensi = st.radio(
-                            "Filter Riwayat Pelatihan Peserta:",
-                            ["Tampilkan Semua", "Belum Pernah Sama Sekali (0x)", "Pernah 1x", "Sudah Lebih dari 1x"],
-                            horizontal=True
-                        )
-                        
-                        # Terapkan Filter
-                        if filter_frekuensi == "Belum Pernah Sama Sekali (0x)":
-                            tampil_df = reco_df[reco_df['JUMLAH_PELATIHAN'] == 0]
-                        elif filter_frekuensi == "Pernah 1x":
-                            tampil_df = reco_df[reco_df['JUMLAH_PELATIHAN'] == 1]
-                        elif filter_frekuensi == "Sudah Lebih dari 1x":
-                            tampil_df = reco_df[reco_df['JUMLAH_PELATIHAN'] > 1]
-                        else:
-                            tampil_df = reco_df
-                            
-                        # Format tabel untuk ditampilkan
-                        tampil_df = tampil_df[[NAMA_KOLOM_NAMA_DAPODIK, 'JUMLAH_PELATIHAN', 'STATUS_UNDANGAN']].rename(
-                            columns={NAMA_KOLOM_NAMA_DAPODIK: 'Nama Peserta (Dapodik)', 'JUMLAH_PELATIHAN': 'Frekuensi Ikut'}
-                        ).sort_values(by=['Frekuensi Ikut', 'Nama Peserta (Dapodik)']).reset_index(drop=True)
-                        tampil_df.index += 1
-                        
-                        st.caption(f"Menampilkan {len(tampil_df)} dari total {len(reco_df)} data Dapodik sekolah ini.")
-                        st.dataframe(tampil_df, use_container_width=True, height=350)
+                        # 7-8. Filter frekuensi & tabel dirender sebagai fragment (mengganti filter tidak menjalankan ulang script)
+                        recommendation_table(reco_df, selected_school_name, NAMA_KOLOM_NAMA_DAPODIK)
                         
             except Exception as e:
                 st.error(f"Gagal memproses data rekomendasi. Pastikan sheet 'data_dapodik_name' ada. Error: {e}")
@@ -854,36 +975,72 @@ def main_app():
             st.info("👈 Silakan pilih nama sekolah pada menu 'Pilih Sekolah' di atas untuk memunculkan analisis prioritas undangan peserta.")
 
     # --- TAB 4: UPLOAD DATA ---
-    with tab_upload:
+    def render_upload():
         st.header("Upload Data Terbaru")
         upload_category = st.selectbox("Pilih kategori pelatihan untuk ditambahkan data", sheet_names)
         uploaded_file = st.file_uploader(f"Upload file CSV atau Excel untuk pelatihan '{upload_category}' (format sesuai template)", type=['csv', 'xlsx'])
         
         if uploaded_file is not None:
             try:
-                new_data = pd.read_csv(uploaded_file, sep=';') if uploaded_file.name.endswith('.csv') else pd.read_excel(uploaded_file)
+                # File dibaca per potongan; hanya potongan pertama yang dipakai untuk pratinjau & validasi kolom
+                upload_chunks = read_upload_chunks(uploaded_file, uploaded_file.name)
+                first_chunk = next(upload_chunks)
                 st.write("Pratinjau data yang diunggah:")
-                st.dataframe(new_data)
-                expected_cols_base = load_data_from_gsheets(json_keyfile_str, spreadsheet_id, upload_category).columns
-                if any(c not in new_data.columns for c in expected_cols_base):
-                    st.error(f"File unggahan kehilangan beberapa kolom wajib. Kolom yang hilang: {', '.join(set(expected_cols_base) - set(new_data.columns))}")
+                st.dataframe(first_chunk.head(100))
+                expected_cols_base = load_sheet_header(json_keyfile_str, spreadsheet_id, upload_category, sheet_versions[upload_category])
+                if any(c not in first_chunk.columns for c in expected_cols_base):
+                    st.error(f"File unggahan kehilangan beberapa kolom wajib. Kolom yang hilang: {', '.join(set(expected_cols_base) - set(first_chunk.columns))}")
                 else:
-                    new_data = new_data.astype(str)
-                    if st.button("Tambahkan data ke Google Sheet"):
+                    upload_job = UploadJob(
+                        get_upload_source(json_keyfile_str, spreadsheet_id), upload_category,
+                        file_digest(uploaded_file.getvalue())
+                    )
+                    if upload_job.done:
+                        st.warning(
+                            f"File ini sudah pernah ditambahkan ke sheet '{upload_category}' ({upload_job.appended_rows} baris). "
+                            "Jika ditambahkan ulang, baris yang masih ada di data akan ditolak sebagai duplikat."
+                        )
+                    elif upload_job.appended_rows:
+                        st.info(f"Unggahan sebelumnya terhenti setelah {upload_job.appended_rows} baris. Klik tombol di bawah untuk melanjutkan.")
+                    upload_label = "Tambahkan ulang data ke Google Sheet" if upload_job.done else "Tambahkan data ke Google Sheet"
+                    if st.button(upload_label):
+                        if upload_job.done:
+                            upload_job.reset()
+                        upload_status = st.empty()
+                        # Baris kosong (nama/NPSN) & duplikat (sudah ada di data / berulang di file) ditolak
+                        # sebelum dikirim; dicek ke himpunan kunci peserta secara vektor per potongan file.
+                        # Saat melanjutkan, baris yang sudah terkirim mengisi ulang filter (seed) lebih dulu.
+                        upload_filter = UploadRowFilter(get_participant_keys())
+
                         try:
-                            scopes = ['https://www.googleapis.com/auth/spreadsheets']
-                            creds_dict = json.loads(st.secrets["GSHEET_SERVICE_ACCOUNT"])
-                            creds = Credentials.from_service_account_info(creds_dict, scopes=scopes)
-                            client = gspread.authorize(creds)
-                            sheet = client.open_by_key(spreadsheet_id).worksheet(upload_category)
-                            sheet.append_rows(new_data[expected_cols_base].values.tolist(), value_input_option='USER_ENTERED')
-                            st.success(f"Data berhasil ditambahkan ke sheet '{upload_category}'!")
-                            st.cache_data.clear()
+                            with stage('upload_sheets') as upload_stage:
+                                upload_job.run(
+                                    itertools.chain([first_chunk], upload_chunks), expected_cols_base,
+                                    row_filter=upload_filter, seed=upload_filter.seed,
+                                    on_progress=lambda n: upload_status.write(f"⏳ {n} baris terkirim...")
+                                )
+                                upload_stage['rows'] = upload_job.appended_rows
+                            # Hanya sheet ini yang disinkronkan ulang (baris baru saja); cache sheet lain tetap
+                            refresher.refresh(force=True, sheet_names=[upload_category])
+                            upload_status.empty()
+                            st.success(f"Data berhasil ditambahkan ke sheet '{upload_category}'! ({upload_job.appended_rows} baris)")
+                            if upload_job.rejected_rows:
+                                st.warning(f"{upload_job.rejected_rows} baris tidak ditambahkan karena kosong atau duplikat.")
+                                with st.expander("Lihat baris yang ditolak"):
+                                    st.dataframe(pd.concat(upload_filter.rejected).head(1000), use_container_width=True)
                         except Exception as e:
-                            st.error(f"Gagal menambahkan data: {e}")
+                            st.error(f"Gagal menambahkan data setelah {upload_job.appended_rows} baris: {e}. Klik tombol lagi untuk melanjutkan.")
             except Exception as e:
                 st.error(f"Gagal membaca file unggahan: {e}")
     
+    tab_renderers = {
+        'data_peserta': render_data_peserta, 'rekap': render_rekap,
+        'rekomendasi': render_rekomendasi, 'upload': render_upload,
+    }
+    tab_name = TAB_LABELS[active_tab]
+    with stage(f"tab_{tab_name}"):
+        tab_renderers[tab_name]()
+
     # --- FOOTER (DI LUAR SEMUA TAB) ---
     st.markdown("---")
     st.markdown(f'*Data cutoff: {pd.Timestamp.now(tz="Asia/Jakarta").strftime("%d %B %Y")}*')
@@ -907,11 +1064,18 @@ def main_app():
         unsafe_allow_html=True,
     )
 
+    # --- PANEL DIAGNOSTIK (tersembunyi): buka dengan ?diagnostics=<DIAGNOSTICS_TOKEN di secrets> ---
+    diagnostics_token = st.secrets.get("DIAGNOSTICS_TOKEN")
+    if diagnostics_token and st.query_params.get("diagnostics") == diagnostics_token:
+        show_diagnostics_panel()
+
 # Main flow control
 if st.session_state.page == "landing":
     show_landing_page()
 elif st.session_state.page == "main":
-    main_app()
+    # Setiap rerun dicatat (waktu, baris, cache hit/miss, memori per tahap) untuk panel diagnostik
+    with diagnostics_run('main_app'):
+        main_app()
 else:
     st.session_state.page = "landing"
     show_landing_page()
@@ -0,0 +1,163 @@
+import inspect
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:  # tanpa DuckDB: tidak ada mesin query yang di-cache
+    duckdb = None
+
+# Batas total memori (perkiraan) semua frame & artefak turunan yang di-cache dalam proses ini
+CACHE_BUDGET_MB = float(os.environ.get("SIPADU_CACHE_BUDGET_MB", "1536"))
+# Salinan dangkal hanya aman dengan copy-on-write (default sejak pandas 3; requirements.txt mensyaratkan pandas>=3).
+# Di pandas 2.x tanpa mode.copy_on_write, frame diberikan sebagai salinan penuh agar sesi lain tidak ikut berubah.
+COPY_ON_WRITE = int(pd.__version__.split('.')[0]) >= 3 or pd.options.mode.copy_on_write is True
+# Versi yang disimpan per kunci (versi lama tetap ada sebentar untuk sesi/fragment yang belum rerun)
+MAX_VERSIONS = 2
+
+
+def estimate_size(value, exclude=(), depth=4):
+    # Perkiraan byte: DataFrame/Index/array dihitung dari buffernya; tuple/list/dict/objek ditelusuri.
+    # `exclude` = id objek yang sudah dihitung sebagai entri cache lain (mis. ParticipantIndex di dalam NameLinker).
+    if id(value) in exclude or depth < 0:
+        return 0
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if duckdb is not None and isinstance(value, duckdb.DuckDBPyConnection):
+        # Tabel & cache DuckDB berada di luar heap Python: dihitung dari pemakaian memori database itu sendiri
+        # (memori kerja query sementara dibatasi memory_limit koneksi, lihat data_queries.QUERY_MEMORY_MB)
+        return int(value.execute("SELECT COALESCE(sum(memory_usage_bytes), 0) FROM duckdb_memory()").fetchone()[0])
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    if isinstance(value, (tuple, list, set, frozenset)):
+        return sum(estimate_size(v, exclude, depth - 1) for v in value)
+    if isinstance(value, dict):
+        return sum(estimate_size(v, exclude, depth - 1) for v in value.values())
+    if hasattr(value, '__dict__'):
+        return estimate_size(vars(value), exclude, depth - 1)
+    return 0
+
+
+# ==================================================================
+# === CACHE DATA BERSAMA (satu salinan per proses, berversi, LRU dengan batas memori) ===
+# ==================================================================
+# Pengganti st.cache_data / st.cache_resource untuk frame besar & artefak turunan (data bersih, indeks,
+# kubus rekap, tabel rekomendasi). Satu salinan per proses dipakai semua sesi:
+# - DataFrame diberikan sebagai df.copy(deep=False) -> buffer kolom (teks pandas 3 = Arrow) tidak disalin,
+#   copy-on-write menjamin perubahan oleh pemanggil tidak mengubah frame yang tersimpan (lihat COPY_ON_WRITE).
+# - Objek lain (indeks, kubus) diberikan apa adanya dan diperlakukan read-only.
+# Setiap kunci menyimpan paling banyak MAX_VERSIONS versi; versi baru mendorong keluar versi tertua.
+# Jika total ukuran melebihi budget, entri yang paling lama tidak dipakai (LRU) dibuang lebih dulu.
+class DataCache:
+    def __init__(self, budget_mb=CACHE_BUDGET_MB, max_versions=MAX_VERSIONS):
+        self.budget_bytes = int(budget_mb * 1024 ** 2)
+        self.max_versions = max_versions
+        self._entries = OrderedDict()  # (kunci, versi) -> (nilai, ukuran byte); urutan = LRU -> MRU
+        self._locks = {}
+        self._guard = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lock_for(self, entry_key):
+        with self._guard:
+            return self._locks.setdefault(entry_key, threading.Lock())
+
+    def _lookup(self, entry_key):
+        with self._guard:
+            entry = self._entries.get(entry_key)
+            if entry is not None:
+                self._entries.move_to_end(entry_key)
+                self.hits += 1
+            return entry
+
+    def _drop(self, entry_key):
+        value, size = self._entries.pop(entry_key)
+        self._locks.pop(entry_key, None)
+        self.total_bytes -= size
+        self.evictions += 1
+
+    def _insert(self, entry_key, value):
+        key = entry_key[0]
+        with self._guard:
+            exclude = {id(v) for v, _ in self._entries.values()}
+        size = estimate_size(value, exclude)
+        with self._guard:
+            self._entries[entry_key] = (value, size)
+            self.total_bytes += size
+            versions = [k for k in self._entries if k[0] == key]
+            for old_key in versions[:-self.max_versions]:
+                self._drop(old_key)
+            # Entri terbaru tidak pernah dibuang (sedang dipakai pemanggil), walau melebihi budget sendirian
+            while self.total_bytes > self.budget_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                if oldest == entry_key:
+                    break
+                self._drop(oldest)
+
+    def get(self, key, version, build):
+        entry_key = (key, version)
+        entry = self._lookup(entry_key)
+        if entry is None:
+            # Satu build per (kunci, versi): sesi lain yang meminta hal yang sama menunggu hasil yang sama
+            with self._lock_for(entry_key):
+                entry = self._lookup(entry_key)
+                if entry is None:
+                    with self._guard:
+                        self.misses += 1
+                    value = build()
+                    self._insert(entry_key, value)
+                    entry = (value, None)
+        value = entry[0]
+        return value.copy(deep=not COPY_ON_WRITE) if isinstance(value, pd.DataFrame) else value
+
+    def invalidate(self, key=None):
+        with self._guard:
+            for entry_key in [k for k in self._entries if key is None or k[0] == key]:
+                self._drop(entry_key)
+
+    def stats(self):
+        with self._guard:
+            return {
+                'entries': len(self._entries),
+                'size_mb': round(self.total_bytes / 1024 ** 2, 1),
+                'budget_mb': round(self.budget_bytes / 1024 ** 2, 1),
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+            }
+
+    def entries(self):
+        # Isi cache (untuk panel diagnostik), dari yang paling lama tidak dipakai; argumen kunci (kredensial) tidak ditampilkan
+        with self._guard:
+            return [
+                {'loader': key[0].rsplit('.', 1)[-1], 'version': str(version)[:120], 'size_mb': round(size / 1024 ** 2, 2)}
+                for (key, version), (_, size) in self._entries.items()
+            ]
+
+
+DATA_CACHE = DataCache()
+
+
+def cached(*version_params):
+    # Dekorator loader: argumen bernama di `version_params` menjadi versi, argumen lain menjadi kunci.
+    # Contoh: @cached('data_version') def load_x(json_keyfile_str, spreadsheet_id, data_version)
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            arguments = signature.bind(*args, **kwargs).arguments
+            version = tuple(arguments[name] for name in version_params)
+            key = (func.__qualname__,) + tuple(v for name, v in arguments.items() if name not in version_params)
+            return DATA_CACHE.get(key, version, lambda: func(*args, **kwargs))
+        return wrapper
+    return decorator
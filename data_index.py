@@ -0,0 +1,238 @@
+import re
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from data_pipeline import clean_name, normalize_name
+
+
+# ==================================================================
+# === INDEKS FILTER (dibangun sekali per versi data) ===
+# ==================================================================
+# Untuk setiap kolom filter: nilai -> bitmap baris (np.packbits, 1 bit per baris).
+# Untuk TANGGAL: urutan baris yang sudah disortir berdasarkan tanggal.
+# Filter multiselect menjadi OR antar bitmap nilai, lalu AND antar kolom;
+# hasilnya adalah posisi baris (iloc) pada frame yang dipakai untuk membangun indeks.
+class FilterIndex:
+    def __init__(self, df, columns, date_column='TANGGAL'):
+        self.n_rows = len(df)
+        self.n_bytes = (self.n_rows + 7) // 8
+        self.bitmaps = {}
+        self.options = {}
+        for col in columns:
+            codes, uniques = pd.factorize(df[col])
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+            col_bitmaps = {}
+            for i, value in enumerate(uniques):
+                mask = np.zeros(self.n_rows, dtype=bool)
+                mask[order[bounds[i]:bounds[i + 1]]] = True
+                col_bitmaps[value] = np.packbits(mask)
+            self.bitmaps[col] = col_bitmaps
+            self.options[col] = df[col].dropna().unique().tolist()
+
+        dates = df[date_column].to_numpy(dtype='datetime64[ns]')
+        valid = np.flatnonzero(~np.isnat(dates))
+        self.date_order = valid[np.argsort(dates[valid], kind='stable')]
+        self.sorted_dates = dates[self.date_order]
+
+    def _rows_to_bitmap(self, rows):
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[rows] = True
+        return np.packbits(mask)
+
+    def date_bitmap(self, start_date, end_date):
+        lo = np.searchsorted(self.sorted_dates, np.datetime64(start_date, 'ns'), side='left')
+        hi = np.searchsorted(self.sorted_dates, np.datetime64(end_date, 'ns'), side='right')
+        return self._rows_to_bitmap(self.date_order[lo:hi])
+
+    def select(self, filters, date_range=None):
+        # filters: {kolom: [nilai, ...]}; kolom dengan list kosong diabaikan.
+        # Mengembalikan None jika tidak ada filter aktif (semua baris).
+        result = None
+        for col, values in filters.items():
+            if not values:
+                continue
+            bitmap = np.zeros(self.n_bytes, dtype=np.uint8)
+            for value in values:
+                value_bitmap = self.bitmaps[col].get(value)
+                if value_bitmap is not None:
+                    np.bitwise_or(bitmap, value_bitmap, out=bitmap)
+            result = bitmap if result is None else np.bitwise_and(result, bitmap, out=result)
+        if date_range is not None:
+            bitmap = self.date_bitmap(*date_range)
+            result = bitmap if result is None else np.bitwise_and(result, bitmap, out=result)
+        if result is None:
+            return None
+        return np.flatnonzero(np.unpackbits(result, count=self.n_rows))
+
+
+# ==================================================================
+# === INDEKS PENCARIAN NAMA / SEKOLAH (dibangun sekali per versi data) ===
+# ==================================================================
+def normalize_search_text(text):
+    # Huruf besar, tanpa aksen/tanda baca, spasi dirapikan: "Siti Aminah, S.Pd" -> "SITI AMINAH S PD"
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(re.sub(r'[^0-9A-Z]+', ' ', text.upper()).split())
+
+
+def substring_edit_distances(pattern, texts):
+    # Jarak edit minimum antara `pattern` dan substring mana pun dari setiap teks (algoritma Sellers),
+    # dihitung sekaligus untuk semua kandidat: satu operasi numpy per sel tabel DP.
+    m = len(pattern)
+    lengths = np.array([len(t) for t in texts])
+    width = int(lengths.max()) if len(texts) else 0
+    chars = np.zeros((len(texts), width), dtype=np.uint8)
+    for k, text in enumerate(texts):
+        chars[k, :len(text)] = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+    pattern_chars = np.frombuffer(pattern.encode('ascii'), dtype=np.uint8)
+
+    prev = np.tile(np.arange(m + 1), (len(texts), 1))
+    best = prev[:, m].copy()
+    for j in range(width):
+        active = j < lengths
+        cur = np.zeros_like(prev)
+        for i in range(1, m + 1):
+            cost = (pattern_chars[i - 1] != chars[:, j]).astype(prev.dtype)
+            cur[:, i] = np.minimum(np.minimum(prev[:, i] + 1, cur[:, i - 1] + 1), prev[:, i - 1] + cost)
+        best = np.where(active, np.minimum(best, cur[:, m]), best)
+        prev = np.where(active[:, None], cur, prev)
+    return best
+
+
+# Indeks trigram atas nilai UNIK yang sudah dinormalisasi (nama peserta jauh lebih sedikit daripada baris).
+# Mendukung pencocokan prefix, substring, dan salah ketik (edit distance terbatas) dengan hasil berperingkat:
+#   0 = diawali kata kunci, 1 = salah satu kata diawali kata kunci, 2 = substring, 3+ = mirip (salah ketik)
+class SearchIndex:
+    ngram = 3
+    max_fuzzy_candidates = 500
+
+    def __init__(self, series):
+        codes, uniques = pd.factorize(series)
+        self.n_rows = len(series)
+        texts = [normalize_search_text(v) for v in uniques]
+        string_dtype = np.dtypes.StringDType() if hasattr(np.dtypes, 'StringDType') else str
+        self.values = np.array(texts, dtype=string_dtype)
+        self.padded_values = np.array([f" {t}" for t in texts], dtype=string_dtype)
+        self.row_order = np.argsort(codes, kind='stable')
+        self.row_bounds = np.searchsorted(codes[self.row_order], np.arange(len(uniques) + 1))
+
+        postings = defaultdict(list)
+        for value_id, text in enumerate(texts):
+            for gram in self._grams(f" {text} "):
+                postings[gram].append(value_id)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def _grams(self, text):
+        return {text[i:i + self.ngram] for i in range(len(text) - self.ngram + 1)}
+
+    @staticmethod
+    def default_max_edits(query):
+        if len(query) < 4:
+            return 0
+        return 1 if len(query) < 8 else 2
+
+    def _substring_candidates(self, query):
+        if len(query) < self.ngram:
+            return np.arange(len(self.values))
+        lists = sorted((self.postings.get(gram) for gram in self._grams(query)), key=lambda a: 0 if a is None else len(a))
+        if lists[0] is None:
+            return np.array([], dtype=np.int32)
+        candidates = lists[0]
+        for ids in lists[1:]:
+            candidates = np.intersect1d(candidates, ids, assume_unique=True)
+            if len(candidates) == 0:
+                break
+        return candidates
+
+    def _fuzzy_candidates(self, query, max_edits):
+        grams = [gram for gram in self._grams(query) if gram in self.postings]
+        if not grams:
+            return np.array([], dtype=np.int32)
+        # q-gram lemma: substring dengan <= k kesalahan tetap berbagi minimal (m - n + 1) - k*n trigram
+        min_shared = max(1, (len(query) - self.ngram + 1) - max_edits * self.ngram)
+        counts = np.bincount(np.concatenate([self.postings[gram] for gram in grams]), minlength=len(self.values))
+        candidates = np.flatnonzero(counts >= min_shared)
+        if len(candidates) > self.max_fuzzy_candidates:
+            candidates = candidates[np.argsort(-counts[candidates], kind='stable')[:self.max_fuzzy_candidates]]
+        return candidates
+
+    def search_values(self, query, max_edits=None):
+        # Mengembalikan (value_ids, ranks) yang sudah diurutkan berdasarkan peringkat
+        query = normalize_search_text(query)
+        if not query:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        if max_edits is None:
+            max_edits = self.default_max_edits(query)
+
+        value_ids = np.asarray(self._substring_candidates(query), dtype=np.int64)
+        position = np.char.find(self.values[value_ids], query)
+        value_ids, position = value_ids[position >= 0], position[position >= 0]
+        word_start = np.char.find(self.padded_values[value_ids], f" {query}") >= 0
+        ranks = np.where(position == 0, 0, np.where(word_start, 1, 2))
+
+        if max_edits > 0:
+            fuzzy_ids = self._fuzzy_candidates(query, max_edits)
+            fuzzy_ids = fuzzy_ids[~np.isin(fuzzy_ids, value_ids)]
+            if len(fuzzy_ids):
+                distances = substring_edit_distances(query, [str(t) for t in self.values[fuzzy_ids]])
+                keep = distances <= max_edits
+                value_ids = np.concatenate([value_ids, fuzzy_ids[keep]])
+                ranks = np.concatenate([ranks, 2 + distances[keep]])
+
+        order = np.lexsort((value_ids, ranks))
+        return value_ids[order], ranks[order]
+
+    def search(self, query, max_edits=None):
+        # Posisi baris (iloc) yang cocok, urut berdasarkan peringkat lalu urutan baris asli
+        value_ids, _ = self.search_values(query, max_edits)
+        starts = self.row_bounds[value_ids]
+        lengths = self.row_bounds[value_ids + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return self.row_order[offsets]
+
+
+# ==================================================================
+# === INDEKS RIWAYAT PELATIHAN PER PESERTA (dibangun sekali per versi data) ===
+# ==================================================================
+# Kunci peserta = (NPSN_ID, nama yang dinormalisasi). Baris-baris setiap peserta disimpan
+# berurutan di `row_order` dengan batas di `offsets` (grouped offsets array), sehingga
+#   - rows(npsn, nama)       -> posisi baris pelatihan peserta tsb, O(jumlah pelatihannya)
+#   - frequency(npsn, nama)  -> jumlah pelatihan per peserta (vektor), dipakai tab Rekomendasi
+#   - person_ids(npsn, nama) -> id peserta (integer) yang sama untuk data pelatihan & Dapodik; -1 = belum pernah ikut
+class ParticipantIndex:
+    def __init__(self, df, name_column='NAMA_PESERTA'):
+        npsn = df['NPSN_ID'].to_numpy(dtype='int64', na_value=-1)
+        name_codes, name_uniques = pd.factorize(normalize_name(df[name_column]))
+        npsn_codes, npsn_uniques = pd.factorize(npsn)
+        n_names = len(name_uniques) + 1
+        valid_rows = (npsn >= 0) & (name_codes >= 0)
+        person_codes = np.full(len(df), -1, dtype=np.int64)
+        person_codes[valid_rows], person_keys = pd.factorize(npsn_codes[valid_rows] * n_names + name_codes[valid_rows])
+
+        self.keys = pd.MultiIndex.from_arrays([
+            npsn_uniques[person_keys // n_names],
+            np.asarray(name_uniques, dtype=object)[person_keys % n_names],
+        ], names=['NPSN_ID', 'NAMA_CLEAN'])
+        self.row_order = np.argsort(person_codes, kind='stable')
+        self.offsets = np.searchsorted(person_codes[self.row_order], np.arange(len(person_keys) + 1))
+        self.counts = np.diff(self.offsets)
+        self.keys.get_indexer(self.keys[:1])  # bangun hash table lookup sekarang, bukan saat klik pertama
+
+    def person_ids(self, npsn_ids, names):
+        npsn_ids = pd.Series(npsn_ids).to_numpy(dtype='int64', na_value=-1)
+        return self.keys.get_indexer(pd.MultiIndex.from_arrays([npsn_ids, np.asarray(names, dtype=object)]))
+
+    def rows(self, npsn_id_value, name):
+        code = self.person_ids([npsn_id_value], [clean_name(name)])[0]
+        if code < 0:
+            return np.array([], dtype=np.int64)
+        return self.row_order[self.offsets[code]:self.offsets[code + 1]]
+
+    def frequency_of(self, person_ids):
+        return np.where(person_ids >= 0, self.counts[person_ids], 0)
+
+    def frequency(self, npsn_ids, names_clean):
+        return self.frequency_of(self.person_ids(npsn_ids, names_clean))
@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_pipeline import PARTICIPANT_KEYS, encode_npsn, normalize_columns
+
+# Sudin (KABUPATEN) yang dilayani deployment ini, dipisah koma; kosong = seluruh provinsi.
+# Menambah Sudin cukup mengubah konfigurasi ini (mis. SIPADU_SUDIN_SCOPE="KOTA ADM. JAKARTA UTARA,KOTA ADM. JAKARTA PUSAT").
+SUDIN_SCOPE = [
+    name.strip().upper()
+    for name in os.environ.get("SIPADU_SUDIN_SCOPE", "KOTA ADM. JAKARTA UTARA,KAB. ADM. KEP. SERIBU").split(',')
+    if name.strip()
+]
+
+
+# ==================================================================
+# === PARTISI DATA PER KABUPATEN (SUDIN) ===
+# ==================================================================
+# Setiap baris masuk partisi KABUPATEN sekolahnya: data_sekolah lewat kolom KABUPATEN, data pelatihan
+# dan Dapodik lewat NPSN -> KABUPATEN (peta dari data_sekolah). Saat load, partisi di luar SUDIN_SCOPE
+# dipangkas per file part snapshot sehingga proses hanya memegang sekolah & peserta Sudin sendiri.
+# Baris yang tidak bisa dipetakan (NPSN tidak ada di data_sekolah / KABUPATEN kosong) tetap dimuat
+# agar tidak hilang diam-diam dari tampilan & laporan.
+def scope_mask(kabupaten, scope=SUDIN_SCOPE):
+    # True = baris dimuat: KABUPATEN di dalam scope, atau kosong / tidak terpetakan
+    if not scope:
+        return np.ones(len(kabupaten), dtype=bool)
+    kabupaten = kabupaten.astype(object).where(kabupaten.notna(), '').astype(str).str.strip().str.upper()
+    return (kabupaten.isin(scope) | (kabupaten == '')).to_numpy(dtype=bool)
+
+
+# Pembaca di bawah menerima versions = {sheet: versi snapshot} yang dibaca (default: versi terbaru), agar
+# frame yang di-cache per versi berisi data versi itu sendiri walaupun sinkronisasi sudah menulis versi baru.
+def read_sudin_map(store, versions=None):
+    # NPSN_ID -> KABUPATEN untuk seluruh provinsi; hanya kolom NPSN & KABUPATEN data_sekolah yang dibaca
+    versions = versions or {}
+    df = normalize_columns(store.load('data_sekolah', columns=['NPSN', 'KABUPATEN'], version=versions.get('data_sekolah')))
+    if 'NPSN' not in df.columns or 'KABUPATEN' not in df.columns:
+        return pd.Series([], index=pd.Index([], dtype='Int64'), dtype=object)
+    sudin = pd.Series(df['KABUPATEN'].str.strip().str.upper().to_numpy(dtype=object), index=encode_npsn(df['NPSN']).array)
+    sudin = sudin[sudin.index.notna() & (sudin != '')]
+    return sudin[~sudin.index.duplicated(keep='first')]
+
+
+def npsn_scope_mask(npsn, sudin_map, scope=SUDIN_SCOPE):
+    if not scope:
+        return np.ones(len(npsn), dtype=bool)
+    return scope_mask(pd.Series(sudin_map.reindex(encode_npsn(npsn).array).to_numpy(dtype=object)), scope)
+
+
+def read_schools(store, scope=SUDIN_SCOPE, versions=None):
+    version = (versions or {}).get('data_sekolah')
+    kabupaten = normalize_columns(store.load('data_sekolah', columns=['KABUPATEN'], version=version))
+    if 'KABUPATEN' not in kabupaten.columns:
+        return store.load('data_sekolah', version=version)
+    return store.load('data_sekolah', rows=scope_mask(kabupaten['KABUPATEN'], scope), version=version)
+
+
+def read_dapodik(store, sudin_map, scope=SUDIN_SCOPE, versions=None):
+    version = (versions or {}).get('data_dapodik_name')
+    npsn = normalize_columns(store.load('data_dapodik_name', columns=['NPSN'], version=version))
+    if 'NPSN' not in npsn.columns:
+        return store.load('data_dapodik_name', version=version)
+    return store.load('data_dapodik_name', rows=npsn_scope_mask(npsn['NPSN'], sudin_map, scope), version=version)
+
+
+def read_participant_keys(store, sheet_names, participant_keys, versions=None):
+    # Kolom kunci SEMUA baris sheet + status baris dari ParticipantKeySet (selaras dengan urutan baris sheet).
+    # Mengembalikan (frame kunci per sheet, (hash, status)).
+    versions = versions or {}
+    key_frames = {}
+    for name in sheet_names:
+        keys = normalize_columns(store.load(name, columns=PARTICIPANT_KEYS, version=versions.get(name)))
+        key_frames[name] = keys.loc[:, ~keys.columns.duplicated(keep='first')]
+    generations = {name: store.generation(name, versions.get(name)) for name in sheet_names}
+    return key_frames, participant_keys.update(key_frames, generations)
+
+
+def read_training_rows(store, sheet_names, participant_keys, sudin_map, scope=SUDIN_SCOPE, first_rows=None, versions=None):
+    # Status baris (blank/duplikat) tetap dihitung atas semua baris sheet (cek duplikat unggahan berlaku
+    # lintas Sudin), tetapi yang dibaca hanya kolom kunci. Baris lengkap hanya dimuat untuk partisi di dalam scope.
+    # first_rows = {sheet: n} -> hanya baris ke-n dst. (baris yang di-append sejak pembacaan sebelumnya).
+    # Mengembalikan (df_raw, row_keys, jumlah baris per sheet yang sudah diperhitungkan).
+    versions = versions or {}
+    key_frames, (hashes, flags) = read_participant_keys(store, sheet_names, participant_keys, versions)
+    masks = [np.array(npsn_scope_mask(key_frames[name]['NPSN'], sudin_map, scope)) for name in sheet_names]
+    for name, mask in zip(sheet_names, masks):
+        mask[:(first_rows or {}).get(name, 0)] = False
+
+    frames = []
+    for name, mask in zip(sheet_names, masks):
+        frame = normalize_columns(store.load(name, rows=mask, version=versions.get(name)))
+        frames.append(frame.loc[:, ~frame.columns.duplicated(keep='first')])
+    mask = np.concatenate(masks) if masks else np.array([], dtype=bool)
+    sizes = {name: len(key_frames[name]) for name in sheet_names}
+    return pd.concat(frames, ignore_index=True), (hashes[mask], flags[mask]), sizes
+
+
+def read_training(store, sheet_names, participant_keys, sudin_map, scope=SUDIN_SCOPE, versions=None):
+    # Mengembalikan (df_raw, row_keys) untuk clean_training_data
+    df_raw, row_keys, _ = read_training_rows(store, sheet_names, participant_keys, sudin_map, scope, versions=versions)
+    return df_raw, row_keys
@@ -0,0 +1,154 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# Kunci yang dipakai untuk menentukan satu peserta pada satu pelatihan
+PARTICIPANT_KEYS = ['NAMA_PESERTA', 'NPSN', 'NAMA_PELATIHAN']
+
+# Status baris data pelatihan (lihat participant_keys.ParticipantKeySet)
+ROW_OK, ROW_BLANK, ROW_DUPLICATE = 0, 1, 2
+
+# ==================================================================
+# === SKEMA TIPE DATA (diterapkan sekali saat load) ===
+# ==================================================================
+# Kolom berulang disimpan sebagai categorical, angka sebagai Int64 (nullable).
+# Kolom 'NPSN' tetap ada untuk tampilan; 'NPSN_ID' (Int64) ditambahkan untuk isin/groupby/merge.
+TRAINING_SCHEMA = {
+    'NPSN': 'category', 'JENJANG': 'category', 'KECAMATAN': 'category', 'PELATIHAN': 'category',
+    'STATUS_SEKOLAH': 'category', 'NAMA_PELATIHAN': 'category', 'ASAL_SEKOLAH': 'category',
+}
+SCHOOL_SCHEMA = {
+    'NPSN': 'category', 'TIPE': 'category', 'STATUS': 'category', 'KECAMATAN': 'category',
+    'KABUPATEN': 'category', 'KEPALA_SEKOLAH': 'Int64', 'TENAGA_KEPENDIDIKAN': 'Int64', 'GURU': 'Int64',
+}
+DAPODIK_SCHEMA = {'NPSN': 'category'}
+
+
+def npsn_id(value):
+    # NPSN 8 digit -> integer; NPSN lembaga nonformal berawalan huruf (contoh: P9970123)
+    # dikodekan sebagai (urutan huruf * 10^9) + angka agar tetap unik.
+    text = re.sub(r'\.0$', '', str(value).strip().upper())
+    match = re.fullmatch(r'([A-Z]?)(\d{1,9})', text)
+    if not match:
+        return pd.NA
+    prefix, digits = match.groups()
+    return (ord(prefix) - ord('A') + 1) * 10**9 + int(digits) if prefix else int(digits)
+
+
+def encode_npsn(series):
+    # Parsing hanya dilakukan pada nilai unik, lalu disebar ke semua baris lewat kode factorize
+    codes, uniques = pd.factorize(series)
+    ids = pd.array([npsn_id(v) for v in uniques] + [pd.NA], dtype='Int64')
+    return pd.Series(ids[codes], index=series.index, name='NPSN_ID')
+
+
+def apply_schema(df, schema):
+    df = df.copy()
+    for col, dtype in schema.items():
+        if col not in df.columns:
+            continue
+        if dtype == 'Int64':
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
+        else:
+            df[col] = df[col].astype(dtype)
+    if 'NPSN' in df.columns:
+        df['NPSN_ID'] = encode_npsn(df['NPSN'])
+    return df
+
+
+def clean_name(value):
+    # Normalisasi nama untuk pencocokan: "Siti Aminah, S.Pd " -> "SITI AMINAH SPD"
+    return re.sub(r'[.,]', '', str(value).strip().upper())
+
+
+def normalize_name(series):
+    # Sama seperti clean_name, tetapi hanya dihitung pada nilai unik lalu disebar ke semua baris
+    codes, uniques = pd.factorize(series)
+    cleaned = pd.array([clean_name(v) for v in uniques] + [pd.NA], dtype='string')
+    return pd.Series(cleaned[codes], index=series.index, name='NAMA_CLEAN')
+
+
+def normalize_columns(df):
+    df = df.copy()
+    df.columns = [str(col).strip().upper() for col in df.columns]
+    return df
+
+
+def blank_participant_mask(df):
+    # Baris dengan NAMA_PESERTA / NPSN kosong (blank cell)
+    nama = df['NAMA_PESERTA'].astype(str).str.strip()
+    npsn = df['NPSN'].astype(str)
+    kondisi_nama_kosong = (nama == '') | (nama.str.lower() == 'nan') | df['NAMA_PESERTA'].isna()
+    kondisi_npsn_kosong = (npsn == '') | (npsn.str.lower() == 'nan') | df['NPSN'].isna()
+    return (kondisi_nama_kosong | kondisi_npsn_kosong).to_numpy(dtype=bool)
+
+
+def participant_key_hashes(df):
+    # Hash 64-bit dari kunci peserta yang dinormalisasi: (nama, NPSN, nama pelatihan)
+    keys = pd.DataFrame({
+        'NAMA_PESERTA': normalize_name(df['NAMA_PESERTA'].astype(str)).astype(object),
+        'NPSN': df['NPSN'].astype(str).str.strip().str.replace(r'\.0$', '', regex=True),
+        'NAMA_PELATIHAN': df['NAMA_PELATIHAN'].astype(str).str.strip().str.upper(),
+    })
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy(dtype=np.uint64)
+
+
+# ==================================================================
+# === PEMBERSIHAN DATA PELATIHAN (dijalankan sekali per versi data) ===
+# ==================================================================
+# Mengembalikan (df, df_anomali, df_ganda):
+# - df         : data pelatihan bersih, sudah bertipe (TRAINING_SCHEMA), tanpa blank cell & duplikat
+# - df_anomali : baris dengan NAMA_PESERTA / NPSN kosong
+# - df_ganda   : semua baris yang terdaftar ganda pada pelatihan yang sama
+# `row_keys` = (hash, status) per baris df_raw dari ParticipantKeySet; jika ada, blank cell & duplikat
+# tinggal dibaca dari status baris (tanpa scan duplikat ke seluruh riwayat).
+# Hasilnya dipakai bersama oleh semua sesi, jadi jangan diubah secara inplace.
+def clean_training_data(df_raw, row_keys=None):
+    df = normalize_columns(df_raw)
+    if 'STASUS_SEKOLAH' in df.columns:
+        df = df.rename(columns={'STASUS_SEKOLAH': 'STATUS_SEKOLAH'})
+    df = df.loc[:, ~df.columns.duplicated(keep='first')]
+
+    df['TANGGAL'] = pd.to_datetime(df['TANGGAL'], errors='coerce', dayfirst=True)
+    if 'NPSN' in df.columns:
+        df['NPSN'] = df['NPSN'].astype(str)
+    if 'STATUS_SEKOLAH' not in df.columns:
+        df['STATUS_SEKOLAH'] = pd.NA
+    df['JENJANG'] = df['JENJANG'].replace('DIKMAS', 'PKBM')
+    if 'NAMA_PESERTA' in df.columns:
+        df['NAMA_PESERTA'] = df['NAMA_PESERTA'].astype(str).str.strip()
+
+    if row_keys is not None:
+        hashes, flags = row_keys
+        df_anomali = df[flags == ROW_BLANK]
+        df_ganda = df[(flags != ROW_BLANK) & np.isin(hashes, hashes[flags == ROW_DUPLICATE])]
+        df = df[flags == ROW_OK]
+        return apply_schema(df, TRAINING_SCHEMA), df_anomali, df_ganda
+
+    # 1. DETEKSI & HAPUS BLANK CELL
+    kondisi_kosong = blank_participant_mask(df)
+    df_anomali = df[kondisi_kosong]
+    df = df[~kondisi_kosong]
+
+    # 2. DETEKSI & HAPUS DATA GANDA, sisakan 1 saja (keep='first')
+    mask_ganda = df.duplicated(subset=PARTICIPANT_KEYS, keep=False)
+    df_ganda = df[mask_ganda]
+    df = df.drop_duplicates(subset=PARTICIPANT_KEYS, keep='first')
+
+    return apply_schema(df, TRAINING_SCHEMA), df_anomali, df_ganda
+
+
+# ==================================================================
+# === KUBUS REKAP PENCAPAIAN (dibangun sekali per versi data) ===
+# ==================================================================
+RECAP_PELATIHAN = ['Pendidik', 'Tendik', 'Kejuruan']
+ALL_STATUS = '__SEMUA__'  # baris kubus untuk "tanpa filter status"
+
+
+def school_name_column(df_sekolah):
+    if 'NAMA_SEKOLAH' in df_sekolah.columns:
+        return 'NAMA_SEKOLAH'
+    if 'ASAL_SEKOLAH' in df_sekolah.columns:
+        return 'ASAL_SEKOLAH'
+    return 'NPSN'  # Fallback jika tidak ada nama
@@ -0,0 +1,300 @@
+import os
+import threading
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+import diagnostics
+from data_partition import SUDIN_SCOPE, read_participant_keys
+from data_pipeline import ALL_STATUS, RECAP_PELATIHAN, ROW_OK, school_name_column
+
+# Jumlah thread DuckDB (0 = semua core) dan batas memori; agregasi yang melebihi batas di-spill ke disk
+QUERY_THREADS = int(os.environ.get("SIPADU_QUERY_THREADS", "0"))
+QUERY_MEMORY_MB = int(os.environ.get("SIPADU_QUERY_MEMORY_MB", "512"))
+
+# Kolom yang dibaca dari file part snapshot per tabel (nama kolom setelah strip + upper);
+# kolom yang tidak ada di header sheet dibaca sebagai NULL
+TRAINING_COLUMNS = ['NPSN', 'NAMA_PESERTA', 'ASAL_SEKOLAH', 'PELATIHAN', 'JENJANG']
+SCHOOL_COLUMNS = ['NPSN', 'TIPE', 'STATUS', 'KECAMATAN', 'KABUPATEN', 'GURU', 'KEPALA_SEKOLAH', 'TENAGA_KEPENDIDIKAN']
+DAPODIK_COLUMNS = ['NPSN', 'NAMA_LENGKAP']
+
+# Fungsi bantu SQL; npsn_id() sama dengan data_pipeline.npsn_id (NPSN berawalan huruf -> urutan huruf * 10^9 + angka)
+MACROS = [
+    r"CREATE MACRO strip(v) AS regexp_replace(v, '^\s+|\s+$', '', 'g')",
+    r"CREATE MACRO npsn_text(v) AS regexp_replace(upper(strip(v)), '\.0$', '')",
+    r"""CREATE MACRO npsn_id(v) AS CASE
+        WHEN regexp_full_match(npsn_text(v), '[0-9]{1,9}') THEN CAST(npsn_text(v) AS BIGINT)
+        WHEN regexp_full_match(npsn_text(v), '[A-Z][0-9]{1,9}')
+            THEN (ascii(npsn_text(v)) - 64) * CAST(1000000000 AS BIGINT) + CAST(substr(npsn_text(v), 2) AS BIGINT)
+    END""",
+    # Sama dengan data_partition.scope_mask: KABUPATEN di dalam scope, kosong / tidak terpetakan, atau tanpa scope
+    # (nama parameter tidak boleh sama dengan kolom sudin_scope.KABUPATEN: parameter macro menang atas nama kolom)
+    """CREATE MACRO in_sudin_scope(v) AS
+        NOT EXISTS (SELECT 1 FROM sudin_scope) OR v IS NULL OR v = '' OR v IN (SELECT KABUPATEN FROM sudin_scope)""",
+]
+
+# Peta NPSN_ID -> KABUPATEN seluruh provinsi (sama dengan data_partition.read_sudin_map), dari kolom NPSN & KABUPATEN
+SUDIN_MAP_TABLE = """
+    SELECT npsn_id(NPSN) AS NPSN_ID, arg_min(upper(strip(KABUPATEN)), row_id) AS KABUPATEN
+    FROM raw WHERE npsn_id(NPSN) IS NOT NULL AND strip(KABUPATEN) <> '' GROUP BY 1"""
+# Syarat baris mentah yang disalin (partisi SUDIN_SCOPE, sama dengan data_partition.scope_mask / npsn_scope_mask):
+# data_sekolah lewat KABUPATEN-nya sendiri, data pelatihan & Dapodik lewat NPSN -> sudin_map
+SCOPE_BY_KABUPATEN = "in_sudin_scope(upper(strip(raw.KABUPATEN)))"
+SCOPE_BY_NPSN = "in_sudin_scope((SELECT m.KABUPATEN FROM sudin_map m WHERE m.NPSN_ID = npsn_id(raw.NPSN)))"
+
+# Tabel bersih di atas tabel mentah (salinan kolom yang dipakai dari file part, hanya partisi SUDIN_SCOPE),
+# aturan pembersihan sama dengan jalur pandas:
+# - sekolah   : data_sekolah dengan TIPE terisi (DIKMAS -> PKBM), target GURU / KS+TENDIK sebagai angka
+# - pelatihan : baris ROW_OK dari ParticipantKeySet (tanpa blank cell & duplikat)
+# - dapodik   : roster Dapodik
+VIEWS = [
+    """CREATE VIEW sekolah AS
+        SELECT row_id, NPSN, npsn_id(NPSN) AS NPSN_ID, NAMA, KECAMATAN, STATUS, KABUPATEN,
+            CASE WHEN TIPE = 'DIKMAS' THEN 'PKBM' ELSE TIPE END AS TIPE,
+            COALESCE(TRY_CAST(GURU AS DOUBLE), 0) AS GURU,
+            COALESCE(TRY_CAST(KEPALA_SEKOLAH AS DOUBLE), 0) + COALESCE(TRY_CAST(TENAGA_KEPENDIDIKAN AS DOUBLE), 0) AS KS_TENDIK
+        FROM raw_sekolah
+        WHERE TIPE <> ''""",
+    """CREATE VIEW pelatihan AS
+        SELECT CAST(r.sheet_idx AS BIGINT) * 1000000000000 + r.row_id AS ROW_SEQ, r.NPSN, npsn_id(r.NPSN) AS NPSN_ID,
+            strip(r.NAMA_PESERTA) AS NAMA_PESERTA, r.ASAL_SEKOLAH, r.PELATIHAN,
+            CASE WHEN r.JENJANG = 'DIKMAS' THEN 'PKBM' ELSE r.JENJANG END AS JENJANG
+        FROM raw_pelatihan r
+        ANTI JOIN excluded_rows e ON e.sheet_idx = r.sheet_idx AND e.row_id = r.row_id""",
+    """CREATE VIEW dapodik AS
+        SELECT row_id, NPSN, npsn_id(NPSN) AS NPSN_ID, NAMA_LENGKAP FROM raw_dapodik""",
+]
+
+# Sekolah target rekap: $target_kabupaten kosong = semua; KABUPATEN NULL = kolom tidak ada di data_sekolah
+_RECAP_TARGET = """
+    sekolah_target AS (
+        SELECT * FROM sekolah
+        WHERE len($target_kabupaten::VARCHAR[]) = 0 OR KABUPATEN IS NULL
+            OR list_contains($target_kabupaten::VARCHAR[], KABUPATEN)
+    ),
+    npsn_status AS (
+        SELECT NPSN_ID, arg_min(STATUS, row_id) AS STATUS FROM sekolah_target WHERE NPSN_ID IS NOT NULL GROUP BY NPSN_ID
+    )"""
+
+
+# ==================================================================
+# === QUERY BERNAMA (parameter $nama) UNTUK LAPORAN REKAP & REKOMENDASI ===
+# ==================================================================
+# Semua hasil berupa frame kecil (hasil agregasi), bukan salinan tabel penuh.
+QUERIES = {
+    'recap_status_options': f"""
+        WITH {_RECAP_TARGET}
+        SELECT STATUS FROM sekolah_target WHERE STATUS IS NOT NULL GROUP BY STATUS ORDER BY min(row_id)""",
+
+    'recap_jenjang': f"""
+        WITH {_RECAP_TARGET}
+        SELECT DISTINCT TIPE FROM sekolah_target WHERE TIPE IS NOT NULL""",
+
+    # Kubus PELATIHAN x JENJANG x STATUS (+ baris $all_status = tanpa filter status)
+    'recap_cube': f"""
+        WITH {_RECAP_TARGET},
+        training AS (
+            SELECT p.PELATIHAN, p.JENJANG, p.NPSN_ID, p.NAMA_PESERTA, p.ASAL_SEKOLAH, s.STATUS
+            FROM pelatihan p JOIN npsn_status s ON p.NPSN_ID = s.NPSN_ID
+        ),
+        targets AS (
+            SELECT l.PELATIHAN, s.TIPE AS JENJANG, s.STATUS AS STATUS_VALUE, GROUPING(s.STATUS) AS SEMUA_STATUS,
+                SUM(CASE WHEN l.PELATIHAN = 'Pendidik' THEN s.GURU WHEN s.TIPE <> 'SLB' THEN s.KS_TENDIK ELSE 0 END) AS TARGET_PESERTA,
+                COUNT(DISTINCT s.NPSN_ID) AS TARGET_SEKOLAH
+            FROM sekolah_target s, (SELECT unnest($recap_pelatihan::VARCHAR[]) AS PELATIHAN) l
+            GROUP BY GROUPING SETS ((l.PELATIHAN, s.TIPE, s.STATUS), (l.PELATIHAN, s.TIPE))
+        ),
+        trained AS (
+            SELECT PELATIHAN, JENJANG, STATUS AS STATUS_VALUE, GROUPING(STATUS) AS SEMUA_STATUS,
+                COUNT(DISTINCT (NAMA_PESERTA, ASAL_SEKOLAH)) AS PESERTA_UNIK, COUNT(DISTINCT NPSN_ID) AS SEKOLAH_TERLATIH
+            FROM training
+            GROUP BY GROUPING SETS ((PELATIHAN, JENJANG, STATUS), (PELATIHAN, JENJANG))
+        )
+        SELECT
+            COALESCE(t.PELATIHAN, r.PELATIHAN) AS PELATIHAN, COALESCE(t.JENJANG, r.JENJANG) AS JENJANG,
+            CASE WHEN COALESCE(t.SEMUA_STATUS, r.SEMUA_STATUS) = 1 THEN $all_status
+                ELSE COALESCE(t.STATUS_VALUE, r.STATUS_VALUE) END AS STATUS,
+            CAST(COALESCE(t.TARGET_PESERTA, 0) AS BIGINT) AS TARGET_PESERTA,
+            CAST(COALESCE(r.PESERTA_UNIK, 0) AS BIGINT) AS PESERTA_UNIK,
+            CAST(COALESCE(t.TARGET_SEKOLAH, 0) AS BIGINT) AS TARGET_SEKOLAH,
+            CAST(COALESCE(r.SEKOLAH_TERLATIH, 0) AS BIGINT) AS SEKOLAH_TERLATIH
+        FROM targets t FULL OUTER JOIN trained r
+            ON t.PELATIHAN = r.PELATIHAN AND t.JENJANG = r.JENJANG AND t.SEMUA_STATUS = r.SEMUA_STATUS
+            AND t.STATUS_VALUE IS NOT DISTINCT FROM r.STATUS_VALUE""",
+
+    # Sekolah target yang belum punya peserta pelatihan $pelatihan di jenjangnya (urutan sheet, satu baris per jenjang x NPSN)
+    'recap_missing_schools': f"""
+        WITH {_RECAP_TARGET},
+        trained AS (
+            SELECT DISTINCT p.PELATIHAN, p.JENJANG, p.NPSN_ID
+            FROM pelatihan p SEMI JOIN npsn_status s ON p.NPSN_ID = s.NPSN_ID
+        )
+        SELECT s.TIPE AS JENJANG, s.NPSN, s.NAMA, s.KECAMATAN, s.STATUS
+        FROM sekolah_target s
+        WHERE s.NPSN_ID IS NOT NULL
+            AND (len($statuses::VARCHAR[]) = 0 OR list_contains($statuses::VARCHAR[], s.STATUS))
+            AND NOT EXISTS (
+                SELECT 1 FROM trained t WHERE t.PELATIHAN = $pelatihan AND t.JENJANG = s.TIPE AND t.NPSN_ID = s.NPSN_ID
+            )
+        QUALIFY row_number() OVER (PARTITION BY s.TIPE, s.NPSN ORDER BY s.row_id) = 1
+        ORDER BY s.row_id""",
+
+    # Sekolah yang punya peserta pelatihan + status/kecamatan/kabupaten (filter & pilihan sekolah tab Rekomendasi)
+    'reco_school_list': """
+        WITH first_training AS (
+            SELECT NPSN_ID, arg_min(NPSN, ROW_SEQ) AS NPSN, arg_min(ASAL_SEKOLAH, ROW_SEQ) AS ASAL_SEKOLAH, min(ROW_SEQ) AS ROW_SEQ
+            FROM pelatihan WHERE NPSN_ID IS NOT NULL GROUP BY NPSN_ID
+        )
+        SELECT f.NPSN_ID, f.NPSN, f.ASAL_SEKOLAH, s.STATUS, strip(replace(s.KECAMATAN, 'KEC. ', '')) AS KECAMATAN, s.KABUPATEN
+        FROM first_training f JOIN sekolah s ON f.NPSN_ID = s.NPSN_ID
+        WHERE s.STATUS IS NOT NULL AND s.KECAMATAN IS NOT NULL AND s.KABUPATEN IS NOT NULL
+        ORDER BY f.ROW_SEQ, s.row_id""",
+
+    # Jumlah orang Dapodik yang bisa dipakai untuk laporan rekomendasi (NPSN & NAMA_LENGKAP ada)
+    'dapodik_rows': """
+        SELECT count(*) FILTER (WHERE NPSN IS NOT NULL AND NAMA_LENGKAP IS NOT NULL) AS ROWS FROM dapodik""",
+}
+
+
+def _literal(text):
+    return "'" + text.replace("'", "''") + "'"
+
+
+# ==================================================================
+# === MESIN SQL TERTANAM (DuckDB) DI ATAS FILE SNAPSHOT ===
+# ==================================================================
+# Kolom yang dipakai dari file part Parquet versi snapshot yang diminta (`versions` = versi kunci cache)
+# disalin SEKALI ke tabel DuckDB (terkompresi, di-spill ke disk jika melebihi batas memori) saat objek dibuat.
+# Setelah itu query tidak lagi membaca file snapshot, jadi file part yang dihapus oleh sinkronisasi/compaction
+# tidak mengganggu engine yang masih di-cache atau query yang sedang berjalan di sesi lain.
+# Yang kembali ke Python hanya frame hasil yang kecil; setiap query memakai cursor sendiri sehingga
+# aman dipanggil dari banyak sesi sekaligus.
+class SnapshotQueries:
+    def __init__(self, store, sheet_names, participant_keys, scope=SUDIN_SCOPE, versions=None,
+                 threads=QUERY_THREADS, memory_mb=QUERY_MEMORY_MB):
+        self.store = store
+        self.versions = versions or {}
+        self.connection = duckdb.connect()
+        if threads:
+            self.connection.execute(f"SET threads = {int(threads)}")
+        self.connection.execute(f"SET memory_limit = '{int(memory_mb)}MB'")
+        self.connection.execute(f"SET temp_directory = {_literal(os.path.join(store.root, '_query_tmp'))}")
+
+        self.connection.execute("CREATE TABLE sudin_scope AS SELECT unnest($scope::VARCHAR[]) AS KABUPATEN", {'scope': list(scope)})
+        for macro in MACROS:
+            self.connection.execute(macro)
+
+        school_header = [col.strip().upper() for col in store.header('data_sekolah', self.versions.get('data_sekolah'))]
+        self.name_column = school_name_column(pd.DataFrame(columns=school_header))
+        self.school_columns = school_header
+        # Peta Sudin dibangun dulu dari seluruh provinsi, lalu hanya baris partisi scope yang disalin ke tabel mentah
+        self._create_table('sudin_map', SUDIN_MAP_TABLE, ['data_sekolah'], ['NPSN', 'KABUPATEN'])
+        self._create_table(
+            'raw_sekolah', f"SELECT * FROM raw WHERE {SCOPE_BY_KABUPATEN}",
+            ['data_sekolah'], SCHOOL_COLUMNS, {'NAMA': self.name_column}
+        )
+        self._create_table('raw_dapodik', f"SELECT * FROM raw WHERE {SCOPE_BY_NPSN}", ['data_dapodik_name'], DAPODIK_COLUMNS)
+        self._create_table('raw_pelatihan', f"SELECT * FROM raw WHERE {SCOPE_BY_NPSN}", sheet_names, TRAINING_COLUMNS)
+
+        # Baris blank/duplikat (status dari ParticipantKeySet, selaras dengan urutan baris sheet) disaring lewat anti-join
+        key_frames, (_, flags) = read_participant_keys(store, sheet_names, participant_keys, self.versions)
+        sizes = [len(key_frames[name]) for name in sheet_names]
+        excluded = flags != ROW_OK
+        excluded_rows = pd.DataFrame({
+            'sheet_idx': np.repeat(np.arange(len(sizes)), sizes)[excluded],
+            'row_id': np.concatenate([np.arange(n) for n in sizes] + [np.array([], dtype=np.int64)])[excluded],
+        })
+        self.connection.register('excluded_rows_df', excluded_rows)
+        self.connection.execute("CREATE TABLE excluded_rows AS SELECT * FROM excluded_rows_df")
+        self.connection.unregister('excluded_rows_df')
+
+        for view in VIEWS:
+            self.connection.execute(view)
+
+    def _create_table(self, table, query, sheet_names, columns, aliases=None):
+        # `query` membaca CTE `raw` = file part sheet: kolom c{i} -> nama kolom, row_id = nomor baris di sheet
+        # (urutan part + nomor baris di file). Hasilnya disaring saat file dibaca, baris lain tidak pernah disalin.
+        selects = []
+        for sheet_idx, sheet_name in enumerate(sheet_names):
+            version = self.versions.get(sheet_name)
+            header = [col.strip().upper() for col in self.store.header(sheet_name, version)]
+            wanted = [(name, name) for name in columns] + list((aliases or {}).items())
+            projection = ', '.join(
+                f'c{header.index(source)} AS "{name}"' if source in header else f'NULL::VARCHAR AS "{name}"'
+                for name, source in wanted
+            )
+            parts, offset = self.store.part_files(sheet_name, version), 0
+            for path, n_rows in parts:
+                selects.append(
+                    f"SELECT {sheet_idx} AS sheet_idx, file_row_number + {offset} AS row_id, {projection} "
+                    f"FROM read_parquet({_literal(path)}, file_row_number = true)"
+                )
+                offset += n_rows
+            if not parts:
+                selects.append(f"SELECT {sheet_idx} AS sheet_idx, NULL::BIGINT AS row_id, {projection} WHERE false")
+        self.connection.execute(f"CREATE TABLE {table} AS WITH raw AS ({' UNION ALL '.join(selects)}) {query}")
+
+    def run(self, name, **params):
+        with diagnostics.stage(f"query_{name}") as record:
+            cursor = self.connection.cursor()
+            try:
+                result = cursor.execute(QUERIES[name], params).df()
+            finally:
+                cursor.close()
+            record['rows'] = len(result)
+        return result
+
+
+# ==================================================================
+# === KUBUS REKAP DARI QUERY SQL ===
+# ==================================================================
+# Semua angka rekap (target peserta, peserta unik, target sekolah, sekolah yang sudah ikut) untuk setiap
+# PELATIHAN x STATUS x JENJANG dihitung sekali oleh query 'recap_cube' di atas snapshot; tab Rekap tinggal
+# mengambil irisan kubus ini. Filter beberapa status sekaligus = penjumlahan baris per status
+# (satu sekolah = satu status). Daftar sekolah yang belum ikut diambil sekali per
+# (pelatihan, filter status) untuk semua jenjang, lalu disimpan (hasilnya kecil) dan diiris per jenjang.
+class RecapQueries:
+    measures = ['TARGET_PESERTA', 'PESERTA_UNIK', 'TARGET_SEKOLAH', 'SEKOLAH_TERLATIH']
+
+    def __init__(self, queries, target_kabupaten):
+        self.queries = queries
+        self._missing = {}
+        self._lock = threading.Lock()
+        self.target_kabupaten = list(target_kabupaten)
+        self.name_column = queries.name_column
+        self.status_options = queries.run('recap_status_options', target_kabupaten=self.target_kabupaten)['STATUS'].tolist()
+        self.all_jenjang = sorted(queries.run('recap_jenjang', target_kabupaten=self.target_kabupaten)['TIPE'])
+        self.cube = queries.run(
+            'recap_cube', target_kabupaten=self.target_kabupaten, recap_pelatihan=RECAP_PELATIHAN, all_status=ALL_STATUS
+        )
+        self.detail_cols = [
+            c for c in ['NPSN', self.name_column, 'KECAMATAN', 'STATUS'] if c in queries.school_columns
+        ]
+
+    def jenjang_for(self, pelatihan):
+        if pelatihan == 'Pendidik':
+            return self.all_jenjang
+        return [j for j in self.all_jenjang if j != 'SLB']
+
+    def summary(self, pelatihan, statuses):
+        cube = self.cube[self.cube['PELATIHAN'] == pelatihan]
+        if statuses:
+            cube = cube[cube['STATUS'].isin(statuses)]
+        else:
+            cube = cube[cube['STATUS'] == ALL_STATUS]
+        return cube.groupby('JENJANG')[self.measures].sum().reindex(self.jenjang_for(pelatihan), fill_value=0)
+
+    def missing_schools(self, pelatihan, statuses, jenjang):
+        key = (pelatihan, tuple(statuses))
+        with self._lock:
+            missing = self._missing.get(key)
+        if missing is None:
+            missing = self.queries.run(
+                'recap_missing_schools', target_kabupaten=self.target_kabupaten, pelatihan=pelatihan, statuses=list(statuses)
+            ).rename(columns={'NAMA': self.name_column})
+            with self._lock:
+                self._missing[key] = missing
+        missing_df = missing.loc[missing['JENJANG'] == jenjang, self.detail_cols].reset_index(drop=True)
+        missing_df.index += 1
+        return missing_df
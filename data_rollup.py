@@ -0,0 +1,117 @@
+import threading
+
+import pandas as pd
+
+from data_partition import SUDIN_SCOPE, read_training_rows
+from data_pipeline import clean_training_data
+
+# Dimensi tren (kolom data pelatihan bersih) & periode agregasi (label di UI -> frekuensi pandas)
+ROLLUP_DIMENSIONS = ['PELATIHAN', 'JENJANG', 'KECAMATAN', 'STATUS_SEKOLAH']
+ROLLUP_FREQUENCIES = {'Harian': 'D', 'Mingguan': 'W', 'Bulanan': 'M'}
+DAILY_KEYS = ['TANGGAL'] + ROLLUP_DIMENSIONS + ['NPSN_ID']
+
+
+def daily_counts(df):
+    # Data bersih -> jumlah peserta per (hari, dimensi, sekolah). Baris tanpa TANGGAL valid tidak masuk tren.
+    df = df[df['TANGGAL'].notna()]
+    daily = pd.DataFrame({'TANGGAL': df['TANGGAL'].dt.normalize()})
+    for dimension in ROLLUP_DIMENSIONS:
+        daily[dimension] = df[dimension].astype(object).fillna('-')
+    daily['NPSN_ID'] = df['NPSN_ID']
+    return daily.groupby(DAILY_KEYS, dropna=False).size().rename('PESERTA').reset_index()
+
+
+def period_start(tanggal, freq):
+    return tanggal.dt.to_period(freq).dt.start_time
+
+
+def rollup_table(daily, freq, dimension):
+    # PESERTA = jumlah peserta, SEKOLAH = NPSN unik per (periode, PELATIHAN[, dimensi])
+    keys = [period_start(daily['TANGGAL'], freq).rename('PERIODE'), daily['PELATIHAN']]
+    if dimension != 'PELATIHAN':
+        keys.append(daily[dimension])
+    grouped = daily.groupby(keys)
+    return pd.DataFrame({'PESERTA': grouped['PESERTA'].sum(), 'SEKOLAH': grouped['NPSN_ID'].nunique()}).reset_index()
+
+
+# ==================================================================
+# === ROLLUP TREN PELATIHAN PER TANGGAL (inkremental) ===
+# ==================================================================
+# Tabel kecil per (periode, dimensi) untuk grafik tren di tab Rekap; grafik tidak pernah menyentuh data mentah.
+# Dasarnya tabel harian per (hari, dimensi, NPSN_ID): jumlah peserta bisa dijumlahkan, sekolah unik dihitung
+# ulang dari NPSN_ID. Setelah unggahan/refresh (sheet hanya di-append), hanya baris baru yang dibaca &
+# dibersihkan, digabung ke tabel harian, lalu hanya periode yang tersentuh baris baru yang dihitung ulang.
+# Sheet yang ditulis ulang (generation berubah), data_sekolah (peta Sudin) atau scope berubah -> bangun ulang penuh.
+# Baris baru tidak mengubah status baris lama di ParticipantKeySet (duplikat = kemunculan berikutnya), jadi hasil
+# inkremental sama dengan bangun ulang.
+class TrainingRollup:
+    def __init__(self):
+        self.state = None
+        self.rows = {}
+        self.daily = None
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def update(self, store, sheet_names, participant_keys, sudin_map, school_version, scope=SUDIN_SCOPE, versions=None):
+        # versions = {sheet: versi snapshot} yang dibaca (default: versi terbaru)
+        versions = versions or {}
+        state = {
+            'order': list(sheet_names),
+            'generations': {name: store.generation(name, versions.get(name)) for name in sheet_names},
+            'school_version': school_version, 'scope': list(scope),
+        }
+        with self._lock:
+            counts = {name: store.row_count(name, versions.get(name)) for name in sheet_names}
+            # Versi yang lebih pendek dari yang sudah digabung (sesi yang masih memegang versi lama) -> bangun ulang
+            extend = state == self.state and all(counts[name] >= self.rows[name] for name in sheet_names)
+            if extend and counts == self.rows:
+                return TrainingTrends(self.tables)
+            df_raw, row_keys, sizes = read_training_rows(
+                store, sheet_names, participant_keys, sudin_map, scope, first_rows=self.rows if extend else None,
+                versions=versions
+            )
+            df, _, _ = clean_training_data(df_raw, row_keys)
+            new_daily = daily_counts(df)
+            if extend:
+                self._extend(new_daily)
+            else:
+                self.daily = new_daily
+                self.tables = {
+                    (label, dimension): rollup_table(new_daily, freq, dimension)
+                    for label, freq in ROLLUP_FREQUENCIES.items() for dimension in ROLLUP_DIMENSIONS
+                }
+            self.state, self.rows = state, sizes
+            return TrainingTrends(self.tables)
+
+    def _extend(self, new_daily):
+        if new_daily.empty:
+            return
+        self.daily = pd.concat([self.daily, new_daily], ignore_index=True).groupby(
+            DAILY_KEYS, dropna=False
+        )['PESERTA'].sum().reset_index()
+        tables = {}
+        for label, freq in ROLLUP_FREQUENCIES.items():
+            touched = period_start(new_daily['TANGGAL'], freq).unique()
+            daily = self.daily[period_start(self.daily['TANGGAL'], freq).isin(touched)]
+            for dimension in ROLLUP_DIMENSIONS:
+                table = self.tables[(label, dimension)]
+                table = pd.concat([table[~table['PERIODE'].isin(touched)], rollup_table(daily, freq, dimension)], ignore_index=True)
+                # Tabel lama tidak diubah di tempat: sesi lain mungkin masih memegang TrainingTrends versi sebelumnya
+                tables[(label, dimension)] = table.sort_values(list(table.columns[:-2]), ignore_index=True)
+        self.tables = tables
+
+
+class TrainingTrends:
+    # Hasil rollup satu versi data (read-only, dipakai bersama semua sesi)
+    def __init__(self, tables):
+        self.tables = tables
+
+    @property
+    def points(self):
+        return sum(len(table) for table in self.tables.values())
+
+    def series(self, frequency, dimension, pelatihan=None):
+        table = self.tables[(frequency, dimension)]
+        if pelatihan is not None:
+            table = table[table['PELATIHAN'] == pelatihan]
+        return table
@@ -0,0 +1,475 @@
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import gspread
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from google.oauth2.service_account import Credentials
+
+import diagnostics
+
+# Lokasi snapshot lokal (bisa diganti lewat environment variable)
+SNAPSHOT_DIR = os.environ.get("SIPADU_SNAPSHOT_DIR", ".snapshot")
+READONLY_SCOPES = [
+    'https://www.googleapis.com/auth/spreadsheets.readonly',
+    'https://www.googleapis.com/auth/drive.metadata.readonly',  # untuk modifiedTime (deteksi perubahan murah)
+]
+WRITE_SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+
+# Interval (detik) pengecekan perubahan data oleh refresher di latar belakang
+REFRESH_INTERVAL = int(os.environ.get("SIPADU_REFRESH_INTERVAL", "300"))
+# Interval (detik) rekonsiliasi penuh (baris yang diubah/dihapus langsung di Sheet); 0 = hanya lewat tombol
+RECONCILE_INTERVAL = int(os.environ.get("SIPADU_RECONCILE_INTERVAL", "3600"))
+
+# Jumlah file part maksimum sebelum digabung ulang menjadi satu file
+MAX_PARTS = 32
+# Jumlah versi manifest per sheet yang dipertahankan; file part baru dihapus setelah tidak dirujuk versi mana pun
+# (pembaca yang sedang memuat versi lama / cache yang dibangun dari versi lama tidak kehilangan filenya)
+KEEP_VERSIONS = int(os.environ.get("SIPADU_SNAPSHOT_KEEP_VERSIONS", "3"))
+
+
+def column_letter(n_cols):
+    # 1 -> 'A', 28 -> 'AB'
+    return gspread.utils.rowcol_to_a1(1, max(1, n_cols)).rstrip('0123456789')
+
+
+def exceeds_grid_limits(error):
+    # Error 400 Sheets API untuk range yang dimulai setelah baris terakhir grid worksheet
+    return error.code == 400 and 'exceeds grid limits' in str(error.error.get('message', ''))
+
+
+# ==================================================================
+# === SUMBER DATA (Pluggable) ===
+# ==================================================================
+# Baris dihitung mulai dari 1 seperti di Google Sheet (baris 1 = header).
+# Satu range ditulis sebagai tuple (sheet_name, first_row, last_row, n_cols):
+# last_row=None berarti sampai baris terakhir yang berisi data, n_cols=None berarti semua kolom.
+class SheetSource:
+    max_workers = 8
+
+    def read_range(self, sheet_name, first_row, last_row=None, n_cols=None):
+        raise NotImplementedError
+
+    def read_ranges(self, ranges):
+        # Default: ambil semua range secara paralel, total waktu ~ range yang paling lambat
+        if len(ranges) <= 1:
+            return [self.read_range(*r) for r in ranges]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(ranges))) as pool:
+            return list(pool.map(lambda r: self.read_range(*r), ranges))
+
+    def read_header(self, sheet_name):
+        rows = self.read_range(sheet_name, 1, 1)
+        return list(rows[0]) if rows else []
+
+    def modified_time(self):
+        # Penanda waktu perubahan terakhir spreadsheet; None = tidak diketahui (selalu sinkronisasi)
+        return None
+
+    def append_rows(self, sheet_name, rows):
+        raise NotImplementedError
+
+
+class GspreadSource(SheetSource):
+    # Otorisasi & open_by_key hanya dilakukan sekali per objek; semua pembacaan memakai client yang sama
+    def __init__(self, json_keyfile_str, spreadsheet_id, scopes=READONLY_SCOPES):
+        creds = Credentials.from_service_account_info(json.loads(json_keyfile_str), scopes=scopes)
+        self.client = gspread.authorize(creds)
+        self.spreadsheet = self.client.open_by_key(spreadsheet_id)
+        self._worksheets = {}
+
+    def worksheet(self, sheet_name):
+        if sheet_name not in self._worksheets:
+            self._worksheets[sheet_name] = self.spreadsheet.worksheet(sheet_name)
+        return self._worksheets[sheet_name]
+
+    def modified_time(self):
+        # Satu request metadata Drive yang kecil; jika scope/izin tidak ada, refresher tetap sinkronisasi biasa
+        try:
+            return self.spreadsheet.get_lastUpdateTime()
+        except Exception:
+            return None
+
+    def append_rows(self, sheet_name, rows):
+        # Butuh objek yang dibuat dengan WRITE_SCOPES
+        self.worksheet(sheet_name).append_rows(rows, value_input_option='USER_ENTERED')
+
+    @staticmethod
+    def _a1(sheet_name, first_row, last_row, n_cols):
+        if n_cols is not None:
+            # Range terbuka ke bawah (contoh: A120:Q) -> hanya baris baru yang diunduh
+            end = f"{column_letter(n_cols)}{last_row or ''}"
+            return gspread.utils.absolute_range_name(sheet_name, f"A{first_row}:{end}")
+        if last_row is not None:
+            return gspread.utils.absolute_range_name(sheet_name, f"{first_row}:{last_row}")
+        return gspread.utils.absolute_range_name(sheet_name)
+
+    def read_range(self, sheet_name, first_row, last_row=None, n_cols=None):
+        return self.read_ranges([(sheet_name, first_row, last_row, n_cols)])[0]
+
+    def read_ranges(self, ranges):
+        # Semua range (semua sheet) diambil dalam SATU request values:batchGet
+        try:
+            response = self.spreadsheet.values_batch_get([self._a1(*r) for r in ranges])
+        except gspread.exceptions.APIError as e:
+            if not exceeds_grid_limits(e):
+                raise
+            # Satu range di luar grid (sheet memendek) menggagalkan seluruh batch: ulangi per range,
+            # range di luar grid = tidak ada baris
+            if len(ranges) == 1:
+                return [[]]
+            return [self.read_ranges([r])[0] for r in ranges]
+        results = []
+        for (sheet_name, first_row, last_row, n_cols), value_range in zip(ranges, response.get('valueRanges', [])):
+            rows = [list(row) for row in value_range.get('values', [])]
+            if n_cols is None and last_row is None and first_row > 1:
+                rows = rows[first_row - 1:]  # seluruh sheet diambil, potong di sisi klien
+            results.append(rows)
+        return results
+
+
+class InMemorySheetSource(SheetSource):
+    # Pengganti gspread untuk pengujian: {nama_sheet: [[header...], [baris...], ...]}
+    def __init__(self, sheets):
+        self.sheets = {name: [[str(v) for v in row] for row in rows] for name, rows in sheets.items()}
+        self.rows_read = 0  # jumlah baris data yang pernah diambil (untuk cek sinkronisasi inkremental)
+        self.modified = 0  # naikkan saat isi sheet diubah (meniru modifiedTime Drive)
+
+    def read_range(self, sheet_name, first_row, last_row=None, n_cols=None):
+        rows = self.sheets[sheet_name][first_row - 1:last_row]
+        if n_cols is not None:
+            rows = [row[:n_cols] for row in rows]
+        self.rows_read += len(rows)
+        return [list(row) for row in rows]
+
+    def modified_time(self):
+        return self.modified
+
+    def append_rows(self, sheet_name, rows):
+        self.sheets[sheet_name].extend([str(v) for v in row] for row in rows)
+        self.modified += 1
+
+
+# ==================================================================
+# === SNAPSHOT LOKAL (Parquet) DENGAN SINKRONISASI INKREMENTAL ===
+# ==================================================================
+# Setiap worksheet disimpan sebagai beberapa file part Parquet + manifest.json:
+#   {"header": [...], "row_count": n, "parts": ["part-00000.parquet", ...], "version": k, "generation": g}
+# Sinkronisasi biasa hanya mengambil baris setelah `row_count` (baris yang baru di-append).
+# Jika header berubah, sheet diunduh ulang seluruhnya.
+# Setiap versi juga disimpan sebagai manifest-<versi>.json (KEEP_VERSIONS terakhir) agar load/part_files bisa
+# membaca versi tertentu; file part lama baru dihapus setelah versi terakhir yang merujuknya dibuang.
+# Rekonsiliasi (full=True) mengunduh seluruh sheet dan membandingkannya dengan snapshot: baris lama yang
+# diubah/dihapus langsung di Google Sheet -> sheet dibangun ulang; jika tidak ada, hanya baris baru yang ditambahkan.
+class SnapshotStore:
+    def __init__(self, source, root=SNAPSHOT_DIR):
+        self.source = source
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _sheet_dir(self, sheet_name):
+        return os.path.join(self.root, re.sub(r'[^\w\-]+', '_', sheet_name))
+
+    def read_manifest(self, sheet_name):
+        path = os.path.join(self._sheet_dir(sheet_name), 'manifest.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def read_manifest_version(self, sheet_name, version):
+        path = os.path.join(self._sheet_dir(sheet_name), f"manifest-{version:06d}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_manifest(self, sheet_name, manifest):
+        # Tulis ke file sementara lalu os.replace agar pembaca tidak pernah melihat manifest setengah jadi
+        sheet_dir = self._sheet_dir(sheet_name)
+        for file_name in (f"manifest-{manifest['version']:06d}.json", 'manifest.json'):
+            tmp_path = os.path.join(sheet_dir, file_name + '.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, os.path.join(sheet_dir, file_name))
+
+    def _write_part(self, sheet_name, manifest, table):
+        sheet_dir = self._sheet_dir(sheet_name)
+        os.makedirs(sheet_dir, exist_ok=True)
+        part_name = f"part-{manifest['next_part']:05d}.parquet"
+        manifest['next_part'] += 1
+        pq.write_table(table, os.path.join(sheet_dir, part_name))
+        manifest['parts'].append(part_name)
+
+    def _prune(self, sheet_name):
+        # Buang manifest versi lama (sisakan KEEP_VERSIONS), lalu file part yang tidak dirujuk manifest tersisa
+        sheet_dir = self._sheet_dir(sheet_name)
+        versions = sorted(f for f in os.listdir(sheet_dir) if re.fullmatch(r'manifest-\d+\.json', f))
+        for file_name in versions[:-KEEP_VERSIONS]:
+            os.remove(os.path.join(sheet_dir, file_name))
+        referenced = set()
+        for file_name in versions[-KEEP_VERSIONS:] + ['manifest.json']:
+            with open(os.path.join(sheet_dir, file_name), encoding='utf-8') as f:
+                referenced.update(json.load(f)['parts'])
+        for file_name in os.listdir(sheet_dir):
+            if file_name.endswith('.parquet') and file_name not in referenced:
+                os.remove(os.path.join(sheet_dir, file_name))
+
+    @staticmethod
+    def _rows_to_table(rows, n_cols):
+        # Semua kolom disimpan sebagai string (sama seperti tampilan di Sheet);
+        # nama kolom asli ada di manifest karena header Sheet bisa mengandung nama ganda.
+        padded = [list(row[:n_cols]) + [''] * (n_cols - len(row)) for row in rows]
+        columns = list(zip(*padded)) if padded else [()] * n_cols
+        return pa.table(
+            [pa.array(col, type=pa.string()) for col in columns],
+            names=[f"c{i}" for i in range(n_cols)]
+        )
+
+    def sync(self, sheet_name, full=False):
+        return self.sync_many([sheet_name], full=full)[sheet_name]
+
+    def sync_many(self, sheet_names, full=False):
+        # Sinkronisasi beberapa sheet sekaligus dalam satu batch request ke sumber.
+        # Sheet yang sudah punya snapshot: ambil header + baris mulai dari baris TERAKHIR yang sudah tersimpan
+        # (baris jangkar; range yang mulai tepat setelah baris terakhir bisa di luar grid sheet -> error 400).
+        # Sheet baru (atau full=True = rekonsiliasi): ambil seluruh isi sheet.
+        with self._lock:
+            manifests = {name: self.read_manifest(name) for name in sheet_names}
+            ranges = []
+            for name in sheet_names:
+                manifest = manifests[name]
+                if full or manifest is None:
+                    ranges.append((name, 1, None, None))
+                else:
+                    ranges.append((name, 1, 1, None))
+                    ranges.append((name, manifest['row_count'] + 1, None, len(manifest['header'])))
+            results = iter(self.source.read_ranges(ranges))
+
+            fetched, changed = {}, []
+            for name in sheet_names:
+                manifest = manifests[name]
+                if full or manifest is None:
+                    fetched[name] = self._reconcile(name, manifest, next(results))
+                else:
+                    header_rows, rows = next(results), next(results)
+                    header = list(header_rows[0]) if header_rows else []
+                    # Header berubah, atau baris jangkar hilang/berbeda (baris lama dihapus/diubah) -> unduh ulang
+                    if header != manifest['header'] or not rows or self._padded(rows[0], len(header)) != self._last_row(name, manifest):
+                        changed.append(name)
+                    else:
+                        fetched[name] = (header, rows[1:], False)
+            if changed:
+                full_values = self.source.read_ranges([(name, 1, None, None) for name in changed])
+                for name, values in zip(changed, full_values):
+                    fetched[name] = self._reconcile(name, manifests[name], values)
+
+            return {
+                name: self._apply(name, manifests[name], *fetched[name])
+                for name in sheet_names
+            }
+
+    def _reconcile(self, sheet_name, manifest, values):
+        header, rows = (values[0] if values else []), values[1:]
+        if manifest is not None and self._unchanged(sheet_name, manifest, header, rows):
+            # Tidak ada baris lama yang berubah: versi & generation tetap, cache tidak dibangun ulang
+            return header, rows[manifest['row_count']:], False
+        return header, rows, True
+
+    @staticmethod
+    def _padded(row, n_cols):
+        return [str(v) for v in row[:n_cols]] + [''] * (n_cols - len(row))
+
+    def _last_row(self, sheet_name, manifest):
+        # Baris data terakhir di snapshot (header jika sheet belum punya baris data)
+        if not manifest['row_count']:
+            return self._padded(manifest['header'], len(manifest['header']))
+        part = pq.ParquetFile(os.path.join(self._sheet_dir(sheet_name), manifest['parts'][-1]))
+        table = part.read_row_group(part.num_row_groups - 1)
+        return [table.column(i)[table.num_rows - 1].as_py() for i in range(table.num_columns)]
+
+    def _unchanged(self, sheet_name, manifest, header, rows):
+        # Snapshot = awalan dari isi sheet yang baru diunduh (sejak sync terakhir sheet hanya di-append)
+        if [str(v) for v in header] != manifest['header'] or len(rows) < manifest['row_count']:
+            return False
+        stored = self._read_table(sheet_name, manifest)
+        return stored.equals(self._rows_to_table(rows[:manifest['row_count']], len(manifest['header'])))
+
+    def _apply(self, sheet_name, manifest, header, rows, rebuild):
+        header = [str(v) for v in header]
+        if rebuild:
+            previous = manifest or {}
+            # `generation` naik setiap kali sheet dibangun ulang (isi lama bisa berubah, bukan sekadar append)
+            manifest = {
+                'header': header, 'row_count': 0, 'parts': [],
+                'next_part': previous.get('next_part', 0), 'version': previous.get('version', 0),
+                'generation': previous.get('generation', 0) + 1
+            }
+        if rows:
+            self._write_part(sheet_name, manifest, self._rows_to_table(rows, len(header)))
+            manifest['row_count'] += len(rows)
+        if rebuild or rows:
+            if len(manifest['parts']) > MAX_PARTS:
+                self._compact(sheet_name, manifest)
+            manifest['version'] += 1
+            os.makedirs(self._sheet_dir(sheet_name), exist_ok=True)
+            self._write_manifest(sheet_name, manifest)
+            self._prune(sheet_name)
+        return manifest['version']
+
+    def _compact(self, sheet_name, manifest):
+        table = self._read_table(sheet_name, manifest)
+        manifest['parts'] = []
+        self._write_part(sheet_name, manifest, table)
+
+    def _read_table(self, sheet_name, manifest):
+        n_cols = len(manifest['header'])
+        tables = [pq.read_table(os.path.join(self._sheet_dir(sheet_name), part)) for part in manifest['parts']]
+        if not tables:
+            return self._rows_to_table([], n_cols)
+        return pa.concat_tables(tables)
+
+    def version(self, sheet_name):
+        manifest = self.read_manifest(sheet_name)
+        return manifest['version'] if manifest else 0
+
+    def generation(self, sheet_name, version=None):
+        manifest = self.read_manifest(sheet_name) if version is None else self._manifest(sheet_name, version)
+        return manifest.get('generation', 0) if manifest else 0
+
+    def row_count(self, sheet_name, version=None):
+        return self._manifest(sheet_name, version)['row_count']
+
+    def header(self, sheet_name, version=None):
+        return self._manifest(sheet_name, version)['header']
+
+    def _manifest(self, sheet_name, version=None):
+        # version = versi tertentu (mis. versi yang menjadi kunci cache); jika sudah dibuang, versi terbaru
+        if version is not None:
+            manifest = self.read_manifest_version(sheet_name, version)
+            if manifest is not None:
+                return manifest
+        manifest = self.read_manifest(sheet_name)
+        if manifest is None:
+            self.sync(sheet_name)
+            manifest = self.read_manifest(sheet_name)
+        return manifest
+
+    def part_files(self, sheet_name, version=None):
+        # (path, jumlah baris) setiap file part sesuai urutan baris sheet (untuk dibaca langsung, mis. oleh DuckDB)
+        manifest = self._manifest(sheet_name, version)
+        paths = [os.path.join(self._sheet_dir(sheet_name), part) for part in manifest['parts']]
+        return [(path, pq.ParquetFile(path).metadata.num_rows) for path in paths]
+
+    def load(self, sheet_name, columns=None, rows=None, version=None):
+        # columns = nama kolom yang dibaca (dicocokkan setelah strip + upper, kemunculan pertama; yang tidak ada dilewati).
+        # rows = mask bool sepanjang row_count -> hanya baris True yang dimuat. Mask diterapkan per file part,
+        # sehingga memori puncak = satu part + baris yang lolos, bukan seluruh sheet.
+        manifest = self._manifest(sheet_name, version)
+        header = manifest['header']
+        positions = list(range(len(header)))
+        if columns is not None:
+            normalized = [col.strip().upper() for col in header]
+            positions = [normalized.index(name) for name in columns if name in normalized]
+        names = [f"c{i}" for i in positions]
+        tables, offset = [], 0
+        for part in manifest['parts']:
+            path = os.path.join(self._sheet_dir(sheet_name), part)
+            if rows is not None:
+                # Part yang tidak punya satu pun baris terpilih dilewati tanpa dibaca (cukup metadata jumlah baris)
+                n_rows = pq.ParquetFile(path).metadata.num_rows
+                if not np.any(rows[offset:offset + n_rows]):
+                    offset += n_rows
+                    continue
+            table = pq.read_table(path, columns=names)
+            n_rows = table.num_rows
+            if rows is not None:
+                # Baris yang di-append setelah mask dihitung (refresh di tengah pembacaan) tidak dimuat
+                keep = np.zeros(n_rows, dtype=bool)
+                part_rows = rows[offset:offset + n_rows]
+                keep[:len(part_rows)] = part_rows
+                table = table.filter(pa.array(keep))
+            offset += n_rows
+            tables.append(table)
+        table = pa.concat_tables(tables) if tables else self._rows_to_table([], len(header)).select(names)
+        df = table.to_pandas()
+        df.columns = [header[i] for i in positions]
+        return df
+
+
+# ==================================================================
+# === REFRESH DI LATAR BELAKANG (stale-while-revalidate) ===
+# ==================================================================
+# Halaman selalu membaca `versions` (snapshot lokal yang sudah ada) dan tidak pernah menunggu download.
+# Thread latar belakang mengecek modifiedTime spreadsheet setiap `interval` detik; jika berubah,
+# sync_many mengambil hanya baris baru per sheet, lalu dict versi diganti sekaligus (atomic swap).
+# Setiap `reconcile_interval` detik (dan saat tombol "Refresh Data") dilakukan rekonsiliasi penuh:
+# seluruh sheet diunduh & dibandingkan, sehingga baris yang diubah/dihapus di Sheet ikut masuk snapshot.
+# Sesi yang sedang berjalan tetap memakai cache versi lama sampai rerun berikutnya.
+class SnapshotRefresher:
+    def __init__(self, store, sheet_names, interval=REFRESH_INTERVAL, reconcile_interval=RECONCILE_INTERVAL):
+        self.store = store
+        self.sheet_names = list(sheet_names)
+        self.interval = interval
+        self.reconcile_interval = reconcile_interval
+        self.last_modified = None
+        self.reconciled_modified = None
+        self.last_reconciled = 0  # snapshot dari proses sebelumnya direkonsiliasi pada siklus pertama
+        self.last_checked = None
+        self.last_error = None
+        self._wake = threading.Event()
+        self._force = False
+        self._full = False
+        self._lock = threading.Lock()
+        if any(store.read_manifest(name) is None for name in self.sheet_names):
+            # Belum ada snapshot sama sekali: sinkronisasi pertama harus ditunggu
+            self.refresh(force=True, full=True)
+        else:
+            self.versions = {name: store.version(name) for name in self.sheet_names}
+        self._thread = threading.Thread(target=self._run, name='snapshot-refresher', daemon=True)
+        self._thread.start()
+
+    def refresh(self, force=False, sheet_names=None, full=False):
+        # full=True = rekonsiliasi penuh (sync_many(full=True)); force=True = tanpa cek modifiedTime.
+        # Mengembalikan True jika ada sheet yang versinya berubah
+        with self._lock, diagnostics.run('snapshot_refresh_full' if full else 'snapshot_refresh'):
+            with diagnostics.stage('modified_time'):
+                modified = self.store.source.modified_time()
+            self.last_checked = time.time()
+            unchanged_since = self.reconciled_modified if full else self.last_modified
+            if not force and modified is not None and modified == unchanged_since:
+                return False
+            names = self.sheet_names if sheet_names is None else list(sheet_names)
+            with diagnostics.stage('sync_many', rows=len(names)):
+                synced = self.store.sync_many(names, full=full)
+            previous = getattr(self, 'versions', {})
+            self.versions = {**previous, **synced}
+            if sheet_names is None:
+                self.last_modified = modified
+                if full:
+                    self.reconciled_modified, self.last_reconciled = modified, time.time()
+            return any(previous.get(name) != version for name, version in synced.items())
+
+    def request_refresh(self, force=False, full=False):
+        # Dipanggil dari tombol "Refresh Data": bangunkan thread, jangan menunggu
+        self._force = self._force or force
+        self._full = self._full or full
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            force, self._force = self._force, False
+            full, self._full = self._full, False
+            if self.reconcile_interval and time.time() - self.last_reconciled >= self.reconcile_interval:
+                full = True
+            try:
+                self.refresh(force=force, full=full)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = e
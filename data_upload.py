@@ -0,0 +1,195 @@
+import hashlib
+import io
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from data_pipeline import PARTICIPANT_KEYS, ROW_BLANK, ROW_OK, normalize_columns
+from data_store import SNAPSHOT_DIR
+
+# Progress unggahan disimpan di sini agar unggahan yang gagal bisa dilanjutkan
+UPLOAD_DIR = os.path.join(SNAPSHOT_DIR, 'uploads')
+
+CHUNK_ROWS = 5000   # baris per potongan saat membaca file
+BATCH_ROWS = 500    # baris per request append ke Google Sheet
+MAX_RETRIES = 5
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# Detik sebelum job yang sudah selesai kedaluwarsa (file yang sama boleh diunggah lagi sebagai job baru)
+DONE_TTL = int(os.environ.get("SIPADU_UPLOAD_DONE_TTL", "86400"))
+
+
+# ==================================================================
+# === PEMBACAAN FILE UNGGAHAN PER POTONGAN ===
+# ==================================================================
+# Semua nilai dibaca sebagai teks (NPSN berawalan 0 tidak berubah jadi angka), sel kosong = ''.
+def read_upload_chunks(file, file_name, chunk_rows=CHUNK_ROWS):
+    # Dibaca lewat salinan buffer agar file unggahan asli tidak ikut ditutup jika pembacaan berhenti di tengah
+    file = io.BytesIO(file.getvalue())
+    if file_name.lower().endswith('.csv'):
+        for chunk in pd.read_csv(file, sep=';', dtype=str, keep_default_na=False, chunksize=chunk_rows):
+            yield chunk
+        return
+
+    # Excel dibaca baris per baris (read_only) tanpa memuat seluruh workbook ke memori
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = ['' if v is None else str(v) for v in next(rows, ())]
+        n_cols = len(header)
+        batch = []
+        for row in rows:
+            values = ['' if v is None else str(v) for v in row[:n_cols]]
+            if not any(values):
+                continue  # baris kosong di akhir sheet
+            batch.append(values + [''] * (n_cols - len(values)))
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch or n_cols:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        workbook.close()
+
+
+def file_digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def is_retryable(error):
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status in RETRY_STATUS or isinstance(error, (OSError, TimeoutError))
+
+
+def append_with_backoff(source, sheet_name, rows, retries=MAX_RETRIES, base_delay=1.0, sleep=time.sleep):
+    # Kuota / error sementara Sheets API: tunggu 1s, 2s, 4s, ... lalu coba lagi
+    for attempt in range(retries):
+        try:
+            return source.append_rows(sheet_name, rows)
+        except Exception as e:
+            if attempt == retries - 1 or not is_retryable(e):
+                raise
+            sleep(base_delay * 2 ** attempt)
+
+
+# ==================================================================
+# === UNGGAHAN BERTAHAP YANG BISA DILANJUTKAN ===
+# ==================================================================
+# Satu job = satu file (sha1 isi file) untuk satu sheet. Setiap batch yang berhasil dikirim
+# langsung dicatat di file progress (posisi baris file yang sudah diproses); jika gagal di tengah,
+# menjalankan ulang job yang sama melewati baris tersebut dan melanjutkan dari batch berikutnya.
+# `row_filter(potongan) -> mask bool` menentukan baris yang dikirim (sisanya dihitung sebagai ditolak).
+# `seed(potongan)` menerima baris yang sudah diproses pada percobaan sebelumnya (saat melanjutkan), agar
+# filter yang menyimpan state (duplikat di dalam file) melihat riwayat yang sama dengan unggahan tanpa putus.
+# Job yang sudah selesai kedaluwarsa setelah `done_ttl` detik, atau bisa diulang lewat reset().
+class UploadJob:
+    def __init__(self, source, sheet_name, digest, root=UPLOAD_DIR, batch_rows=BATCH_ROWS, sleep=time.sleep,
+                 done_ttl=DONE_TTL):
+        self.source = source
+        self.sheet_name = sheet_name
+        self.digest = digest
+        self.batch_rows = batch_rows
+        self.sleep = sleep
+        self.path = os.path.join(root, f"{sheet_name}-{digest[:16]}.json")
+        self.reset()
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                progress = json.load(f)
+            if not progress['done'] or time.time() - progress.get('finished', 0) < done_ttl:
+                self.progress = progress
+
+    def reset(self):
+        # Mulai dari baris pertama file lagi (progress di disk ditimpa saat batch pertama terkirim)
+        self.progress = {
+            'sheet': self.sheet_name, 'digest': self.digest, 'file_rows': 0, 'appended_rows': 0,
+            'rejected_rows': 0, 'done': False
+        }
+
+    @property
+    def appended_rows(self):
+        return self.progress['appended_rows']
+
+    @property
+    def rejected_rows(self):
+        return self.progress['rejected_rows']
+
+    @property
+    def done(self):
+        return self.progress['done']
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.progress, f)
+        os.replace(tmp_path, self.path)
+
+    def _advance(self, file_rows, appended):
+        # Baris file yang dilewati tanpa dikirim = ditolak oleh row_filter
+        self.progress['rejected_rows'] += file_rows - self.progress['file_rows'] - appended
+        self.progress['appended_rows'] += appended
+        self.progress['file_rows'] = file_rows
+        self._save()
+
+    def run(self, chunks, columns, row_filter=None, on_progress=None, seed=None):
+        seen = 0  # posisi baris file di awal potongan saat ini
+        for chunk in chunks:
+            start = max(0, self.progress['file_rows'] - seen)
+            if seed is not None and start:
+                seed(chunk.iloc[:start])
+            if start < len(chunk):
+                part = chunk.iloc[start:]
+                keep = np.ones(len(part), dtype=bool) if row_filter is None else np.asarray(row_filter(part), dtype=bool)
+                positions = seen + start + np.flatnonzero(keep)
+                rows = part[columns][keep].values.tolist()
+                for b in range(0, len(rows), self.batch_rows):
+                    batch = rows[b:b + self.batch_rows]
+                    append_with_backoff(self.source, self.sheet_name, batch, sleep=self.sleep)
+                    self._advance(int(positions[b + len(batch) - 1]) + 1, len(batch))
+                    if on_progress:
+                        on_progress(self.appended_rows)
+                self._advance(seen + len(chunk), 0)
+            seen += len(chunk)
+        self.progress['done'] = True
+        self.progress['finished'] = time.time()
+        self._save()
+        return self.appended_rows
+
+
+# ==================================================================
+# === FILTER BARIS UNGGAHAN (kosong & duplikat) ===
+# ==================================================================
+# Dipakai sebagai row_filter + seed UploadJob. Baris kosong (nama/NPSN) & duplikat (sudah ada di
+# ParticipantKeySet / berulang di file yang sama) ditolak sebelum dikirim, dicek secara vektor per potongan.
+# Baris yang ditolak (dengan ALASAN) dikumpulkan di `rejected` untuk ditampilkan.
+class UploadRowFilter:
+    def __init__(self, participant_keys):
+        self.participant_keys = participant_keys
+        self.accepted = []
+        self.rejected = []
+
+    def _check(self, part):
+        normalized = normalize_columns(part)
+        if any(col not in normalized.columns for col in PARTICIPANT_KEYS):
+            return None, None
+        seen = np.concatenate(self.accepted) if self.accepted else None
+        hashes, flags = self.participant_keys.check(normalized, seen=seen)
+        self.accepted.append(hashes[flags == ROW_OK])
+        return hashes, flags
+
+    def seed(self, part):
+        # Baris yang sudah terkirim sebelum unggahan terputus: hanya mengisi ulang hash yang diterima
+        self._check(part)
+
+    def __call__(self, part):
+        _, flags = self._check(part)
+        if flags is None:
+            return np.ones(len(part), dtype=bool)
+        rejected = flags != ROW_OK
+        self.rejected.append(part[rejected].assign(
+            ALASAN=np.where(flags[rejected] == ROW_BLANK, 'Nama/NPSN kosong', 'Duplikat')
+        ))
+        return ~rejected
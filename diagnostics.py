@@ -0,0 +1,194 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    import resource
+except ImportError:  # Windows: peak memory tidak dicatat
+    resource = None
+
+# Log terstruktur (1 baris JSON per rerun) ke logger ini; opsional juga ke file JSON-lines
+LOG_PATH = os.environ.get("SIPADU_DIAGNOSTICS_LOG")
+# Jumlah rerun terakhir yang disimpan di memori untuk panel admin
+MAX_RUNS = int(os.environ.get("SIPADU_DIAGNOSTICS_RUNS", "200"))
+
+logger = logging.getLogger('sipadu.diagnostics')
+
+_current = contextvars.ContextVar('sipadu_diagnostics_run', default=None)
+_runs = deque(maxlen=MAX_RUNS)
+_runs_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+
+def _rss_mb():
+    # RSS saat ini dari /proc (Linux); None jika tidak tersedia
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_mb():
+    # Puncak RSS proses sejak start (ru_maxrss dalam KB di Linux)
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# ==================================================================
+# === PENCATATAN PER RERUN (waktu, baris, cache hit/miss, memori) ===
+# ==================================================================
+# Satu Run = satu eksekusi script (rerun) atau satu siklus refresher di thread latar belakang.
+# Setiap tahap hanya mencatat perf_counter + getrusage di awal/akhir -> overhead mikrodetik,
+# aman dibiarkan aktif di produksi. Run aktif disimpan di ContextVar (per thread/sesi Streamlit).
+class Run:
+    def __init__(self, label):
+        self.label = label
+        self.started = time.time()
+        self.stages = []
+        self._stack = []
+        self._start = time.perf_counter()
+        self.peak_start_mb = _peak_mb()
+
+    @contextmanager
+    def stage(self, name, rows=None, cached=False):
+        record = {'stage': name, 'depth': len(self._stack), 'rows': rows, 'cache': 'hit' if cached else None}
+        self._stack.append(record)
+        start = time.perf_counter()
+        record['offset'] = round(start - self._start, 6)
+        try:
+            yield record
+        except BaseException as e:
+            record['error'] = type(e).__name__
+            raise
+        finally:
+            record['seconds'] = round(time.perf_counter() - start, 6)
+            record['rss_mb'] = _rss_mb()
+            record['peak_mb'] = _peak_mb()
+            self._stack.pop()
+            self.stages.append(record)
+
+    def cache_miss(self):
+        # Dipanggil dari dalam body fungsi ber-cache: body hanya berjalan saat cache miss
+        for record in reversed(self._stack):
+            if record['cache'] is not None:
+                record['cache'] = 'miss'
+                return
+
+    def summary(self):
+        stages = self.stages
+        rss = [r['rss_mb'] for r in self.stages if r['rss_mb'] is not None]
+        peak = _peak_mb()
+        return {
+            'run': self.label,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'seconds': round(time.perf_counter() - self._start, 6),
+            'max_rss_mb': max(rss) if rss else None,
+            'peak_mb': peak,
+            # Kenaikan puncak RSS proses selama rerun ini (0 = tidak melampaui puncak sebelumnya)
+            'peak_growth_mb': None if peak is None else peak - self.peak_start_mb,
+            'cache_hits': sum(1 for r in stages if r['cache'] == 'hit'),
+            'cache_misses': sum(1 for r in stages if r['cache'] == 'miss'),
+            'stages': self.stages,
+        }
+
+
+def _publish(summary):
+    with _runs_lock:
+        _runs.append(summary)
+    if logger.isEnabledFor(logging.INFO) or LOG_PATH:
+        line = json.dumps(summary, default=str)
+        logger.info(line)
+        if LOG_PATH:
+            with _log_lock, open(LOG_PATH, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+@contextmanager
+def run(label):
+    # Run di dalam run lain (mis. refresh sinkron dari tab upload) dicatat sebagai tahap biasa
+    current = _current.get()
+    if current is not None:
+        with current.stage(label) as record:
+            yield record
+        return
+    active = Run(label)
+    token = _current.set(active)
+    try:
+        yield None
+    finally:
+        _current.reset(token)
+        _publish(active.summary())
+
+
+@contextmanager
+def stage(name, rows=None, cached=False):
+    # Tanpa run aktif (mis. dipanggil dari benchmark / thread lain) tidak mencatat apa pun
+    current = _current.get()
+    if current is None:
+        yield {}
+        return
+    with current.stage(name, rows, cached) as record:
+        yield record
+
+
+def cache_miss():
+    current = _current.get()
+    if current is not None:
+        current.cache_miss()
+
+
+def timed(name, rows=None):
+    # Dekorator untuk loader ber-cache (dipasang DI LUAR @st.cache_*): waktu panggilan + hit/miss.
+    # rows = fungsi hasil -> jumlah baris, mis. len atau lambda r: len(r[0])
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name, cached=True) as record:
+                result = func(*args, **kwargs)
+                if rows is not None and record is not None:
+                    try:
+                        record['rows'] = int(rows(result))
+                    except (TypeError, ValueError, IndexError):
+                        pass
+                return result
+        return wrapper
+    return decorator
+
+
+def instrumented(label):
+    # Dekorator untuk fragment Streamlit: rerun fragment saja dicatat sebagai run sendiri,
+    # sedangkan saat dipanggil dalam rerun penuh dicatat sebagai tahap dari run tersebut.
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with run(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def recent_runs():
+    with _runs_lock:
+        return list(_runs)
+
+
+def export_jsonl(runs=None):
+    runs = recent_runs() if runs is None else runs
+    return ''.join(json.dumps(summary, default=str) + '\n' for summary in runs)
+
+
+def stage_table(runs=None):
+    # Satu baris per tahap per rerun (untuk ditampilkan sebagai tabel di panel admin)
+    runs = recent_runs() if runs is None else runs
+    return [
+        {'run': summary['run'], 'started': summary['started'], **record}
+        for summary in runs for record in summary['stages']
+    ]
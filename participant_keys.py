@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_pipeline import ROW_BLANK, ROW_DUPLICATE, ROW_OK, blank_participant_mask, participant_key_hashes
+from data_store import SNAPSHOT_DIR
+
+# Disimpan di samping snapshot sheet
+KEYS_DIR = os.path.join(SNAPSHOT_DIR, '_participant_keys')
+
+
+# ==================================================================
+# === HIMPUNAN KUNCI PESERTA (persisten, diperbarui inkremental) ===
+# ==================================================================
+# Untuk setiap baris sheet pelatihan disimpan hash kunci (nama, NPSN, pelatihan) dan statusnya:
+#   ROW_OK = dipakai, ROW_BLANK = nama/NPSN kosong, ROW_DUPLICATE = kunci sudah ada sebelumnya.
+# `keys` = hash (terurut, unik) dari semua baris ROW_OK -> cek duplikat = np.searchsorted.
+# Saat sinkronisasi hanya baris BARU yang di-hash & dicek; data yang tersimpan lebih dulu dipertahankan.
+# Sheet yang dibangun ulang (generation berubah) membuat seluruh himpunan dihitung ulang.
+class ParticipantKeySet:
+    def __init__(self, root=KEYS_DIR):
+        self.root = root
+        self.state = {'order': [], 'sheets': {}}
+        self.keys = np.array([], dtype=np.uint64)
+        self.rows = {}  # nama sheet -> (hashes, flags)
+        self._lock = threading.Lock()
+        state_path = os.path.join(root, 'state.json')
+        if os.path.exists(state_path):
+            with open(state_path, encoding='utf-8') as f:
+                self.state = json.load(f)
+            self.keys = np.load(os.path.join(root, 'keys.npy'))
+            for name in self.state['order']:
+                self.rows[name] = (
+                    np.load(os.path.join(root, f"{name}-hashes.npy")),
+                    np.load(os.path.join(root, f"{name}-flags.npy")),
+                )
+
+    def _save(self):
+        os.makedirs(self.root, exist_ok=True)
+        arrays = {'keys.npy': self.keys}
+        for name, (hashes, flags) in self.rows.items():
+            arrays[f"{name}-hashes.npy"] = hashes
+            arrays[f"{name}-flags.npy"] = flags
+        for file_name, array in arrays.items():
+            tmp_path = os.path.join(self.root, f"tmp-{file_name}")
+            np.save(tmp_path, array)
+            os.replace(tmp_path, os.path.join(self.root, file_name))
+        tmp_path = os.path.join(self.root, 'state.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, os.path.join(self.root, 'state.json'))
+
+    def contains(self, hashes):
+        if len(self.keys) == 0:
+            return np.zeros(len(hashes), dtype=bool)
+        positions = np.minimum(np.searchsorted(self.keys, hashes), len(self.keys) - 1)
+        return self.keys[positions] == hashes
+
+    def check(self, df, seen=None):
+        # Status baris untuk data baru (kolom sudah dinormalisasi), tanpa mengubah himpunan.
+        # `seen` = hash yang sudah diterima sebelumnya di unggahan yang sama (duplikat antar potongan file).
+        hashes = participant_key_hashes(df)
+        blank = blank_participant_mask(df)
+        duplicate = self.contains(hashes)
+        if seen is not None and len(seen):
+            duplicate |= np.isin(hashes, seen)
+        duplicate[~blank] |= pd.Series(hashes[~blank]).duplicated().to_numpy()
+        flags = np.full(len(df), ROW_OK, dtype=np.uint8)
+        flags[duplicate] = ROW_DUPLICATE
+        flags[blank] = ROW_BLANK
+        return hashes, flags
+
+    def update(self, frames, generations):
+        # frames: {nama_sheet: df_raw (kolom sudah dinormalisasi)} dalam urutan concat.
+        # Mengembalikan (hash, status) yang selaras dengan pd.concat(frames) untuk clean_training_data.
+        with self._lock:
+            order = list(frames)
+            rebuild = order != self.state['order'] or any(
+                self.state['sheets'].get(name, {}).get('generation') != generations[name] for name in order
+            )
+            if rebuild:
+                self.keys = np.array([], dtype=np.uint64)
+                self.rows = {name: (np.array([], dtype=np.uint64), np.array([], dtype=np.uint8)) for name in order}
+                self.state = {'order': order, 'sheets': {}}
+            changed = rebuild
+            for name, df in frames.items():
+                hashes, flags = self.rows[name]
+                if len(hashes) < len(df):
+                    new_hashes, new_flags = self.check(df.iloc[len(hashes):])
+                    self.keys = np.union1d(self.keys, new_hashes[new_flags == ROW_OK])
+                    hashes, flags = np.concatenate([hashes, new_hashes]), np.concatenate([flags, new_flags])
+                    self.rows[name] = (hashes, flags)
+                    changed = True
+                self.state['sheets'][name] = {'rows': len(hashes), 'generation': generations[name]}
+            if changed:
+                self._save()
+            # Sheet hanya di-append, jadi versi lama (lebih pendek) = awalan dari baris yang tersimpan
+            return (
+                np.concatenate([self.rows[name][0][:len(df)] for name, df in frames.items()]),
+                np.concatenate([self.rows[name][1][:len(df)] for name, df in frames.items()]),
+            )
@@ -0,0 +1,107 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+# Skor minimum (0-100) agar nama Dapodik dianggap orang yang sama dengan peserta pelatihan
+LINK_THRESHOLD = float(os.environ.get("SIPADU_LINK_THRESHOLD", "85"))
+# Skor terendah yang masih disimpan sebagai kandidat (= batas bawah slider ambang di tab Rekomendasi)
+LINK_MIN_SCORE = 70
+
+# Gelar akademik / sebutan yang diabaikan saat membandingkan nama (setelah titik & koma dihapus)
+NAME_TITLES = {
+    'DR', 'DRA', 'DRS', 'IR', 'H', 'HJ', 'PROF', 'HC',
+    'SPD', 'SPDI', 'SPDSD', 'SAG', 'SSI', 'SKOM', 'SE', 'SH', 'ST', 'SS', 'SPSI', 'SSOS', 'SKM', 'SSN', 'SIP', 'SHI', 'STH',
+    'MPD', 'MPDI', 'MSI', 'MM', 'MAG', 'MKOM', 'MT', 'MH', 'MA', 'MHUM', 'MSC',
+    'AMA', 'AMD', 'AMK', 'AMPD', 'GR',
+}
+
+
+def strip_titles(name):
+    # "SITI AMINAH SPD" / "Dra. Rina" -> "SITI AMINAH" / "RINA"
+    tokens = re.split(r'[^A-Z]+', re.sub(r'[.,\']', '', str(name).upper()))
+    return ' '.join(t for t in tokens if t and t not in NAME_TITLES)
+
+
+def _title_free(values):
+    # Dihitung hanya pada nilai unik lalu disebar ke semua baris
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    stripped = np.array([strip_titles(v) for v in uniques] + [''], dtype=object)
+    return stripped[codes]
+
+
+def name_similarity(queries, choices):
+    # token_sort pada nama tanpa gelar: tahan urutan kata & salah ketik, tetapi kata yang tidak ada pasangannya
+    # ikut menurunkan skor ('WAHYU HIDAYAT KURNIAWAN' vs 'WAHYU HIDAYAT' = 72, bukan orang yang sama)
+    return process.cdist(queries, choices, scorer=fuzz.token_sort_ratio, dtype=np.float32, workers=-1)
+
+
+def assign_one_to_one(scores, min_score=LINK_MIN_SCORE):
+    # Pasangan (baris, kolom) satu-satu, skor tertinggi lebih dulu (greedy); -1 = tidak mendapat pasangan.
+    # Urutan pasangan di atas ambang mana pun sama, jadi ambang tetap bisa dipilih saat membaca hasil.
+    best = np.full(scores.shape[0], -1, dtype=np.int64)
+    rows, cols = np.nonzero(scores >= min_score)
+    order = np.argsort(-scores[rows, cols], kind='stable')
+    used_cols = np.zeros(scores.shape[1], dtype=bool)
+    for row, col in zip(rows[order], cols[order]):
+        if best[row] < 0 and not used_cols[col]:
+            best[row] = col
+            used_cols[col] = True
+    return best
+
+
+# ==================================================================
+# === PENCOCOKAN NAMA DAPODIK <-> PESERTA PELATIHAN (dibangun sekali per versi data) ===
+# ==================================================================
+# 1. Cocok persis (NPSN_ID, NAMA_CLEAN) lewat ParticipantIndex -> skor 100.
+# 2. Sisanya dibandingkan HANYA dengan peserta dari NPSN yang sama (blocking) yang belum dipakai
+#    pencocokan persis. Di dalam satu NPSN pasangan dipilih satu-satu (skor tertinggi lebih dulu), sehingga
+#    satu peserta tidak bisa diklaim beberapa nama Dapodik; pasangan + skornya disimpan.
+# Ambang dipakai saat membaca hasil (person_ids/confidence), jadi mengubah ambang tidak menghitung ulang.
+class NameLinker:
+    def __init__(self, participant_index, npsn_ids, names_clean):
+        npsn_ids = pd.Series(npsn_ids).to_numpy(dtype='int64', na_value=-1)
+        names_clean = np.asarray(names_clean, dtype=object)
+        self.exact_ids = participant_index.person_ids(npsn_ids, names_clean)
+        self.best_ids = np.full(len(npsn_ids), -1, dtype=np.int64)
+        self.scores = np.zeros(len(npsn_ids), dtype=np.float32)
+
+        person_npsn = participant_index.keys.get_level_values('NPSN_ID').to_numpy(dtype='int64')
+        person_names = _title_free(participant_index.keys.get_level_values('NAMA_CLEAN'))
+        available = np.ones(len(person_npsn), dtype=bool)
+        available[self.exact_ids[self.exact_ids >= 0]] = False
+        persons = np.flatnonzero(available)
+        persons = persons[np.argsort(person_npsn[persons], kind='stable')]
+        person_blocks = person_npsn[persons]
+
+        pending = np.flatnonzero((self.exact_ids < 0) & (npsn_ids >= 0))
+        pending = pending[np.argsort(npsn_ids[pending], kind='stable')]
+        pending_names = _title_free(names_clean[pending])
+        block_values, block_starts = np.unique(npsn_ids[pending], return_index=True)
+        block_ends = np.append(block_starts[1:], len(pending))
+        lo = np.searchsorted(person_blocks, block_values, side='left')
+        hi = np.searchsorted(person_blocks, block_values, side='right')
+        for start, end, p_lo, p_hi in zip(block_starts, block_ends, lo, hi):
+            if p_lo == p_hi:
+                continue
+            candidates = persons[p_lo:p_hi]
+            scores = name_similarity(list(pending_names[start:end]), list(person_names[candidates]))
+            best = assign_one_to_one(scores)
+            linked = best >= 0
+            rows = pending[start:end][linked]
+            self.best_ids[rows] = candidates[best[linked]]
+            self.scores[rows] = scores[np.flatnonzero(linked), best[linked]]
+
+    def person_ids(self, threshold=LINK_THRESHOLD, rows=slice(None)):
+        # rows = posisi baris Dapodik (slice/array) jika hanya sebagian yang dibutuhkan
+        exact_ids, best_ids, scores = self.exact_ids[rows], self.best_ids[rows], self.scores[rows]
+        linked = (best_ids >= 0) & (scores >= threshold)
+        return np.where(exact_ids >= 0, exact_ids, np.where(linked, best_ids, -1))
+
+    def confidence(self, threshold=LINK_THRESHOLD, rows=slice(None)):
+        # 100 = nama persis sama, 0 = tidak ditemukan di data pelatihan
+        exact_ids, best_ids, scores = self.exact_ids[rows], self.best_ids[rows], self.scores[rows]
+        linked = (best_ids >= 0) & (scores >= threshold)
+        return np.where(exact_ids >= 0, 100.0, np.where(linked, np.round(scores, 1), 0.0))
@@ -0,0 +1,255 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xlsxwriter
+
+import diagnostics
+from data_store import SNAPSHOT_DIR
+
+# Lokasi file laporan yang sudah jadi (dipakai bersama oleh semua sesi)
+EXPORT_DIR = os.environ.get("SIPADU_EXPORT_DIR", os.path.join(SNAPSHOT_DIR, 'exports'))
+
+# Batas total ukuran file laporan di EXPORT_DIR; file yang paling lama tidak diunduh dihapus lebih dulu
+EXPORT_BUDGET_MB = float(os.environ.get("SIPADU_EXPORT_BUDGET_MB", "512"))
+
+# Jumlah baris yang diproses per potongan saat menulis file
+CHUNK_ROWS = 10000
+
+EXPORT_FORMATS = {
+    'Excel (.xlsx)': ('xlsx', "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    'CSV (.csv)': ('csv', "text/csv"),
+    'Parquet (.parquet)': ('parquet', "application/octet-stream"),
+}
+
+_locks = {}
+_locks_guard = threading.Lock()
+export_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+def _count(name, n=1):
+    with _locks_guard:
+        export_stats[name] += n
+
+
+def _lock_for(path):
+    with _locks_guard:
+        return _locks.setdefault(path, threading.Lock())
+
+
+def _chunks(df, chunk_rows):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+# ==================================================================
+# === PENULIS FILE (per potongan baris, memori tetap kecil) ===
+# ==================================================================
+def write_excel(df, path, sheet_name, chunk_rows=CHUNK_ROWS):
+    # constant_memory: setiap baris langsung ditulis ke file sementara xlsxwriter, tidak ditahan di memori
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'nan_inf_to_errors': True})
+    worksheet = workbook.add_worksheet(sheet_name)
+    header_format = workbook.add_format({'bold': True, 'border': 1})
+    worksheet.write_row(0, 0, list(df.columns), header_format)
+    row = 1
+    for chunk in _chunks(df, chunk_rows):
+        values = chunk.astype(object).where(chunk.notna(), None)
+        for record in values.itertuples(index=False, name=None):
+            worksheet.write_row(row, 0, record)
+            row += 1
+    workbook.close()
+
+
+def write_csv(df, path, chunk_rows=CHUNK_ROWS):
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        for i, chunk in enumerate(_chunks(df, chunk_rows)):
+            chunk.to_csv(f, index=False, header=(i == 0))
+        if len(df) == 0:
+            df.to_csv(f, index=False)
+
+
+def write_parquet(df, path, chunk_rows=CHUNK_ROWS):
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in _chunks(df, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+# ==================================================================
+# === CACHE LAPORAN BERBASIS KONTEN (kunci = versi data) ===
+# ==================================================================
+# Nama file = hash dari kunci (nama laporan + versi data + format). Laporan untuk versi data yang
+# sama hanya dibuat sekali; sesi lain langsung memakai file yang sudah ada di disk.
+# File lama dibuang oleh _enforce_budget (LRU menurut mtime) saat total ukuran melebihi EXPORT_BUDGET_MB.
+def export_path(name, key, ext, root=EXPORT_DIR):
+    digest = hashlib.sha1(repr((name, key)).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(root, f"{name}-{digest}.{ext}")
+
+
+def get_or_create_export(name, key, ext, build, sheet_name='Sheet1', root=EXPORT_DIR):
+    path = export_path(name, key, ext, root)
+    with diagnostics.stage(f"export_{ext}", cached=True):
+        if _touch(path):
+            return path
+        with _lock_for(path):
+            if _touch(path):
+                return path
+            diagnostics.cache_miss()
+            _count('misses')
+            os.makedirs(root, exist_ok=True)
+            with diagnostics.stage('export_build') as build_stage:
+                df = build()
+                build_stage['rows'] = len(df)
+            tmp_path = f"{path}.tmp"
+            with diagnostics.stage('export_write', rows=len(df)):
+                if ext == 'xlsx':
+                    write_excel(df, tmp_path, sheet_name)
+                elif ext == 'csv':
+                    write_csv(df, tmp_path)
+                else:
+                    write_parquet(df, tmp_path)
+            # Ganti nama secara atomik agar sesi lain tidak pernah membaca file setengah jadi
+            os.replace(tmp_path, path)
+            # Laporan versi/ambang lain tidak dihapus di sini (mungkin sedang diunduh sesi lain);
+            # pembersihan hanya lewat budget LRU
+            _enforce_budget(path, root)
+    return path
+
+
+def _touch(path):
+    # Cache hit: perbarui mtime agar file yang sering diunduh tidak dibuang oleh _enforce_budget (LRU)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    _count('hits')
+    return True
+
+
+def _enforce_budget(keep_path, root, budget_mb=EXPORT_BUDGET_MB):
+    files = []
+    for file_name in os.listdir(root):
+        path = os.path.join(root, file_name)
+        if not file_name.endswith('.tmp') and os.path.isfile(path):
+            stat = os.stat(path)
+            files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= budget_mb * 1024 ** 2:
+            break
+        if path != keep_path:
+            os.remove(path)
+            total -= size
+            _count('evictions')
+
+
+def export_cache_stats(root=EXPORT_DIR):
+    size = sum(os.path.getsize(os.path.join(root, f)) for f in os.listdir(root)) if os.path.isdir(root) else 0
+    with _locks_guard:
+        return {**export_stats, 'size_mb': round(size / 1024 ** 2, 1), 'budget_mb': EXPORT_BUDGET_MB}
+
+
+# ==================================================================
+# === LAPORAN REKOMENDASI PESERTA (Dapodik x frekuensi pelatihan) ===
+# ==================================================================
+def teks_prioritas(jml):
+    if jml == 0: return "Belum Pernah (0x)"
+    elif jml == 1: return "Pernah 1x"
+    else: return f"Sudah Sering ({jml}x)"
+
+
+def recommendation_details(df_dapodik, df_sekolah, name_column='NAMA_LENGKAP'):
+    # A. Siapkan Master List (Dapodik); NAMA_CLEAN/NPSN_ID sudah dihitung saat load
+    final_data_df = df_dapodik[['NPSN', 'NPSN_ID', name_column]].copy()
+    final_data_df['NPSN'] = final_data_df['NPSN'].astype(str).str.strip()
+
+    # D. Tambahkan Detail Sekolah (merge left mempertahankan urutan baris Dapodik)
+    school_name_column = 'NAMA_SEKOLAH'
+    if school_name_column not in df_sekolah.columns and 'ASAL_SEKOLAH' in df_sekolah.columns:
+        school_name_column = 'ASAL_SEKOLAH'
+    desired_cols = ['NPSN_ID', school_name_column, 'TIPE', 'STATUS', 'KECAMATAN', 'KABUPATEN']
+    existing_cols = [c for c in desired_cols if c in df_sekolah.columns]
+    school_map_df = df_sekolah[existing_cols].dropna(subset=['NPSN_ID'])
+    school_map_df = school_map_df.drop_duplicates(subset=['NPSN_ID'], keep='first')
+    return final_data_df.merge(school_map_df, on='NPSN_ID', how='left').rename(columns={school_name_column: 'Sekolah'})
+
+
+def format_recommendation_report(details, frequency, confidence, name_column='NAMA_LENGKAP'):
+    final_df = details.copy()
+    # B & C. Frekuensi pelatihan per baris Dapodik (dari id peserta); yang tidak pernah ikut = 0
+    final_df['JUMLAH_PELATIHAN'] = np.asarray(frequency).astype(int)
+    # Skor kecocokan nama dengan data pelatihan: 100 = persis, <100 = fuzzy, 0 = tidak ditemukan
+    final_df['SKOR_KECOCOKAN'] = np.asarray(confidence, dtype=float)
+
+    # Label status teks agar mudah difilter di Excel (dihitung per nilai unik frekuensi)
+    labels = {jml: teks_prioritas(jml) for jml in final_df['JUMLAH_PELATIHAN'].unique()}
+    final_df['STATUS_UNDANGAN'] = final_df['JUMLAH_PELATIHAN'].map(labels)
+
+    # E. Format & Rename Kolom sesuai Urutan yang Diminta
+    final_df = final_df.rename(columns={
+        'TIPE': 'Jenjang',
+        'STATUS': 'Status Sekolah',
+        'KECAMATAN': 'Kecamatan',
+        'KABUPATEN': 'Sudin',
+        name_column: 'Nama Peserta',
+        'JUMLAH_PELATIHAN': 'Frekuensi Ikut',
+        'STATUS_UNDANGAN': 'Kategori',
+        'SKOR_KECOCOKAN': 'Skor Kecocokan Nama'
+    })
+    required_output_cols = [
+        'Sekolah', 'NPSN', 'Jenjang', 'Status Sekolah',
+        'Kecamatan', 'Sudin', 'Nama Peserta',
+        'Frekuensi Ikut', 'Kategori', 'Skor Kecocokan Nama'
+    ]
+    for col in required_output_cols:
+        if col not in final_df.columns:
+            final_df[col] = pd.NA
+    final_df = final_df[required_output_cols]
+
+    # Sortir data: Yang belum pernah (0) akan berada paling atas di Excel
+    return final_df.sort_values(by=['Frekuensi Ikut', 'Sekolah', 'Nama Peserta'])
+
+
+# ==================================================================
+# === TABEL REKOMENDASI SEMUA SEKOLAH (dibangun sekali per versi data, dipartisi per NPSN) ===
+# ==================================================================
+# Baris Dapodik diurutkan per NPSN_ID + detail sekolah sudah digabung; offsets[i]:offsets[i+1] = baris
+# sekolah ke-i. Memilih sekolah = lookup hash NPSN_ID -> irisan baris; laporan lengkap = seluruh tabel.
+# Frekuensi dibaca dari NameLinker + ParticipantIndex saat dibutuhkan (ambang fuzzy bisa diubah tanpa rebuild).
+class RecommendationTable:
+    def __init__(self, df_dapodik, df_sekolah, name_linker, participant_index, name_column='NAMA_LENGKAP'):
+        npsn_ids = df_dapodik['NPSN_ID'].to_numpy(dtype='int64', na_value=-1)
+        self.order = np.argsort(npsn_ids, kind='stable')
+        self.details = recommendation_details(df_dapodik.iloc[self.order], df_sekolah, name_column)
+        keys, starts = np.unique(npsn_ids[self.order], return_index=True)
+        self.schools = pd.Index(keys)
+        self.offsets = np.append(starts, len(npsn_ids))
+        self.name_linker = name_linker
+        self.participant_index = participant_index
+        self.name_column = name_column
+        self.schools.get_indexer(keys[:1])  # bangun hash table lookup sekarang, bukan saat klik pertama
+
+    def rows(self, npsn_id_value):
+        position = self.schools.get_indexer([npsn_id_value])[0]
+        if position < 0:
+            return slice(0, 0)
+        return slice(self.offsets[position], self.offsets[position + 1])
+
+    def frequency(self, threshold, rows=slice(None)):
+        person_ids = self.name_linker.person_ids(threshold, self.order[rows])
+        return self.participant_index.frequency_of(person_ids).astype(int)
+
+    def school(self, npsn_id_value, threshold):
+        # Baris Dapodik satu sekolah + frekuensi pelatihan masing-masing orang
+        rows = self.rows(npsn_id_value)
+        school_df = self.details.iloc[rows].reset_index(drop=True)
+        school_df['JUMLAH_PELATIHAN'] = self.frequency(threshold, rows)
+        return school_df
+
+    def report(self, threshold):
+        confidence = self.name_linker.confidence(threshold, self.order)
+        return format_recommendation_report(self.details, self.frequency(threshold), confidence, self.name_column)
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+# Modul aplikasi berada di root repo (flat, di samping dashboard.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import SHEET_NAMES, generate_sheets  # noqa: E402
+from data_store import InMemorySheetSource, SnapshotStore  # noqa: E402
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    # Snapshot kecil dari data sintetis benchmark (sekolah, Dapodik & tiga sheet pelatihan)
+    source = InMemorySheetSource(generate_sheets(3000))
+    store = SnapshotStore(source, root=str(tmp_path / 'snapshot'))
+    store.sync_many(SHEET_NAMES + ['data_sekolah', 'data_dapodik_name'])
+    return source, store
@@ -0,0 +1,86 @@
+import pandas as pd
+
+from data_pipeline import ALL_STATUS, RECAP_PELATIHAN, school_name_column
+
+
+# Oracle untuk data_queries.RecapQueries: kubus rekap yang sama dihitung dengan pandas dari data bersih
+# (clean_training_data) dan data sekolah (apply_schema). Hanya dipakai di test.
+class RecapCube:
+    measures = ['TARGET_PESERTA', 'PESERTA_UNIK', 'TARGET_SEKOLAH', 'SEKOLAH_TERLATIH']
+
+    def __init__(self, df, df_sekolah, target_kabupaten):
+        # target_kabupaten kosong = semua kabupaten (deployment tanpa SUDIN_SCOPE)
+        if target_kabupaten and 'KABUPATEN' in df_sekolah.columns:
+            df_sekolah = df_sekolah[df_sekolah['KABUPATEN'].isin(target_kabupaten)]
+        self.name_column = school_name_column(df_sekolah)
+        self.status_options = df_sekolah['STATUS'].dropna().unique().tolist()
+        self.all_jenjang = sorted(df_sekolah['TIPE'].dropna().unique())
+
+        schools = pd.DataFrame({
+            'NPSN_ID': df_sekolah['NPSN_ID'],
+            'TIPE': df_sekolah['TIPE'].astype(object),
+            'STATUS': df_sekolah['STATUS'].astype(object),
+            'GURU': df_sekolah['GURU'].fillna(0),
+            'KS_TENDIK': df_sekolah['KEPALA_SEKOLAH'].fillna(0) + df_sekolah['TENAGA_KEPENDIDIKAN'].fillna(0),
+        })
+        npsn_status = schools.dropna(subset=['NPSN_ID']).drop_duplicates(subset=['NPSN_ID'])[['NPSN_ID', 'STATUS']]
+        training = df.loc[
+            df['NPSN_ID'].isin(npsn_status['NPSN_ID']), ['PELATIHAN', 'JENJANG', 'NPSN_ID', 'NAMA_PESERTA', 'ASAL_SEKOLAH']
+        ].astype({'PELATIHAN': object, 'JENJANG': object, 'ASAL_SEKOLAH': object})
+        training = training.merge(npsn_status, on='NPSN_ID', how='left')
+
+        keys = ['PELATIHAN', 'JENJANG']
+        pieces = []
+        for status_keys, status_value in [(['STATUS'], None), ([], ALL_STATUS)]:
+            peserta = training.drop_duplicates(subset=keys + status_keys + ['NAMA_PESERTA', 'ASAL_SEKOLAH']) \
+                .groupby(keys + status_keys).size().rename('PESERTA_UNIK')
+            sekolah = training.drop_duplicates(subset=keys + ['NPSN_ID']) \
+                .groupby(keys + status_keys).size().rename('SEKOLAH_TERLATIH')
+            targets = []
+            for pelatihan in RECAP_PELATIHAN:
+                target_schools = schools if pelatihan == 'Pendidik' else schools[schools['TIPE'] != 'SLB']
+                target_column = 'GURU' if pelatihan == 'Pendidik' else 'KS_TENDIK'
+                grouped = target_schools.groupby(['TIPE'] + status_keys)
+                target = pd.DataFrame({
+                    'TARGET_PESERTA': grouped[target_column].sum(),
+                    'TARGET_SEKOLAH': schools.dropna(subset=['NPSN_ID']).groupby(['TIPE'] + status_keys)['NPSN_ID'].nunique(),
+                })
+                target = target.reset_index().rename(columns={'TIPE': 'JENJANG'}).assign(PELATIHAN=pelatihan)
+                targets.append(target.set_index(keys + status_keys))
+            piece = pd.concat(targets).join([peserta, sekolah], how='outer').fillna(0).reset_index()
+            if status_value is not None:
+                piece['STATUS'] = status_value
+            pieces.append(piece)
+        self.cube = pd.concat(pieces, ignore_index=True).astype({m: 'int64' for m in self.measures})
+
+        # Sekolah target yang belum punya peserta untuk PELATIHAN x JENJANG (anti-join)
+        trained_pairs = training[['PELATIHAN', 'JENJANG', 'NPSN_ID']].drop_duplicates()
+        detail_cols = [c for c in ['NPSN', self.name_column, 'KECAMATAN', 'STATUS'] if c in df_sekolah.columns]
+        target_schools = df_sekolah.dropna(subset=['NPSN_ID']).assign(JENJANG=lambda d: d['TIPE'].astype(object))
+        target_schools = pd.concat([target_schools.assign(PELATIHAN=p) for p in RECAP_PELATIHAN], ignore_index=True)
+        missing = target_schools.merge(trained_pairs, on=['PELATIHAN', 'JENJANG', 'NPSN_ID'], how='left', indicator=True)
+        self.missing = missing.loc[
+            missing['_merge'] == 'left_only', ['PELATIHAN', 'JENJANG', 'NPSN_ID'] + list(dict.fromkeys(detail_cols + ['STATUS']))
+        ]
+        self.detail_cols = detail_cols
+
+    def jenjang_for(self, pelatihan):
+        if pelatihan == 'Pendidik':
+            return self.all_jenjang
+        return [j for j in self.all_jenjang if j != 'SLB']
+
+    def summary(self, pelatihan, statuses):
+        cube = self.cube[self.cube['PELATIHAN'] == pelatihan]
+        if statuses:
+            cube = cube[cube['STATUS'].isin(statuses)]
+        else:
+            cube = cube[cube['STATUS'] == ALL_STATUS]
+        return cube.groupby('JENJANG')[self.measures].sum().reindex(self.jenjang_for(pelatihan), fill_value=0)
+
+    def missing_schools(self, pelatihan, statuses, jenjang):
+        missing = self.missing[(self.missing['PELATIHAN'] == pelatihan) & (self.missing['JENJANG'] == jenjang)]
+        if statuses:
+            missing = missing[missing['STATUS'].isin(statuses)]
+        missing_df = missing[self.detail_cols].drop_duplicates(subset=['NPSN']).reset_index(drop=True)
+        missing_df.index += 1
+        return missing_df
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+from benchmark import SHEET_NAMES, TARGET_KABUPATEN
+import data_cache
+from data_cache import DataCache, estimate_size
+from data_queries import RecapQueries, SnapshotQueries
+from participant_keys import ParticipantKeySet
+
+MB = 1024 ** 2
+
+
+def block(mb):
+    return np.zeros(int(mb * MB), dtype=np.uint8)
+
+
+def test_evicts_least_recently_used_over_budget():
+    cache = DataCache(budget_mb=2.5)
+    cache.get(('a',), 1, lambda: block(1))
+    cache.get(('b',), 1, lambda: block(1))
+    cache.get(('a',), 1, lambda: block(1))  # 'a' dipakai lagi -> 'b' jadi yang paling lama
+    cache.get(('c',), 1, lambda: block(1))
+    assert [e['loader'] for e in cache.entries()] == ['a', 'c']
+    assert cache.total_bytes == 2 * MB
+    assert cache.stats()['evictions'] == 1
+
+
+def test_newest_entry_kept_even_over_budget():
+    cache = DataCache(budget_mb=1)
+    cache.get(('a',), 1, lambda: block(0.5))
+    value = cache.get(('b',), 1, lambda: block(3))
+    assert len(value) == 3 * MB
+    assert [e['loader'] for e in cache.entries()] == ['b']
+
+
+def test_old_versions_pushed_out_per_key():
+    cache = DataCache(budget_mb=100, max_versions=2)
+    for version in range(4):
+        cache.get(('a',), version, lambda: block(1))
+    assert [e['version'] for e in cache.entries()] == ['2', '3']
+    assert cache.total_bytes == 2 * MB
+
+
+def test_build_runs_once_per_version_and_frames_are_shallow_copies():
+    cache, builds = DataCache(budget_mb=100), []
+
+    def build():
+        builds.append(1)
+        return pd.DataFrame({'x': [1, 2, 3]})
+
+    first = cache.get(('df',), 1, build)
+    first.loc[0, 'x'] = 99  # copy-on-write: frame di cache tidak ikut berubah
+    assert cache.get(('df',), 1, build)['x'].tolist() == [1, 2, 3]
+    assert len(builds) == 1 and cache.hits == 1 and cache.misses == 1
+
+
+def test_shared_objects_counted_once():
+    shared = block(1)
+    cache = DataCache(budget_mb=100)
+    cache.get(('index',), 1, lambda: shared)
+    cache.get(('linker',), 1, lambda: {'index': shared, 'extra': block(0.5)})
+    assert cache.total_bytes == int(1.5 * MB)
+    assert estimate_size({'index': shared}) == MB
+
+
+def test_query_engine_charged_with_duckdb_memory(snapshot, tmp_path):
+    _, store = snapshot
+    queries = SnapshotQueries(store, SHEET_NAMES, ParticipantKeySet(str(tmp_path / 'keys')), scope=[])
+    tables = queries.connection.execute(
+        "SELECT memory_usage_bytes FROM duckdb_memory() WHERE tag = 'IN_MEMORY_TABLE'"
+    ).fetchone()[0]
+    cache = DataCache(budget_mb=100)
+    cache.get(('engine',), 1, lambda: queries)
+    assert tables > 0 and cache.total_bytes >= tables
+    # RecapQueries memegang engine yang sudah di-cache -> tidak dihitung dua kali
+    cache.get(('recap',), 1, lambda: RecapQueries(queries, TARGET_KABUPATEN))
+    assert cache.total_bytes < 2 * tables
+
+
+def test_frames_deep_copied_without_copy_on_write(monkeypatch):
+    monkeypatch.setattr(data_cache, 'COPY_ON_WRITE', False)
+    cache = DataCache(budget_mb=100)
+    stored = cache.get(('df',), 1, lambda: pd.DataFrame({'x': [1, 2, 3]}))
+    assert not np.shares_memory(cache.get(('df',), 1, None)['x'].to_numpy(), stored['x'].to_numpy())
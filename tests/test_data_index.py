@@ -0,0 +1,134 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark import SHEET_NAMES
+from data_index import FilterIndex, SearchIndex, normalize_search_text, substring_edit_distances
+from data_partition import read_sudin_map, read_training
+from data_pipeline import clean_training_data
+from participant_keys import ParticipantKeySet
+
+FILTER_COLUMNS = ['JENJANG', 'KECAMATAN', 'NAMA_PELATIHAN', 'PELATIHAN', 'STATUS_SEKOLAH']
+
+NAMES = pd.Series([
+    'Budi Santoso', 'Siti Aminah, S.Pd', 'Agus Budiman', 'Budi Santoso', 'Rina Kurniawan', 'Dewi Lestari', None,
+])
+
+
+def found(index, query, max_edits=None):
+    value_ids, ranks = index.search_values(query, max_edits)
+    return {str(index.values[v]): int(r) for v, r in zip(value_ids, ranks)}
+
+
+def levenshtein(a, b):
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def test_normalize_search_text():
+    assert normalize_search_text('Siti Aminah, S.Pd') == 'SITI AMINAH S PD'
+    assert normalize_search_text('  José  ') == 'JOSE'
+
+
+@pytest.mark.parametrize('query, expected', [('BUD', 0), ('BUDI', 1), ('SANTSO', 1), ('KURNIAWN', 2), ('KURNIAWANN', 2)])
+def test_default_max_edits_grows_with_query_length(query, expected):
+    assert SearchIndex.default_max_edits(query) == expected
+
+
+def test_exact_matches_ranked_before_typos():
+    index = SearchIndex(NAMES)
+    assert found(index, 'budi') == {'BUDI SANTOSO': 0, 'AGUS BUDIMAN': 1}
+    assert found(index, 'santo') == {'BUDI SANTOSO': 1}
+    assert found(index, 'minah') == {'SITI AMINAH S PD': 2}
+    assert index.search('budi santoso').tolist() == [0, 3]
+
+
+def test_fuzzy_edit_limits():
+    index = SearchIndex(NAMES)
+    # 6 huruf -> paling banyak 1 salah ketik
+    assert found(index, 'santso') == {'BUDI SANTOSO': 3}
+    assert found(index, 'sxntsx') == {}
+    assert found(index, 'sxntsx', max_edits=2) == {}  # tidak ada trigram bersama -> tidak ada kandidat fuzzy
+    # 8+ huruf -> 2 salah ketik
+    assert found(index, 'kurniwan') == {'RINA KURNIAWAN': 3}
+    assert found(index, 'kurnixxan') == {'RINA KURNIAWAN': 4}
+    assert found(index, 'kurnixxan', max_edits=1) == {}
+    assert found(index, 'kxrnixxan') == {}
+    # Kata kunci pendek tidak pernah fuzzy
+    assert found(index, 'bdi') == {}
+    assert found(index, '') == {}
+
+
+def test_substring_edit_distances_match_brute_force():
+    texts = ['BUDI SANTOSO', 'SITI AMINAH', 'KURNIAWAN', 'A']
+    for pattern in ['SANTSO', 'AMINA', 'KURNIAWN', 'XYZ']:
+        expected = [
+            min(levenshtein(pattern, t[i:j]) for i in range(len(t) + 1) for j in range(i, len(t) + 1)) for t in texts
+        ]
+        assert substring_edit_distances(pattern, texts).tolist() == expected
+
+
+def pandas_select(df, filters, date_range=None):
+    # Jalur lama dashboard: isin per kolom (AND), TANGGAL >= awal & <= akhir
+    mask = pd.Series(True, index=df.index)
+    for col, values in filters.items():
+        if values:
+            mask &= df[col].isin(values)
+    if date_range is not None:
+        mask &= (df['TANGGAL'] >= date_range[0]) & (df['TANGGAL'] <= date_range[1])
+    return np.flatnonzero(mask.to_numpy())
+
+
+@pytest.fixture
+def clean_df(snapshot, tmp_path):
+    _, store = snapshot
+    keys = ParticipantKeySet(str(tmp_path / 'keys'))
+    df, _, _ = clean_training_data(*read_training(store, SHEET_NAMES, keys, read_sudin_map(store), []))
+    # Beberapa baris tanpa tanggal valid (NaT) & nilai kosong; jumlah baris bukan kelipatan 8 (padding bitmap)
+    df = df.iloc[:len(df) - len(df) % 8 - 3].copy()
+    df.loc[df.index[::97], 'TANGGAL'] = pd.NaT
+    df['KECAMATAN'] = df['KECAMATAN'].astype(object).where(df.index % 53 != 0, None)
+    return df
+
+
+def test_filter_index_matches_pandas_masks(clean_df):
+    df = clean_df
+    index = FilterIndex(df, FILTER_COLUMNS)
+    assert index.select({col: [] for col in FILTER_COLUMNS}) is None
+    jenjang, kecamatan, pelatihan = (index.options[col] for col in ['JENJANG', 'KECAMATAN', 'PELATIHAN'])
+    dates = df['TANGGAL'].dropna().sort_values()
+    date_ranges = [
+        None,
+        (dates.iloc[0], dates.iloc[-1]),                          # ujung inklusif: tanggal pertama & terakhir ikut
+        (dates.iloc[len(dates) // 3], dates.iloc[len(dates) // 3]),  # satu hari
+        (pd.Timestamp('2030-01-01'), pd.Timestamp('2030-12-31')),  # di luar data
+    ]
+    filter_sets = [
+        {'JENJANG': jenjang[:2]},
+        {'JENJANG': jenjang[:2], 'PELATIHAN': pelatihan[:1]},
+        {'KECAMATAN': kecamatan[:3], 'STATUS_SEKOLAH': ['NEGERI'], 'JENJANG': []},
+        {'JENJANG': ['TIDAK ADA']},                                 # nilai tidak dikenal -> kosong
+        {},
+    ]
+    for filters, date_range in itertools.product(filter_sets, date_ranges):
+        rows = index.select(filters, date_range)
+        if rows is None:
+            assert not any(filters.values()) and date_range is None
+            continue
+        expected = pandas_select(df, filters, date_range)
+        assert np.array_equal(rows, expected), (filters, date_range)
+    assert len(index.select({}, date_ranges[1])) == df['TANGGAL'].notna().sum()
+    assert len(index.select({'JENJANG': ['TIDAK ADA']})) == 0
+
+
+def test_filter_options_skip_missing_values(clean_df):
+    index = FilterIndex(clean_df, ['KECAMATAN'])
+    assert None not in index.options['KECAMATAN']
+    assert sorted(index.options['KECAMATAN']) == sorted(clean_df['KECAMATAN'].dropna().unique())
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+from data_partition import npsn_scope_mask, read_dapodik, read_schools, read_sudin_map, read_training, scope_mask
+from data_store import InMemorySheetSource, SnapshotStore
+from participant_keys import ParticipantKeySet
+
+SCOPE = ['KOTA ADM. JAKARTA UTARA']
+SCHOOLS = [
+    ['NPSN', 'NAMA_SEKOLAH', 'KABUPATEN'],
+    ['101', 'SD UTARA', 'Kota Adm. Jakarta Utara '],
+    ['102', 'SD PUSAT', 'KOTA ADM. JAKARTA PUSAT'],
+    ['103', 'SD TANPA KABUPATEN', ''],
+]
+TRAINING = [
+    ['NAMA_PESERTA', 'NPSN', 'NAMA_PELATIHAN'],
+    ['ANI', '101', 'A'],      # di dalam scope
+    ['BUDI', '102', 'A'],     # Sudin lain -> dipangkas
+    ['CICI', '103', 'A'],     # sekolah tanpa KABUPATEN
+    ['DEDI', '999', 'A'],     # NPSN tidak ada di data_sekolah
+    ['EKA', '', 'A'],         # NPSN kosong
+]
+
+
+def make_store(tmp_path):
+    source = InMemorySheetSource({
+        'data_sekolah': SCHOOLS, 'Pendidik': TRAINING,
+        'data_dapodik_name': [['NPSN', 'NAMA_LENGKAP'], ['101', 'ANI'], ['102', 'BUDI'], ['999', 'DEDI']],
+    })
+    store = SnapshotStore(source, root=str(tmp_path / 'snapshot'))
+    store.sync_many(['data_sekolah', 'Pendidik', 'data_dapodik_name'])
+    return store
+
+
+def test_scope_mask_keeps_blank_and_missing_kabupaten():
+    kabupaten = pd.Series([' kota adm. jakarta utara', 'KOTA ADM. JAKARTA PUSAT', '', None, np.nan])
+    assert scope_mask(kabupaten, SCOPE).tolist() == [True, False, True, True, True]
+    assert scope_mask(kabupaten, []).all()
+
+
+def test_npsn_scope_mask_keeps_unmapped_npsn(tmp_path):
+    sudin_map = read_sudin_map(make_store(tmp_path))
+    npsn = pd.Series(['101', '102', '103', '999', ''])
+    assert npsn_scope_mask(npsn, sudin_map, SCOPE).tolist() == [True, False, True, True, True]
+
+
+def test_scoped_reads_keep_unmapped_rows(tmp_path):
+    store = make_store(tmp_path)
+    sudin_map = read_sudin_map(store)
+    assert read_schools(store, SCOPE)['NPSN'].tolist() == ['101', '103']
+    assert read_dapodik(store, sudin_map, SCOPE)['NAMA_LENGKAP'].tolist() == ['ANI', 'DEDI']
+
+    df_raw, (hashes, flags) = read_training(store, ['Pendidik'], ParticipantKeySet(str(tmp_path / 'keys')), sudin_map, SCOPE)
+    assert df_raw['NAMA_PESERTA'].tolist() == ['ANI', 'CICI', 'DEDI', 'EKA']
+    assert len(hashes) == len(flags) == len(df_raw)
+
+
+def test_reads_use_requested_snapshot_version(tmp_path):
+    store = make_store(tmp_path)
+    source = store.source
+    versions = {name: store.version(name) for name in ['data_sekolah', 'Pendidik', 'data_dapodik_name']}
+    source.append_rows('Pendidik', [['FAJAR', '101', 'B']])
+    source.append_rows('data_dapodik_name', [['101', 'FAJAR']])
+    source.append_rows('data_sekolah', [['104', 'SD BARU', 'KOTA ADM. JAKARTA UTARA']])
+    store.sync_many(['data_sekolah', 'Pendidik', 'data_dapodik_name'])
+
+    sudin_map = read_sudin_map(store, versions)
+    assert len(sudin_map) == len(read_sudin_map(store)) - 1
+    assert read_schools(store, SCOPE, versions)['NPSN'].tolist() == ['101', '103']
+    assert read_dapodik(store, sudin_map, SCOPE, versions)['NAMA_LENGKAP'].tolist() == ['ANI', 'DEDI']
+
+    keys = ParticipantKeySet(str(tmp_path / 'keys'))
+    latest, _ = read_training(store, ['Pendidik'], keys, sudin_map, SCOPE)
+    keyed, (hashes, _) = read_training(store, ['Pendidik'], keys, sudin_map, SCOPE, versions)
+    assert latest['NAMA_PESERTA'].tolist() == ['ANI', 'CICI', 'DEDI', 'EKA', 'FAJAR']
+    assert keyed['NAMA_PESERTA'].tolist() == ['ANI', 'CICI', 'DEDI', 'EKA']
+    assert len(hashes) == 4
+    # Versi lama & baru punya generation yang sama -> himpunan kunci tidak dibangun ulang bolak-balik
+    assert keys.state['sheets']['Pendidik'] == {'rows': 6, 'generation': store.generation('Pendidik')}
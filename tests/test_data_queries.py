@@ -0,0 +1,88 @@
+import os
+
+import pandas as pd
+import pytest
+
+import data_store
+from benchmark import SHEET_NAMES, TARGET_KABUPATEN
+from data_partition import read_dapodik, read_schools, read_sudin_map, read_training
+from data_pipeline import SCHOOL_SCHEMA, apply_schema, clean_training_data
+from data_queries import RecapQueries, SnapshotQueries
+from participant_keys import ParticipantKeySet
+from recap_oracle import RecapCube
+
+
+def append_copies(source, store, names):
+    # Tambahkan salinan baris pertama setiap sheet lalu sinkronkan (versi snapshot naik)
+    for name in names:
+        source.append_rows(name, [source.sheets[name][1]])
+    store.sync_many(names)
+
+
+def test_engine_reads_its_keyed_version(snapshot, tmp_path):
+    source, store = snapshot
+    names = SHEET_NAMES + ['data_sekolah', 'data_dapodik_name']
+    versions = {name: store.version(name) for name in names}
+    dapodik_rows = len(source.sheets['data_dapodik_name']) - 1
+    append_copies(source, store, ['data_dapodik_name'])
+
+    keys = ParticipantKeySet(str(tmp_path / 'keys'))
+    old = SnapshotQueries(store, SHEET_NAMES, keys, scope=[], versions=versions)
+    new = SnapshotQueries(store, SHEET_NAMES, keys, scope=[])
+    assert old.run('dapodik_rows')['ROWS'].iat[0] == dapodik_rows
+    assert new.run('dapodik_rows')['ROWS'].iat[0] == dapodik_rows + 1
+
+
+def test_engine_survives_pruned_part_files(snapshot, tmp_path, monkeypatch):
+    monkeypatch.setattr(data_store, 'MAX_PARTS', 1)  # setiap append memicu compaction -> part lama tidak dirujuk
+    source, store = snapshot
+    names = SHEET_NAMES + ['data_dapodik_name']
+    queries = SnapshotQueries(store, SHEET_NAMES, ParticipantKeySet(str(tmp_path / 'keys')), scope=TARGET_KABUPATEN)
+    expected = {name: queries.run(name) for name in ('reco_school_list', 'dapodik_rows')}
+    first_parts = [path for name in names for path, _ in store.part_files(name)]
+
+    for _ in range(data_store.KEEP_VERSIONS + 1):
+        append_copies(source, store, names)
+    assert not any(os.path.exists(path) for path in first_parts)
+    for name, result in expected.items():
+        assert queries.run(name).equals(result)
+
+
+def table_rows(queries, table):
+    return queries.connection.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+
+
+def test_raw_tables_hold_only_scope_partition(snapshot, tmp_path):
+    source, store = snapshot
+    keys = ParticipantKeySet(str(tmp_path / 'keys'))
+    sudin_map = read_sudin_map(store)
+    queries = SnapshotQueries(store, SHEET_NAMES, keys, scope=TARGET_KABUPATEN)
+    df_raw, _ = read_training(store, SHEET_NAMES, keys, sudin_map, TARGET_KABUPATEN)
+    assert table_rows(queries, 'raw_pelatihan') == len(df_raw)
+    assert table_rows(queries, 'raw_dapodik') == len(read_dapodik(store, sudin_map, TARGET_KABUPATEN))
+    assert table_rows(queries, 'raw_sekolah') == len(read_schools(store, TARGET_KABUPATEN))
+    # Data sintetis: sepertiga sekolah di luar scope
+    assert table_rows(queries, 'raw_pelatihan') < sum(len(source.sheets[name]) - 1 for name in SHEET_NAMES)
+    assert table_rows(queries, 'sudin_map') == len(sudin_map)
+
+
+@pytest.mark.parametrize('scope', [TARGET_KABUPATEN, []])
+def test_recap_queries_match_pandas_oracle(snapshot, tmp_path, scope):
+    _, store = snapshot
+    keys = ParticipantKeySet(str(tmp_path / 'keys'))
+    df, _, _ = clean_training_data(*read_training(store, SHEET_NAMES, keys, read_sudin_map(store), scope))
+    df_sekolah = read_schools(store, scope)
+    df_sekolah['TIPE'] = df_sekolah['TIPE'].replace('', pd.NA).replace('DIKMAS', 'PKBM')
+    df_sekolah = apply_schema(df_sekolah.dropna(subset=['TIPE']), SCHOOL_SCHEMA)
+
+    oracle = RecapCube(df, df_sekolah, scope)
+    recap = RecapQueries(SnapshotQueries(store, SHEET_NAMES, keys, scope=scope), scope)
+    assert recap.status_options == oracle.status_options
+    assert recap.all_jenjang == oracle.all_jenjang
+    for pelatihan in SHEET_NAMES:
+        for statuses in ([], ['NEGERI'], ['NEGERI', 'SWASTA']):
+            pd.testing.assert_frame_equal(recap.summary(pelatihan, statuses), oracle.summary(pelatihan, statuses))
+            for jenjang in recap.jenjang_for(pelatihan):
+                assert recap.missing_schools(pelatihan, statuses, jenjang).astype(str).equals(
+                    oracle.missing_schools(pelatihan, statuses, jenjang).astype(str)
+                )
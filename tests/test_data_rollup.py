@@ -0,0 +1,85 @@
+from benchmark import SHEET_NAMES, TARGET_KABUPATEN, generate_sheets
+from data_partition import read_sudin_map
+from data_rollup import TrainingRollup
+from data_store import InMemorySheetSource, SnapshotStore
+from participant_keys import ParticipantKeySet
+
+
+def assert_same_tables(actual, expected):
+    assert actual.tables.keys() == expected.tables.keys()
+    for key, table in expected.tables.items():
+        assert actual.tables[key].astype(str).reset_index(drop=True).equals(table.astype(str).reset_index(drop=True)), key
+
+
+def full_rebuild(store, sudin_map, tmp_path, name):
+    return TrainingRollup().update(
+        store, SHEET_NAMES, ParticipantKeySet(str(tmp_path / name)), sudin_map, 0, TARGET_KABUPATEN
+    )
+
+
+def test_incremental_rollup_matches_full_rebuild(tmp_path, monkeypatch):
+    sheets = generate_sheets(3000)
+    # Baris terakhir ditahan lalu di-append (termasuk duplikat baris lama) setelah rollup pertama
+    held = {name: sheets[name][-150:] + sheets[name][1:21] for name in SHEET_NAMES[:2]}
+    for name in held:
+        sheets[name] = sheets[name][:-150]
+    source = InMemorySheetSource(sheets)
+    store = SnapshotStore(source, root=str(tmp_path / 'snapshot'))
+    store.sync_many(SHEET_NAMES + ['data_sekolah', 'data_dapodik_name'])
+    sudin_map = read_sudin_map(store)
+    keys = ParticipantKeySet(str(tmp_path / 'keys'))
+
+    rollup = TrainingRollup()
+    first = rollup.update(store, SHEET_NAMES, keys, sudin_map, 0, TARGET_KABUPATEN)
+    first_points = first.points
+    assert rollup.update(store, SHEET_NAMES, keys, sudin_map, 0, TARGET_KABUPATEN).tables is first.tables
+
+    extended = []
+    extend = TrainingRollup._extend
+    monkeypatch.setattr(TrainingRollup, '_extend', lambda self, daily: (extended.append(len(daily)), extend(self, daily)))
+    for name, rows in held.items():
+        source.append_rows(name, rows)
+    store.sync_many(SHEET_NAMES)
+    trends = rollup.update(store, SHEET_NAMES, keys, sudin_map, 0, TARGET_KABUPATEN)
+    assert extended
+    assert_same_tables(trends, full_rebuild(store, sudin_map, tmp_path, 'keys-full'))
+    assert first.points == first_points  # versi lama yang dipegang sesi lain tidak berubah
+
+
+def test_rewritten_sheet_rebuilds_rollup(tmp_path):
+    source = InMemorySheetSource(generate_sheets(3000))
+    store = SnapshotStore(source, root=str(tmp_path / 'snapshot'))
+    store.sync_many(SHEET_NAMES + ['data_sekolah', 'data_dapodik_name'])
+    sudin_map = read_sudin_map(store)
+    keys = ParticipantKeySet(str(tmp_path / 'keys'))
+    rollup = TrainingRollup()
+    rollup.update(store, SHEET_NAMES, keys, sudin_map, 0, TARGET_KABUPATEN)
+
+    # Tanggal baris pertama (sekolah di dalam scope) diedit -> reconcile membangun ulang snapshot (generation naik)
+    source.sheets['Pendidik'][1][1] = '01/01/2022'
+    store.sync_many(SHEET_NAMES, full=True)
+    trends = rollup.update(store, SHEET_NAMES, keys, sudin_map, 0, TARGET_KABUPATEN)
+    assert (trends.series('Bulanan', 'PELATIHAN', 'Pendidik')['PERIODE'].dt.year == 2022).any()
+    assert_same_tables(trends, full_rebuild(store, sudin_map, tmp_path, 'keys-full'))
+
+
+def test_older_keyed_version_rolls_back(tmp_path):
+    sheets = generate_sheets(3000)
+    held = sheets['Pendidik'][-100:]
+    sheets['Pendidik'] = sheets['Pendidik'][:-100]
+    source = InMemorySheetSource(sheets)
+    store = SnapshotStore(source, root=str(tmp_path / 'snapshot'))
+    store.sync_many(SHEET_NAMES + ['data_sekolah', 'data_dapodik_name'])
+    old_versions = {name: store.version(name) for name in SHEET_NAMES}
+    sudin_map = read_sudin_map(store)
+    keys = ParticipantKeySet(str(tmp_path / 'keys'))
+    old = full_rebuild(store, sudin_map, tmp_path, 'keys-old')
+
+    source.append_rows('Pendidik', held)
+    store.sync_many(SHEET_NAMES)
+    rollup = TrainingRollup()
+    new = rollup.update(store, SHEET_NAMES, keys, sudin_map, 0, TARGET_KABUPATEN)
+    # Sesi yang masih memegang versi lama: hasilnya versi lama, bukan gabungan yang sudah lebih panjang
+    rolled_back = rollup.update(store, SHEET_NAMES, keys, sudin_map, 0, TARGET_KABUPATEN, versions=old_versions)
+    assert rolled_back.points < new.points
+    assert_same_tables(rolled_back, old)
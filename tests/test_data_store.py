@@ -0,0 +1,96 @@
+import os
+
+import pytest
+
+from data_store import InMemorySheetSource, SnapshotStore
+
+HEADER = ['NAMA_PESERTA', 'NPSN', 'PELATIHAN']
+
+
+def make_store(tmp_path, rows):
+    source = InMemorySheetSource({'Pendidik': [HEADER] + rows})
+    store = SnapshotStore(source, root=str(tmp_path))
+    store.sync('Pendidik')
+    return source, store
+
+
+def test_incremental_sync_reads_only_new_rows(tmp_path):
+    source, store = make_store(tmp_path, [['ANI', '101', 'A'], ['BUDI', '102', 'A']])
+    source.rows_read = 0
+    source.append_rows('Pendidik', [['CICI', '103', 'B']])
+    store.sync('Pendidik')
+    assert source.rows_read == 3  # header + baris jangkar + baris baru
+    assert store.load('Pendidik')['NAMA_PESERTA'].tolist() == ['ANI', 'BUDI', 'CICI']
+    assert store.generation('Pendidik') == 1
+
+
+def test_reconcile_picks_up_edited_rows(tmp_path):
+    source, store = make_store(tmp_path, [['ANI', '101', 'A'], ['BUDI', '102', 'A']])
+    source.sheets['Pendidik'][1][0] = 'ANI LESTARI'
+    store.sync('Pendidik')
+    assert store.load('Pendidik')['NAMA_PESERTA'].tolist() == ['ANI', 'BUDI']  # sync biasa hanya baris baru
+
+    store.sync('Pendidik', full=True)
+    assert store.load('Pendidik')['NAMA_PESERTA'].tolist() == ['ANI LESTARI', 'BUDI']
+    assert store.generation('Pendidik') == 2
+
+
+def test_incremental_sync_rebuilds_when_last_row_changes(tmp_path):
+    source, store = make_store(tmp_path, [['ANI', '101', 'A'], ['BUDI', '102', 'A'], ['CICI', '103', 'B']])
+    del source.sheets['Pendidik'][3]
+    source.sheets['Pendidik'][2][0] = 'BUDI SANTOSO'
+    store.sync('Pendidik')
+    assert store.load('Pendidik')['NAMA_PESERTA'].tolist() == ['ANI', 'BUDI SANTOSO']
+    assert store.generation('Pendidik') == 2
+
+
+def test_reconcile_picks_up_deleted_rows(tmp_path):
+    source, store = make_store(tmp_path, [['ANI', '101', 'A'], ['BUDI', '102', 'A'], ['CICI', '103', 'B']])
+    del source.sheets['Pendidik'][1]
+    store.sync('Pendidik', full=True)
+    assert store.load('Pendidik')['NAMA_PESERTA'].tolist() == ['BUDI', 'CICI']
+    assert store.generation('Pendidik') == 2
+
+
+@pytest.mark.parametrize('appended', [[], [['CICI', '103', 'B']]])
+def test_reconcile_without_edits_keeps_generation(tmp_path, appended):
+    source, store = make_store(tmp_path, [['ANI', '101', 'A'], ['BUDI', '102']])  # baris terakhir tidak lengkap
+    version = store.version('Pendidik')
+    source.sheets['Pendidik'].extend(appended)
+    store.sync('Pendidik', full=True)
+    assert store.generation('Pendidik') == 1
+    assert store.version('Pendidik') == version + (1 if appended else 0)
+    assert len(store.load('Pendidik')) == 2 + len(appended)
+
+
+def test_old_parts_outlive_superseded_versions(tmp_path, monkeypatch):
+    import data_store
+    monkeypatch.setattr(data_store, 'MAX_PARTS', 2)
+    source, store = make_store(tmp_path, [['ANI', '101', 'A']])
+    first_version = store.version('Pendidik')
+    first_parts = [path for path, _ in store.part_files('Pendidik')]
+    for i in range(2):  # part ke-3 memicu compaction -> part lama tidak dirujuk manifest terbaru
+        source.append_rows('Pendidik', [[f"PESERTA {i}", f"20{i}", 'A']])
+        store.sync('Pendidik')
+    assert len(store.part_files('Pendidik')) == 1
+    # Versi lama (mis. kunci cache sesi lain) masih bisa dibaca utuh
+    assert store.load('Pendidik', version=first_version)['NAMA_PESERTA'].tolist() == ['ANI']
+    assert all(os.path.exists(path) for path in first_parts)
+
+    for i in range(data_store.KEEP_VERSIONS):
+        source.append_rows('Pendidik', [[f"PESERTA BARU {i}", f"30{i}", 'B']])
+        store.sync('Pendidik')
+    assert not any(os.path.exists(path) for path in first_parts)
+    # Versi yang sudah dibuang -> versi terbaru
+    assert len(store.load('Pendidik', version=first_version)) == 3 + data_store.KEEP_VERSIONS
+
+
+def test_refresher_full_refresh_reconciles(tmp_path):
+    from data_store import SnapshotRefresher
+    source, store = make_store(tmp_path, [['ANI', '101', 'A'], ['BUDI', '102', 'A']])
+    refresher = SnapshotRefresher(store, ['Pendidik'], interval=3600, reconcile_interval=0)
+    source.sheets['Pendidik'][1][0] = 'ANI LESTARI'
+    source.modified += 1
+    assert refresher.refresh() is False  # append-only: tidak ada baris baru
+    assert refresher.refresh(force=True, full=True) is True
+    assert store.load('Pendidik')['NAMA_PESERTA'].tolist() == ['ANI LESTARI', 'BUDI']
@@ -0,0 +1,128 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from data_store import InMemorySheetSource
+from data_upload import UploadJob, UploadRowFilter, append_with_backoff
+from participant_keys import ParticipantKeySet
+
+COLUMNS = ['NAMA_PESERTA', 'NPSN', 'NAMA_PELATIHAN']
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.response = FakeResponse(status_code)
+
+
+class FlakySheetSource(InMemorySheetSource):
+    # Worksheet palsu: append ke-n (dihitung dari 1) gagal dengan status yang diberikan
+    def __init__(self, sheets, failures=None):
+        super().__init__(sheets)
+        self.failures = dict(failures or {})
+        self.calls = 0
+
+    def append_rows(self, sheet_name, rows):
+        self.calls += 1
+        status = self.failures.pop(self.calls, None)
+        if status is not None:
+            raise FakeAPIError(status)
+        return super().append_rows(sheet_name, rows)
+
+
+def make_chunks(rows, chunk_rows):
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    return [df.iloc[i:i + chunk_rows] for i in range(0, len(df), chunk_rows)]
+
+
+def sheet_rows(source):
+    return source.sheets['Pendidik'][1:]
+
+
+def new_source(failures=None):
+    return FlakySheetSource({'Pendidik': [COLUMNS]}, failures)
+
+
+def test_backoff_retries_quota_errors():
+    source, delays = new_source({1: 429, 2: 503}), []
+    append_with_backoff(source, 'Pendidik', [['ANI', '101', 'A']], sleep=delays.append)
+    assert delays == [1.0, 2.0]
+    assert sheet_rows(source) == [['ANI', '101', 'A']]
+
+
+def test_backoff_does_not_retry_client_errors():
+    source, delays = new_source({1: 400}), []
+    with pytest.raises(FakeAPIError):
+        append_with_backoff(source, 'Pendidik', [['ANI', '101', 'A']], sleep=delays.append)
+    assert delays == [] and source.calls == 1
+
+
+def test_backoff_gives_up_after_retries():
+    source, delays = new_source({n: 429 for n in range(1, 4)}), []
+    with pytest.raises(FakeAPIError):
+        append_with_backoff(source, 'Pendidik', [['ANI', '101', 'A']], retries=3, sleep=delays.append)
+    assert delays == [1.0, 2.0]
+
+
+def test_resume_continues_after_last_batch(tmp_path):
+    rows = [[f"PESERTA {i}", str(100 + i), 'A'] for i in range(10)]
+    # Potongan 3 baris, batch 2 baris: append ketiga (potongan kedua) gagal permanen -> 3 baris terkirim
+    source = new_source({3: 400})
+    job = UploadJob(source, 'Pendidik', 'abc123', root=str(tmp_path), batch_rows=2, sleep=lambda s: None)
+    with pytest.raises(FakeAPIError):
+        job.run(make_chunks(rows, 3), COLUMNS)
+    assert job.appended_rows == 3 and not job.done
+
+    job = UploadJob(source, 'Pendidik', 'abc123', root=str(tmp_path), batch_rows=2, sleep=lambda s: None)
+    assert job.appended_rows == 3
+    job.run(make_chunks(rows, 3), COLUMNS)
+    assert job.done and job.appended_rows == 10
+    assert sheet_rows(source) == rows
+
+
+def test_resume_keeps_in_file_duplicates_rejected(tmp_path):
+    # Baris 'ANI' berulang setelah titik putus: tetap ditolak karena filter diisi ulang dari baris terkirim
+    rows = [['ANI', '101', 'A'], ['BUDI', '102', 'A'], ['CICI', '103', 'A'], ['ANI', '101', 'A'], ['', '104', 'A']]
+    keys = ParticipantKeySet(root=str(tmp_path / 'keys'))
+    source = new_source({2: 400})
+    job = UploadJob(source, 'Pendidik', 'abc123', root=str(tmp_path), batch_rows=2, sleep=lambda s: None)
+    with pytest.raises(FakeAPIError):
+        job.run(make_chunks(rows, 5), COLUMNS, row_filter=UploadRowFilter(keys))
+    assert job.appended_rows == 2
+
+    job = UploadJob(source, 'Pendidik', 'abc123', root=str(tmp_path), batch_rows=2, sleep=lambda s: None)
+    row_filter = UploadRowFilter(keys)
+    job.run(make_chunks(rows, 5), COLUMNS, row_filter=row_filter, seed=row_filter.seed)
+    assert sheet_rows(source) == rows[:3]
+    assert job.appended_rows == 3 and job.rejected_rows == 2
+    assert pd.concat(row_filter.rejected)['ALASAN'].tolist() == ['Duplikat', 'Nama/NPSN kosong']
+
+
+def test_done_job_expires_and_can_be_reset(tmp_path):
+    rows = [['ANI', '101', 'A']]
+    source = new_source()
+    job = UploadJob(source, 'Pendidik', 'abc123', root=str(tmp_path))
+    job.run(make_chunks(rows, 5), COLUMNS)
+    assert UploadJob(source, 'Pendidik', 'abc123', root=str(tmp_path)).done
+
+    # Selesai lebih lama dari done_ttl -> dianggap job baru
+    with open(job.path, encoding='utf-8') as f:
+        progress = json.load(f)
+    progress['finished'] -= 120
+    with open(job.path, 'w', encoding='utf-8') as f:
+        json.dump(progress, f)
+    assert not UploadJob(source, 'Pendidik', 'abc123', root=str(tmp_path), done_ttl=60).done
+
+    job = UploadJob(source, 'Pendidik', 'abc123', root=str(tmp_path))
+    job.reset()
+    assert not job.done and job.progress['digest'] == 'abc123'
+    job.run(make_chunks(rows, 5), COLUMNS)
+    assert len(sheet_rows(source)) == 2
+    assert os.path.exists(job.path)
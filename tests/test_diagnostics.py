@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+from diagnostics import cache_miss, recent_runs, run, stage, timed
+
+
+def last_run(label):
+    return [summary for summary in recent_runs() if summary['run'] == label][-1]
+
+
+def test_nested_stages_record_rows_and_durations():
+    with run('nested'):
+        with stage('outer', rows=5):
+            time.sleep(0.01)
+            with stage('inner') as record:
+                time.sleep(0.02)
+                record['rows'] = 3
+        with stage('after'):
+            pass
+    summary = last_run('nested')
+    stages = {r['stage']: r for r in summary['stages']}
+    # Tahap dicatat saat selesai: yang di dalam lebih dulu
+    assert [r['stage'] for r in summary['stages']] == ['inner', 'outer', 'after']
+    assert (stages['outer']['depth'], stages['inner']['depth'], stages['after']['depth']) == (0, 1, 0)
+    assert (stages['outer']['rows'], stages['inner']['rows'], stages['after']['rows']) == (5, 3, None)
+    assert stages['inner']['seconds'] >= 0.02
+    assert stages['outer']['seconds'] >= stages['inner']['seconds'] + 0.01
+    assert stages['outer']['offset'] < stages['inner']['offset'] < stages['after']['offset']
+    assert summary['seconds'] >= stages['outer']['seconds']
+
+
+def test_cache_miss_marks_enclosing_cached_stage():
+    cache = {}
+
+    @timed('load_child', rows=len)
+    def load_child(key):
+        if key not in cache:
+            cache_miss()
+            cache[key] = list(range(key))
+        return cache[key]
+
+    @timed('load_parent', rows=lambda r: r[0])
+    def load_parent(key):
+        if ('parent', key) not in cache:
+            with stage('build'):
+                cache_miss()  # tahap biasa dilewati -> yang ditandai loader di luarnya
+                cache[('parent', key)] = (key, load_child(key))
+        return cache[('parent', key)]
+
+    with run('cached'):
+        load_parent(4)
+        load_parent(4)
+    summary = last_run('cached')
+    assert [(r['stage'], r['cache'], r['rows']) for r in summary['stages']] == [
+        ('load_child', 'miss', 4), ('build', None, None), ('load_parent', 'miss', 4), ('load_parent', 'hit', 4),
+    ]
+    assert (summary['cache_hits'], summary['cache_misses']) == (1, 2)
+
+
+def test_errors_recorded_and_no_run_records_nothing():
+    with pytest.raises(KeyError):
+        with run('failing'):
+            with stage('broken'):
+                raise KeyError('x')
+    assert last_run('failing')['stages'][0]['error'] == 'KeyError'
+
+    before = len(recent_runs())
+    with stage('outside') as record:
+        cache_miss()
+    assert record == {} and len(recent_runs()) == before
+
+
+def test_runs_separate_across_threads():
+    # Dua sesi bergantian di thread berbeda: ContextVar menjaga tahap masing-masing di run-nya sendiri
+    barrier = threading.Barrier(2)
+    errors = []
+
+    def session(label):
+        try:
+            with run(label):
+                for i in range(3):
+                    with stage(f"{label}-{i}"):
+                        barrier.wait(timeout=5)
+                    barrier.wait(timeout=5)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=session, args=(label,)) for label in ('sesi-a', 'sesi-b')]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    for label in ('sesi-a', 'sesi-b'):
+        stages = last_run(label)['stages']
+        assert [r['stage'] for r in stages] == [f"{label}-{i}" for i in range(3)]
+        assert all(r['depth'] == 0 for r in stages)
+
+
+def test_run_inside_run_recorded_as_stage():
+    with run('outer-run'):
+        with run('inner-run'):
+            with stage('work'):
+                pass
+    summary = last_run('outer-run')
+    assert [(r['stage'], r['depth']) for r in summary['stages']] == [('work', 1), ('inner-run', 0)]
+    assert not [s for s in recent_runs() if s['run'] == 'inner-run']
@@ -0,0 +1,233 @@
+import functools
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import gspread
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from data_store import GspreadSource, SnapshotStore
+
+SPREADSHEET_ID = 'spreadsheet-lokal'
+
+
+class FakeSheetsHandler(BaseHTTPRequestHandler):
+    # Meniru endpoint Google yang dipakai GspreadSource: token OAuth, metadata spreadsheet, values:batchGet,
+    # values:append & metadata Drive. values:batchGet: range A1, grid = jumlah baris sheet (pas, seperti setelah
+    # append_rows), sel kosong di akhir baris & baris kosong di akhir range tidak dikirim
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body, status=200):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if url.path == '/token':
+            return self._reply({'access_token': 'token-lokal', 'expires_in': 3600, 'token_type': 'Bearer'})
+        match = re.fullmatch(r'/v4/spreadsheets/[^/]+/values/(.+):append', url.path)
+        sheet_name = unquote(match.group(1)).partition('!')[0].strip("'")
+        values = json.loads(body)['values']
+        self.server.sheets[sheet_name].extend(values)
+        self._reply({'spreadsheetId': SPREADSHEET_ID, 'updates': {'updatedRows': len(values)}})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        sheets = self.server.sheets
+        if url.path.endswith('/values:batchGet'):
+            ranges = parse_qs(url.query)['ranges']
+            self.server.requests.append(ranges)
+            value_ranges = []
+            for a1 in ranges:
+                sheet_name, first_row, last_row, n_cols = self._parse(a1)
+                grid_rows = len(sheets[sheet_name])
+                if first_row > grid_rows:
+                    return self._reply({'error': {
+                        'code': 400, 'status': 'INVALID_ARGUMENT',
+                        'message': f"Range ({a1}) exceeds grid limits. Max rows: {grid_rows}, max columns: 26",
+                    }}, status=400)
+                rows = [list(row[:n_cols]) for row in sheets[sheet_name][first_row - 1:last_row]]
+                for row in rows:
+                    while row and row[-1] == '':
+                        row.pop()
+                while rows and not rows[-1]:
+                    rows.pop()
+                value_ranges.append({'range': a1, 'values': rows} if rows else {'range': a1})
+            return self._reply({'spreadsheetId': SPREADSHEET_ID, 'valueRanges': value_ranges})
+        if url.path.startswith('/drive/v3/files/'):
+            return self._reply({'id': SPREADSHEET_ID, 'modifiedTime': '2026-10-18T05:00:00.000Z'})
+        return self._reply({
+            'spreadsheetId': SPREADSHEET_ID, 'properties': {'title': 'SIPADU'},
+            'sheets': [
+                {'properties': {'sheetId': i, 'title': name, 'index': i,
+                                'gridProperties': {'rowCount': len(rows), 'columnCount': 26}}}
+                for i, (name, rows) in enumerate(sheets.items())
+            ],
+        })
+
+    @staticmethod
+    def _parse(a1):
+        sheet_name, _, cells = a1.partition('!')
+        sheet_name = sheet_name.strip("'")
+        if not cells:
+            return sheet_name, 1, None, None
+        match = re.fullmatch(r'A(\d+):([A-Z]+)(\d*)', cells)
+        if match:
+            n_cols = gspread.utils.a1_to_rowcol(f"{match.group(2)}1")[1]
+            return sheet_name, int(match.group(1)), int(match.group(3)) if match.group(3) else None, n_cols
+        first_row, last_row = cells.split(':')
+        return sheet_name, int(first_row), int(last_row), None
+
+
+@pytest.fixture
+def server(sheets, monkeypatch):
+    # Server HTTP lokal; client gspread asli (otorisasi service account, encoding request) diarahkan ke sini
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), FakeSheetsHandler)
+    httpd.sheets, httpd.requests = sheets, []
+    httpd.base = f"http://127.0.0.1:{httpd.server_address[1]}"
+    threading.Thread(target=httpd.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+    for name in ('HTTP_PROXY', 'HTTPS_PROXY', 'ALL_PROXY', 'http_proxy', 'https_proxy', 'all_proxy'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('NO_PROXY', '127.0.0.1')
+    for name in dir(gspread.http_client):
+        value = getattr(gspread.http_client, name)
+        if isinstance(value, str) and value.startswith('https://'):
+            for google in ('https://sheets.googleapis.com', 'https://www.googleapis.com'):
+                value = value.replace(google, httpd.base)
+            monkeypatch.setattr(gspread.http_client, name, value)
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@functools.lru_cache(maxsize=None)
+def private_key_pem():
+    # Kunci RSA sekali pakai untuk menandatangani JWT service account (dibuat sekali per sesi test)
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode('ascii')
+
+
+def service_account_json(base):
+    return json.dumps({
+        'type': 'service_account', 'project_id': 'sipadu-test', 'private_key_id': 'lokal', 'private_key': private_key_pem(),
+        'client_email': 'sipadu@sipadu-test.iam.gserviceaccount.com', 'client_id': '1',
+        'token_uri': f"{base}/token",
+    })
+
+
+def make_source(server):
+    # GspreadSource asli: service account -> token dari server lokal -> open_by_key -> values:batchGet
+    return GspreadSource(service_account_json(server.base), SPREADSHEET_ID)
+
+
+@pytest.fixture
+def sheets():
+    return {
+        'Pendidik': [['NAMA', 'NPSN', 'PELATIHAN'], ['ANI', '101', 'A'], ['BUDI', '102', 'A']],
+        'Tendik': [['NAMA', 'NPSN', 'PELATIHAN'], ['CICI', '103', 'B']],
+    }
+
+
+def test_range_past_grid_reads_as_empty(sheets, server):
+    source = make_source(server)
+    past_grid, tendik = source.read_ranges([('Pendidik', 4, None, 3), ('Tendik', 1, None, None)])
+    assert past_grid == []
+    assert tendik == sheets['Tendik']
+    # Batch ditolak (400 exceeds grid limits) -> diulang per range
+    assert server.requests == [["'Pendidik'!A4:C", "'Tendik'"], ["'Pendidik'!A4:C"], ["'Tendik'"]]
+
+
+def test_sync_after_exact_fit_append(sheets, server, tmp_path):
+    source = make_source(server)
+    store = SnapshotStore(source, root=str(tmp_path))
+    store.sync_many(['Pendidik', 'Tendik'])
+    # Tanpa baris baru: range tail dimulai dari baris terakhir yang tersimpan (masih di dalam grid)
+    assert store.sync_many(['Pendidik', 'Tendik']) == {'Pendidik': 1, 'Tendik': 1}
+    assert len(server.requests[-1]) == 4
+
+    sheets['Pendidik'].append(['DEDI', '104', 'A'])
+    assert store.sync_many(['Pendidik', 'Tendik']) == {'Pendidik': 2, 'Tendik': 1}
+    assert store.load('Pendidik')['NAMA'].tolist() == ['ANI', 'BUDI', 'DEDI']
+    assert store.generation('Pendidik') == 1
+
+
+def test_sync_after_rows_deleted_past_grid(sheets, server, tmp_path):
+    source = make_source(server)
+    store = SnapshotStore(source, root=str(tmp_path))
+    store.sync_many(['Pendidik', 'Tendik'])
+    del sheets['Pendidik'][1:]  # grid sekarang hanya baris header
+    sheets['Tendik'].append(['EKO', '105', 'B'])
+    store.sync_many(['Pendidik', 'Tendik'])
+    assert store.load('Pendidik').empty
+    assert store.generation('Pendidik') == 2
+    assert store.load('Tendik')['NAMA'].tolist() == ['CICI', 'EKO']
+    assert store.generation('Tendik') == 1
+
+
+@pytest.mark.parametrize('args, expected', [
+    (('Pendidik', 120, None, 17), "'Pendidik'!A120:Q"),
+    (('Pendidik', 2, 50, 28), "'Pendidik'!A2:AB50"),
+    (('Data Sekolah', 1, 1, None), "'Data Sekolah'!1:1"),
+    (('Tendik', 1, None, None), "'Tendik'"),
+])
+def test_a1_ranges(args, expected):
+    assert GspreadSource._a1(*args) == expected
+
+
+def test_all_sheets_in_one_batch(sheets, server):
+    source = make_source(server)
+    results = source.read_ranges([('Pendidik', 1, 1, None), ('Pendidik', 3, None, 3), ('Tendik', 1, None, None)])
+    assert results == [[sheets['Pendidik'][0]], [sheets['Pendidik'][2]], sheets['Tendik']]
+    assert len(server.requests) == 1
+
+
+def test_whole_sheet_range_is_sliced_client_side(sheets, server):
+    source = make_source(server)
+    assert source.read_range('Pendidik', 2) == sheets['Pendidik'][1:]
+
+
+def test_ragged_rows_and_empty_tail(sheets, server, tmp_path):
+    sheets['Pendidik'].append(['CICI', '', ''])  # sel kosong di akhir baris tidak dikirim API
+    sheets['Tendik'].append(['', '', ''])  # baris kosong di akhir sheet tidak dikirim API
+    source = make_source(server)
+    store = SnapshotStore(source, root=str(tmp_path))
+    store.sync_many(['Pendidik', 'Tendik'])
+    assert store.load('Pendidik').iloc[-1].tolist() == ['CICI', '', '']
+    assert len(store.load('Tendik')) == 1
+
+    # Tail yang hanya berisi baris jangkar = tidak ada baris baru; versi tidak berubah
+    versions = {name: store.version(name) for name in sheets}
+    assert store.sync_many(['Pendidik', 'Tendik']) == versions
+    assert [store.generation(name) for name in sheets] == [1, 1]
+
+
+def test_header_change_rebuilds_sheet(sheets, server, tmp_path):
+    source = make_source(server)
+    store = SnapshotStore(source, root=str(tmp_path))
+    store.sync_many(['Pendidik', 'Tendik'])
+    sheets['Tendik'][0] = ['NAMA', 'NPSN', 'PELATIHAN', 'KECAMATAN']
+    sheets['Tendik'].append(['DEDI', '104', 'B', 'KOJA'])
+    store.sync_many(['Pendidik', 'Tendik'])
+    assert store.header('Tendik') == ['NAMA', 'NPSN', 'PELATIHAN', 'KECAMATAN']
+    assert store.load('Tendik')['KECAMATAN'].tolist() == ['', 'KOJA']
+    assert store.generation('Tendik') == 2
+    assert store.generation('Pendidik') == 1
+
+
+def test_append_and_modified_time(sheets, server):
+    source = make_source(server)
+    source.append_rows('Tendik', [['DEDI', '104', 'B']])
+    assert sheets['Tendik'][-1] == ['DEDI', '104', 'B']
+    assert source.modified_time() == '2026-10-18T05:00:00.000Z'
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from data_pipeline import ROW_BLANK, ROW_DUPLICATE, ROW_OK
+from participant_keys import ParticipantKeySet
+
+COLUMNS = ['NAMA_PESERTA', 'NPSN', 'NAMA_PELATIHAN']
+
+
+def frame(rows):
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def test_incremental_update_flags_only_new_rows(tmp_path):
+    keys = ParticipantKeySet(str(tmp_path))
+    rows = [['ANI', '101', 'A'], ['ANI', '101', 'A'], ['', '102', 'A']]
+    _, flags = keys.update({'Pendidik': frame(rows)}, {'Pendidik': 1})
+    assert flags.tolist() == [ROW_OK, ROW_DUPLICATE, ROW_BLANK]
+
+    rows += [['BUDI', '103', 'A'], ['ANI', '101', 'A']]
+    hashes, flags = keys.update({'Pendidik': frame(rows)}, {'Pendidik': 1})
+    assert flags.tolist() == [ROW_OK, ROW_DUPLICATE, ROW_BLANK, ROW_OK, ROW_DUPLICATE]
+    assert len(keys.keys) == 2
+
+    # Dimuat ulang dari disk -> status yang sama
+    reloaded = ParticipantKeySet(str(tmp_path))
+    assert np.array_equal(reloaded.update({'Pendidik': frame(rows)}, {'Pendidik': 1})[0], hashes)
+
+
+def test_generation_change_rebuilds(tmp_path):
+    original = frame([['ANI', '101', 'A'], ['BUDI', '102', 'A']])
+    # Baris pertama diedit di sheet lalu ANI ditambahkan lagi; snapshot dibangun ulang (generation naik)
+    edited = frame([['ANI LESTARI', '101', 'A'], ['BUDI', '102', 'A'], ['ANI', '101', 'A']])
+
+    keys = ParticipantKeySet(str(tmp_path / 'rebuild'))
+    keys.update({'Pendidik': original}, {'Pendidik': 1})
+    _, flags = keys.update({'Pendidik': edited}, {'Pendidik': 2})
+    assert flags.tolist() == [ROW_OK, ROW_OK, ROW_OK]
+    assert len(keys.keys) == 3
+    assert ParticipantKeySet(str(tmp_path / 'rebuild')).state['sheets']['Pendidik'] == {'rows': 3, 'generation': 2}
+
+    # Generation sama = dianggap append: baris tersimpan dipakai apa adanya, kunci lama ANI masih ada
+    stale = ParticipantKeySet(str(tmp_path / 'stale'))
+    stale.update({'Pendidik': original}, {'Pendidik': 1})
+    _, flags = stale.update({'Pendidik': edited}, {'Pendidik': 1})
+    assert flags.tolist() == [ROW_OK, ROW_OK, ROW_DUPLICATE]
+
+
+def test_check_rejects_existing_and_seen_keys(tmp_path):
+    keys = ParticipantKeySet(str(tmp_path))
+    keys.update({'Pendidik': frame([['ANI', '101', 'A']])}, {'Pendidik': 1})
+    upload = frame([['ANI', '101', 'A'], ['BUDI', '102', 'A'], ['CICI', '103', 'A'], ['CICI', '103', 'A']])
+    seen, _ = keys.check(frame([['BUDI', '102', 'A']]))
+    _, flags = keys.check(upload, seen=seen)
+    assert flags.tolist() == [ROW_DUPLICATE, ROW_DUPLICATE, ROW_OK, ROW_DUPLICATE]
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from data_index import ParticipantIndex
+from data_pipeline import normalize_name
+from record_linkage import NameLinker, assign_one_to_one
+
+
+def link(participants, dapodik):
+    # participants / dapodik: [(NPSN_ID, nama)]
+    df = pd.DataFrame(participants, columns=['NPSN_ID', 'NAMA_PESERTA'])
+    df['NPSN_ID'] = df['NPSN_ID'].astype('Int64')
+    index = ParticipantIndex(df)
+    npsn_ids, names = zip(*dapodik)
+    linker = NameLinker(index, list(npsn_ids), normalize_name(pd.Series(names)))
+    return index, linker
+
+
+def linked_names(index, linker):
+    ids = linker.person_ids()
+    return [index.keys[i][1] if i >= 0 else None for i in ids]
+
+
+def test_subset_name_is_not_linked():
+    index, linker = link([(1, 'WAHYU HIDAYAT, M.Pd')], [(1, 'WAHYU HIDAYAT KURNIAWAN')])
+    assert linked_names(index, linker) == [None]
+    assert linker.confidence().tolist() == [0.0]
+
+
+def test_titles_typos_and_word_order_are_linked():
+    index, linker = link(
+        [(1, 'SITI AMINA'), (1, 'RIZKY MUHAMMAD')],
+        [(1, 'Dra. Siti Aminah'), (1, 'Muhammad Rizky, S.Pd')],
+    )
+    assert linked_names(index, linker) == ['SITI AMINA', 'RIZKY MUHAMMAD']
+
+
+def test_participant_is_claimed_once_per_school():
+    index, linker = link(
+        [(1, 'MUHAMMAD RIZKY')],
+        [(1, 'MUHAMAD RIZKI'), (1, 'MUHAMMAD RIZKI')],
+    )
+    # Skor tertinggi (MUHAMMAD RIZKI) mendapat peserta; nama lain tidak ikut mengklaimnya
+    assert linked_names(index, linker) == [None, 'MUHAMMAD RIZKY']
+
+
+def test_names_are_only_compared_within_the_same_school():
+    index, linker = link([(1, 'SITI AMINAH')], [(2, 'SITI AMINA')])
+    assert linked_names(index, linker) == [None]
+
+
+def test_exact_match_takes_the_participant_out_of_fuzzy_candidates():
+    index, linker = link([(1, 'SITI AMINAH')], [(1, 'SITI AMINA'), (1, 'Siti Aminah')])
+    assert linked_names(index, linker) == [None, 'SITI AMINAH']
+    assert linker.confidence().tolist() == [0.0, 100.0]
+
+
+def test_assignment_is_greedy_best_first():
+    scores = np.array([[90, 80], [95, 70], [60, 75]], dtype=np.float32)
+    assert assign_one_to_one(scores).tolist() == [1, 0, -1]
@@ -0,0 +1,139 @@
+import os
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark import SHEET_NAMES, TARGET_KABUPATEN
+from data_index import ParticipantIndex
+from data_partition import read_dapodik, read_schools, read_sudin_map, read_training
+from data_pipeline import DAPODIK_SCHEMA, SCHOOL_SCHEMA, apply_schema, clean_training_data, normalize_name
+from participant_keys import ParticipantKeySet
+from record_linkage import LINK_THRESHOLD, NameLinker
+import report_export
+from report_export import RecommendationTable, format_recommendation_report, get_or_create_export, recommendation_details
+
+
+def frame(n):
+    return pd.DataFrame({'NAMA': [f"PESERTA {i}" for i in range(n)], 'JUMLAH': range(n)})
+
+
+def test_exports_for_other_keys_are_kept(tmp_path):
+    root = str(tmp_path)
+    first = get_or_create_export('Laporan', ('v1', 85), 'csv', lambda: frame(10), root=root)
+    second = get_or_create_export('Laporan', ('v1', 90), 'csv', lambda: frame(10), root=root)
+    third = get_or_create_export('Laporan', ('v2', 85), 'csv', lambda: frame(10), root=root)
+    assert len({first, second, third}) == 3
+    assert all(os.path.exists(path) for path in (first, second, third))
+
+
+def test_cache_hit_does_not_rebuild(tmp_path):
+    builds = []
+    for _ in range(2):
+        get_or_create_export('Laporan', 'v1', 'csv', lambda: builds.append(1) or frame(5), root=str(tmp_path))
+    assert len(builds) == 1
+
+
+def test_budget_evicts_least_recently_used(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    paths = [get_or_create_export('Laporan', k, 'csv', lambda: frame(2000), root=root) for k in range(3)]
+    for age, path in enumerate(paths):
+        os.utime(path, (1000 + age, 1000 + age))
+    get_or_create_export('Laporan', 0, 'csv', lambda: frame(2000), root=root)  # hit -> paling baru dipakai
+    budget_mb = sum(os.path.getsize(path) for path in paths) / 1024 ** 2
+    monkeypatch.setattr(report_export, '_enforce_budget', partial(report_export._enforce_budget, budget_mb=budget_mb))
+    newest = get_or_create_export('Laporan', 3, 'csv', lambda: frame(2000), root=root)
+    assert os.path.exists(newest) and os.path.exists(paths[0])
+    assert not os.path.exists(paths[1])
+    assert os.path.exists(paths[2])
+
+
+@pytest.fixture
+def reco_inputs(snapshot, tmp_path):
+    # Disusun seperti benchmark.run_benchmark; baris Dapodik diacak (tidak urut NPSN) & beberapa NPSN tidak valid
+    _, store = snapshot
+    sudin_map = read_sudin_map(store)
+    df, _, _ = clean_training_data(*read_training(
+        store, SHEET_NAMES, ParticipantKeySet(str(tmp_path / 'keys')), sudin_map, TARGET_KABUPATEN))
+    df_sekolah = read_schools(store, TARGET_KABUPATEN)
+    df_sekolah['TIPE'] = df_sekolah['TIPE'].replace('', pd.NA).replace('DIKMAS', 'PKBM')
+    df_sekolah = apply_schema(df_sekolah.dropna(subset=['TIPE']), SCHOOL_SCHEMA)
+    df_dapodik = read_dapodik(store, sudin_map, TARGET_KABUPATEN).sample(frac=1, random_state=0)
+    df_dapodik.iloc[::41, df_dapodik.columns.get_loc('NPSN')] = ''
+    df_dapodik.iloc[1::41, df_dapodik.columns.get_loc('NPSN')] = 'BUKAN NPSN'
+    df_dapodik = apply_schema(df_dapodik, DAPODIK_SCHEMA)
+    df_dapodik['NAMA_CLEAN'] = normalize_name(df_dapodik['NAMA_LENGKAP'])
+    participant_index = ParticipantIndex(df)
+    name_linker = NameLinker(participant_index, df_dapodik['NPSN_ID'], df_dapodik['NAMA_CLEAN'])
+    table = RecommendationTable(df_dapodik, df_sekolah, name_linker, participant_index)
+    return df, df_dapodik, df_sekolah, table
+
+
+def expected_school(df_dapodik, df_sekolah, table, npsn_id_value, threshold):
+    # Jalur per sekolah tanpa tabel: saring baris Dapodik sekolah itu, gabung detail, hitung frekuensinya
+    positions = np.flatnonzero(df_dapodik['NPSN_ID'].to_numpy(dtype='int64', na_value=-1) == npsn_id_value)
+    school_df = recommendation_details(df_dapodik.iloc[positions], df_sekolah)
+    person_ids = table.name_linker.person_ids(threshold, positions)
+    school_df['JUMLAH_PELATIHAN'] = table.participant_index.frequency_of(person_ids).astype(int)
+    return school_df
+
+
+def test_school_matches_per_school_computation(reco_inputs):
+    _, df_dapodik, df_sekolah, table = reco_inputs
+    npsn_ids = df_dapodik['NPSN_ID'].dropna().unique()
+    assert len(npsn_ids) > 1
+    for npsn_id_value in npsn_ids[:25]:
+        for threshold in (LINK_THRESHOLD, 100):
+            actual = table.school(npsn_id_value, threshold)
+            expected = expected_school(df_dapodik, df_sekolah, table, npsn_id_value, threshold)
+            pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+            assert (table.details['NPSN_ID'].iloc[table.rows(npsn_id_value)] == npsn_id_value).all()
+    assert table.school(npsn_ids[0], LINK_THRESHOLD)['JUMLAH_PELATIHAN'].sum() > 0
+
+
+def test_school_frequency_counts_exact_names(reco_inputs):
+    # Ambang di atas 100 = hanya nama persis; frekuensi = jumlah baris pelatihan (NPSN_ID, NAMA_CLEAN)
+    df, df_dapodik, _, table = reco_inputs
+    counts = df.groupby([df['NPSN_ID'], normalize_name(df['NAMA_PESERTA'])]).size()
+    for npsn_id_value in df_dapodik['NPSN_ID'].dropna().unique()[:25]:
+        school_df = table.school(npsn_id_value, 101)
+        names = df_dapodik.loc[df_dapodik['NPSN_ID'] == npsn_id_value, 'NAMA_CLEAN']
+        expected = [int(counts.get((npsn_id_value, name), 0)) for name in names]
+        assert school_df['JUMLAH_PELATIHAN'].tolist() == expected
+
+
+def test_unknown_and_missing_npsn(reco_inputs):
+    _, df_dapodik, df_sekolah, table = reco_inputs
+    assert table.rows(123456789) == slice(0, 0)
+    unknown = table.school(123456789, LINK_THRESHOLD)
+    assert unknown.empty and 'JUMLAH_PELATIHAN' in unknown.columns
+
+    # NPSN kosong/tidak valid -> NPSN_ID NA -> dikelompokkan di bawah sentinel -1, tetap ikut laporan
+    missing = df_dapodik['NPSN_ID'].isna()
+    assert missing.sum() > 0
+    rows = table.rows(-1)
+    assert rows.stop - rows.start == missing.sum()
+    assert table.details['NPSN_ID'].iloc[rows].isna().all()
+    pd.testing.assert_frame_equal(
+        table.school(-1, LINK_THRESHOLD), expected_school(df_dapodik, df_sekolah, table, -1, LINK_THRESHOLD),
+        check_dtype=False,
+    )
+
+
+def test_report_matches_unsorted_dapodik(reco_inputs):
+    # Tabel diurutkan per NPSN_ID (argsort); frekuensi & skor harus tetap milik baris Dapodik yang benar
+    _, df_dapodik, df_sekolah, table = reco_inputs
+    assert not np.array_equal(table.order, np.arange(len(df_dapodik)))
+    report = table.report(LINK_THRESHOLD)
+    expected = format_recommendation_report(
+        recommendation_details(df_dapodik, df_sekolah),
+        table.participant_index.frequency_of(table.name_linker.person_ids(LINK_THRESHOLD)),
+        table.name_linker.confidence(LINK_THRESHOLD),
+    )
+    assert len(report) == len(df_dapodik)
+
+    def canonical(frame):
+        return frame.astype(str).sort_values(list(frame.columns)).reset_index(drop=True)
+    pd.testing.assert_frame_equal(canonical(report), canonical(expected))
+    assert report['Frekuensi Ikut'].is_monotonic_increasing